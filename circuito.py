@@ -0,0 +1,106 @@
+# circuito.py
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, Optional, Tuple
+
+# Circuit breaker por empresa (em cada worker). Quando a maioria das consultas recentes a um
+# agente falha por timeout/offline, o circuito abre: novas consultas falham na hora e os cards
+# do dashboard mostram o último resultado bom (marcado como desatualizado). Passada a espera,
+# uma única consulta de teste (meio aberto) decide se o circuito fecha ou volta a abrir.
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio_aberto"
+
+class CircuitBreaker:
+    def __init__(self, janela_segundos: float = 30, minimo_amostras: int = 5, taxa_falhas: float = 0.5,
+                 espera_inicial: float = 10, espera_maxima: float = 120):
+        self.janela_segundos = janela_segundos
+        self.minimo_amostras = minimo_amostras
+        self.taxa_falhas = taxa_falhas
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self.estado = FECHADO
+        self.espera = espera_inicial
+        self.aberto_ate = 0.0
+        self.sonda_em_andamento = False
+        self.resultados: Deque[Tuple[float, bool]] = deque()
+
+    def permitir(self) -> bool:
+        """Diz se uma consulta pode seguir para o agente agora (no meio aberto, só a primeira)."""
+        if self.estado == FECHADO:
+            return True
+        if self.estado == ABERTO:
+            if time.monotonic() < self.aberto_ate:
+                return False
+            self.estado = MEIO_ABERTO
+        if self.sonda_em_andamento:
+            return False
+        self.sonda_em_andamento = True
+        return True
+
+    def registrar(self, sucesso: bool):
+        agora = time.monotonic()
+        if self.estado == MEIO_ABERTO:
+            self.sonda_em_andamento = False
+            if sucesso:
+                self.estado = FECHADO
+                self.espera = self.espera_inicial
+                self.resultados.clear()
+            else:
+                # Continua instável: espera o dobro antes da próxima tentativa
+                self.espera = min(self.espera * 2, self.espera_maxima)
+                self._abrir(agora)
+            return
+
+        self.resultados.append((agora, sucesso))
+        while self.resultados and self.resultados[0][0] < agora - self.janela_segundos:
+            self.resultados.popleft()
+        falhas = sum(1 for _momento, ok in self.resultados if not ok)
+        if len(self.resultados) >= self.minimo_amostras and falhas / len(self.resultados) >= self.taxa_falhas:
+            self._abrir(agora)
+
+    def liberar_sonda(self):
+        """A consulta de teste foi abandonada (cliente desconectou) sem dizer nada sobre o agente."""
+        self.sonda_em_andamento = False
+
+    def segundos_para_tentar(self) -> float:
+        return max(0.0, self.aberto_ate - time.monotonic())
+
+    def _abrir(self, agora: float):
+        self.estado = ABERTO
+        self.aberto_ate = agora + self.espera
+        self.resultados.clear()
+
+# Marca de resposta desatualizada da requisição em andamento. O middleware cria o estado
+# (um dict) antes de chamar a aplicação; quem serve dado antigo marca o dict e o middleware
+# acrescenta o cabeçalho 'X-Dados-Desatualizados' na resposta.
+_estado_resposta: ContextVar[Optional[dict]] = ContextVar("_estado_resposta", default=None)
+
+def marcar_resposta_desatualizada():
+    estado = _estado_resposta.get()
+    if estado is not None:
+        estado["desatualizada"] = True
+
+class MarcarRespostaDesatualizada:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        estado: dict = {}
+        token = _estado_resposta.set(estado)
+
+        async def send_com_marca(message):
+            if message["type"] == "http.response.start" and estado.get("desatualizada"):
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-dados-desatualizados", b"1")]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_com_marca)
+        finally:
+            _estado_resposta.reset(token)
\ No newline at end of file
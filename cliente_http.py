@@ -0,0 +1,167 @@
+# cliente_http.py
+import asyncio
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from metricas import Contador, Histograma
+
+# Cliente HTTP assíncrono compartilhado (pool de conexões com keep-alive) para as chamadas a
+# serviços externos, como a API do Gemini. É criado no lifespan; as chamadas têm um prazo total
+# e são repetidas com backoff exponencial (e jitter) em 429, 5xx e falhas de conexão.
+# O timeout do httpx vale por operação (conectar, cada leitura): uma resposta que chega aos
+# poucos nunca o estoura. Por isso cada espera também é limitada ao que resta do prazo total.
+
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "20"))
+# Ao menos uma tentativa: com 0 o laço de post_json não rodaria e a chamada devolveria None
+HTTP_MAX_TENTATIVAS = max(1, int(os.environ.get("HTTP_MAX_TENTATIVAS", "4")))
+BACKOFF_BASE_SEGUNDOS = 0.5
+BACKOFF_MAXIMO_SEGUNDOS = 8.0
+STATUS_RETENTAVEIS = {429, 500, 502, 503, 504}
+
+_cliente: Optional[httpx.AsyncClient] = None
+
+HTTP_EXTERNO_DURACAO = Histograma(
+    "http_externo_segundos", "Duração das chamadas a serviços externos, com as retentativas.", ("servico", "resultado")
+)
+HTTP_EXTERNO_RETENTATIVAS = Contador("http_externo_retentativas", "Chamadas a serviços externos repetidas.", ("servico", "motivo"))
+
+class PrazoEsgotado(Exception):
+    """O prazo total da chamada acabou (incluindo as esperas entre as tentativas)."""
+
+def iniciar():
+    global _cliente
+    if _cliente is None:
+        _cliente = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+            headers={"Content-Type": "application/json"},
+        )
+
+async def encerrar():
+    global _cliente
+    if _cliente is not None:
+        await _cliente.aclose()
+        _cliente = None
+
+def cliente() -> httpx.AsyncClient:
+    # Fora do lifespan (ex.: scripts) o cliente é criado no primeiro uso
+    if _cliente is None:
+        iniciar()
+    return _cliente
+
+def _espera_retentativa(tentativa: int, resposta: Optional[httpx.Response]) -> float:
+    retry_after = resposta.headers.get("Retry-After") if resposta is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    # Backoff exponencial com "full jitter"
+    return random.uniform(0, min(BACKOFF_MAXIMO_SEGUNDOS, BACKOFF_BASE_SEGUNDOS * 2 ** tentativa))
+
+async def _aguardar_retentativa(servico: str, tentativa: int, motivo: str, resposta: Optional[httpx.Response], limite: float) -> bool:
+    """Espera o backoff e devolve True se ainda cabe uma nova tentativa dentro do prazo."""
+    espera = _espera_retentativa(tentativa, resposta)
+    if tentativa == HTTP_MAX_TENTATIVAS - 1 or time.monotonic() + espera >= limite:
+        return False
+    HTTP_EXTERNO_RETENTATIVAS.inc(servico=servico, motivo=motivo)
+    print(f"AVISO: '{servico}' respondeu {motivo}; nova tentativa em {espera:.1f}s ({tentativa + 2}/{HTTP_MAX_TENTATIVAS}).")
+    await asyncio.sleep(espera)
+    return True
+
+async def post_json(servico: str, url: str, payload: Dict[str, Any], prazo_segundos: float) -> httpx.Response:
+    """
+    POST com retentativas dentro do prazo. Devolve a última resposta (que pode ser um erro não
+    retentável, como 400) ou levanta PrazoEsgotado / httpx.TransportError.
+    """
+    inicio = time.monotonic()
+    limite = inicio + prazo_segundos
+    resultado = "erro"
+    try:
+        for tentativa in range(HTTP_MAX_TENTATIVAS):
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                raise PrazoEsgotado(f"Prazo de {prazo_segundos:.0f}s esgotado após {tentativa} tentativa(s).")
+            resposta = erro = None
+            try:
+                resposta = await asyncio.wait_for(cliente().post(url, json=payload, timeout=restante), restante)
+                if resposta.status_code not in STATUS_RETENTAVEIS:
+                    resultado = str(resposta.status_code)
+                    return resposta
+                motivo = str(resposta.status_code)
+            except (httpx.TimeoutException, asyncio.TimeoutError):
+                raise PrazoEsgotado(f"Prazo de {prazo_segundos:.0f}s esgotado aguardando a resposta.")
+            except httpx.TransportError as e:
+                erro = e
+                motivo = type(e).__name__
+
+            if not await _aguardar_retentativa(servico, tentativa, motivo, resposta, limite):
+                # Sem nova tentativa: devolve o último erro (429/5xx) para quem chamou tratar
+                resultado = motivo
+                if erro is not None:
+                    raise erro
+                return resposta
+    except PrazoEsgotado:
+        resultado = "prazo"
+        raise
+    finally:
+        HTTP_EXTERNO_DURACAO.observe(time.monotonic() - inicio, servico=servico, resultado=resultado)
+
+async def post_json_linhas(servico: str, url: str, payload: Dict[str, Any], prazo_segundos: float) -> AsyncIterator[str]:
+    """
+    POST com resposta em streaming (ex.: SSE): devolve as linhas do corpo conforme chegam.
+    As retentativas só acontecem antes de a resposta começar; depois disso qualquer falha vai
+    para quem está lendo. Respostas de erro levantam httpx.HTTPStatusError (com o corpo lido).
+    """
+    inicio = time.monotonic()
+    limite = inicio + prazo_segundos
+    resultado = "erro"
+    try:
+        for tentativa in range(HTTP_MAX_TENTATIVAS):
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                raise PrazoEsgotado(f"Prazo de {prazo_segundos:.0f}s esgotado após {tentativa} tentativa(s).")
+            resposta = erro = None
+            transmitindo = False
+            try:
+                pedido = cliente().build_request("POST", url, json=payload, timeout=restante)
+                resposta = await asyncio.wait_for(cliente().send(pedido, stream=True), restante)
+                try:
+                    if resposta.status_code in STATUS_RETENTAVEIS:
+                        await asyncio.wait_for(resposta.aread(), limite - time.monotonic())
+                        motivo = str(resposta.status_code)
+                    else:
+                        transmitindo = True
+                        resultado = str(resposta.status_code)
+                        if resposta.is_error:
+                            await asyncio.wait_for(resposta.aread(), limite - time.monotonic())
+                            resposta.raise_for_status()
+                        linhas = resposta.aiter_lines()
+                        while True:
+                            try:
+                                linha = await asyncio.wait_for(linhas.__anext__(), limite - time.monotonic())
+                            except asyncio.TimeoutError:
+                                raise PrazoEsgotado(f"Prazo de {prazo_segundos:.0f}s esgotado durante a resposta.")
+                            except StopAsyncIteration:
+                                return
+                            yield linha
+                finally:
+                    await resposta.aclose()
+            except (httpx.TimeoutException, asyncio.TimeoutError):
+                raise PrazoEsgotado(f"Prazo de {prazo_segundos:.0f}s esgotado aguardando a resposta.")
+            except httpx.TransportError as e:
+                if transmitindo:
+                    raise
+                erro = e
+                motivo = type(e).__name__
+
+            if not await _aguardar_retentativa(servico, tentativa, motivo, resposta, limite):
+                resultado = motivo
+                if erro is not None:
+                    raise erro
+                resposta.raise_for_status()
+    except PrazoEsgotado:
+        resultado = "prazo"
+        raise
+    finally:
+        HTTP_EXTERNO_DURACAO.observe(time.monotonic() - inicio, servico=servico, resultado=resultado)
\ No newline at end of file
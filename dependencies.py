@@ -2,29 +2,132 @@
 from fastapi import HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import firebase_admin
-from firebase_admin import auth, db
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import os
+import time
+
+import espelho_firebase
+import firebase_async
+from metricas import Contador
+from prioridades import usuario_atual
+from main_api import check_rate_limit, invalidation_handlers, publish_invalidation, pending_rate_limit, rate_limit_exceeded
 
 security = HTTPBearer()
 
+# --- CACHE DE AUTENTICAÇÃO (por worker) ---
+# Uma página do dashboard dispara 4-5 requisições em paralelo e cada uma verificava o token e lia
+# o perfil do usuário no Realtime Database até três vezes. O token verificado fica em cache até
+# expirar ('exp' do Firebase) e o perfil por PROFILE_CACHE_TTL_SECONDS; as alterações feitas no
+# painel de administração descartam o perfil em todos os workers (invalidar_perfil).
+# Com o espelho do Firebase carregado (espelho_firebase), o perfil vem direto da memória.
+PROFILE_CACHE_TTL_SECONDS = int(os.environ.get("PROFILE_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = 10_000
+
+# sha256 do token -> claims decodificadas
+_tokens_verificados: Dict[str, Dict[str, Any]] = {}
+# uid -> (instante de expiração (monotonic), perfil)
+_perfis: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+# Leituras em andamento: as requisições paralelas de uma página esperam a mesma chamada ao Firebase
+_em_andamento: Dict[str, asyncio.Future] = {}
+
+AUTH_CACHE = Contador("autenticacao_cache", "Consultas aos caches de token e de perfil do usuário.", ("cache", "resultado"))
+
+def _limitar_tamanho(cache: Dict[str, Any]):
+    # Dicts mantêm a ordem de inserção: descarta as entradas mais antigas
+    while len(cache) > AUTH_CACHE_MAX_ENTRIES:
+        cache.pop(next(iter(cache)))
+
+async def _compartilhar(chave: str, leitura: Callable[[], Awaitable[Any]]) -> Any:
+    futuro = _em_andamento.get(chave)
+    if futuro is None:
+        futuro = _em_andamento[chave] = asyncio.ensure_future(leitura())
+        futuro.add_done_callback(lambda _f: _em_andamento.pop(chave, None))
+    # shield: se uma das requisições for cancelada, a leitura continua para as outras
+    return await asyncio.shield(futuro)
+
+async def verificar_token(id_token: str) -> Dict[str, Any]:
+    chave = hashlib.sha256(id_token.encode()).hexdigest()
+    claims = _tokens_verificados.get(chave)
+    if claims is not None and claims.get("exp", 0) > time.time():
+        AUTH_CACHE.inc(cache="token", resultado="acerto")
+        return claims
+    AUTH_CACHE.inc(cache="token", resultado="falta")
+    _tokens_verificados.pop(chave, None)
+    claims = await _compartilhar(f"token:{chave}", lambda: firebase_async.verificar_id_token(id_token))
+    _tokens_verificados[chave] = claims
+    _limitar_tamanho(_tokens_verificados)
+    return claims
+
+async def obter_perfil(uid: str) -> Optional[Dict[str, Any]]:
+    """Perfil do usuário ('usuarios/{uid}': empresas, papéis, idEmpresaDb, superadmin). Somente leitura."""
+    if espelho_firebase.usuarios.disponivel():
+        AUTH_CACHE.inc(cache="perfil", resultado="espelho")
+        return espelho_firebase.usuarios.obter(uid)
+    entrada = _perfis.get(uid)
+    if entrada is not None and entrada[0] > time.monotonic():
+        AUTH_CACHE.inc(cache="perfil", resultado="acerto")
+        return entrada[1]
+    AUTH_CACHE.inc(cache="perfil", resultado="falta")
+    perfil = await _compartilhar(f"perfil:{uid}", lambda: firebase_async.ler(f'usuarios/{uid}'))
+    if perfil:
+        _perfis[uid] = (time.monotonic() + PROFILE_CACHE_TTL_SECONDS, perfil)
+        _limitar_tamanho(_perfis)
+    else:
+        # Usuário recém-criado não pode ficar preso num "não encontrado"
+        _perfis.pop(uid, None)
+    return perfil
+
+def _descartar_perfil(uid: Optional[str]):
+    if uid is None:
+        _perfis.clear()
+    else:
+        _perfis.pop(uid, None)
+
+invalidation_handlers["perfil"] = _descartar_perfil
+
+async def invalidar_perfil(uid: str):
+    """Chamado depois de alterar 'usuarios/{uid}' para que nenhum worker use o perfil antigo."""
+    await publish_invalidation("perfil", uid)
+
+class ContextoUsuario:
+    """Usuário autenticado da requisição: resolvido uma vez e compartilhado pelas dependências."""
+    def __init__(self, uid: str, claims: Dict[str, Any], perfil: Optional[Dict[str, Any]]):
+        self.uid = uid
+        self.claims = claims
+        self.perfil = perfil
+
+async def resolver_usuario(token: HTTPAuthorizationCredentials = Depends(security)) -> ContextoUsuario:
+    # O FastAPI guarda o resultado de uma dependência durante a requisição: verificar_empresa,
+    # get_company_fk e verificar_admin_realtime_db recebem o mesmo contexto.
+    try:
+        claims = await verificar_token(token.credentials)
+        return ContextoUsuario(claims['uid'], claims, await obter_perfil(claims['uid']))
+    except firebase_admin.auth.InvalidIdTokenError:
+        raise HTTPException(status_code=401, detail="Token de autenticação inválido ou expirado.")
+    except Exception as e:
+        if isinstance(e, HTTPException): raise e
+        raise HTTPException(status_code=500, detail=f"Erro interno na verificação do token: {str(e)}")
+
 class EmpresaInfo:
-    def __init__(self, uid: str, company_id: str):
+    def __init__(self, uid: str, company_id: str, perfil: Optional[Dict[str, Any]] = None):
         self.uid = uid
         self.company_id = company_id # company_id aqui é o CNPJ
+        self.perfil = perfil or {}
 
 async def verificar_token_simples(token: HTTPAuthorizationCredentials = Depends(security)):
     try:
-        decoded_token = auth.verify_id_token(token.credentials)
-        return decoded_token['uid']
+        return (await verificar_token(token.credentials))['uid']
     except firebase_admin.auth.InvalidIdTokenError:
         raise HTTPException(status_code=401, detail="Token de autenticação inválido ou expirado.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro interno na verificação do token: {str(e)}")
 
-async def verificar_empresa(request: Request, token: HTTPAuthorizationCredentials = Depends(security)):
+async def verificar_empresa(request: Request, contexto: ContextoUsuario = Depends(resolver_usuario)):
     try:
-        decoded_token = auth.verify_id_token(token.credentials)
-        uid = decoded_token['uid']
-        user_ref = db.reference(f'usuarios/{uid}').get()
+        uid = contexto.uid
+        user_ref = contexto.perfil
         if not user_ref:
             raise HTTPException(status_code=403, detail="Usuário não encontrado na base de dados.")
 
@@ -63,14 +166,30 @@ async def verificar_empresa(request: Request, token: HTTPAuthorizationCredential
         if not target_company_cnpj:
             raise HTTPException(status_code=400, detail="Não foi possível determinar a empresa alvo.")
         
-        return EmpresaInfo(uid=uid, company_id=target_company_cnpj)
+        usuario_atual.set(uid)
+        return EmpresaInfo(uid=uid, company_id=target_company_cnpj, perfil=user_ref)
 
-    except firebase_admin.auth.InvalidIdTokenError:
-        raise HTTPException(status_code=401, detail="Token de autenticação inválido ou expirado.")
     except Exception as e:
         if isinstance(e, HTTPException): raise e
         raise HTTPException(status_code=500, detail=f"Erro interno no servidor durante a verificação: {str(e)}")
 
+def limitar_requisicoes(categoria: str = "agente", custo: int = 1):
+    """
+    Dependência de limite de taxa (token bucket por empresa e por usuário, no Redis).
+    'custo' é o número de fichas da requisição, ex.: uma tela que dispara 12 consultas.
+    Sem fichas a resposta é 429 com Retry-After, em vez de a requisição esperar o timeout.
+    Na categoria 'agente' a cobrança só acontece quando um comando vai ao agente (ver
+    charge_pending_rate_limit); o custo da rota substitui o do router, em vez de somar.
+    """
+    async def verificar_limite(empresa: EmpresaInfo = Depends(verificar_empresa)):
+        if categoria == "agente":
+            pending_rate_limit.set({"categoria": categoria, "empresa": empresa.company_id, "uid": empresa.uid, "custo": custo})
+            return
+        retry_after_ms = await check_rate_limit(categoria, empresa.company_id, empresa.uid, custo)
+        if retry_after_ms:
+            raise rate_limit_exceeded(retry_after_ms)
+    return verificar_limite
+
 async def get_company_fk(empresa: EmpresaInfo = Depends(verificar_empresa)) -> str: # Alterado para -> str
     """
     *** FUNÇÃO CORRIGIDA ***
@@ -78,8 +197,7 @@ async def get_company_fk(empresa: EmpresaInfo = Depends(verificar_empresa)) -> s
     armazenados no Firebase Realtime Database.
     """
     try:
-        user_ref = db.reference(f'usuarios/{empresa.uid}').get()
-        user_empresas = user_ref.get('empresas', {})
+        user_empresas = empresa.perfil.get('empresas', {})
 
         for cnpj_key, detalhes in user_empresas.items():
             if ''.join(filter(str.isdigit, cnpj_key)) == empresa.company_id:
@@ -102,7 +220,7 @@ async def verificar_admin_realtime_db(decoded_token: EmpresaInfo = Depends(verif
         raise HTTPException(status_code=400, detail="UID não encontrado no token.")
 
     try:
-        user_ref = db.reference(f'usuarios/{uid}').get()
+        user_ref = decoded_token.perfil
         if user_ref.get('superadmin', False):
             return decoded_token
 
@@ -120,6 +238,16 @@ async def verificar_admin_realtime_db(decoded_token: EmpresaInfo = Depends(verif
 
         return decoded_token
 
+    except Exception as e:
+        if isinstance(e, HTTPException): raise e
+        raise HTTPException(status_code=500, detail=f"Erro interno ao verificar permissões: {e}")
+
+async def verificar_superadmin(uid: str = Depends(verificar_token_simples)):
+    try:
+        user_ref = await obter_perfil(uid)
+        if not user_ref or not user_ref.get('superadmin', False):
+            raise HTTPException(status_code=403, detail="Acesso negado. Esta área é restrita ao suporte.")
+        return uid
     except Exception as e:
         if isinstance(e, HTTPException): raise e
         raise HTTPException(status_code=500, detail=f"Erro interno ao verificar permissões: {e}")
\ No newline at end of file
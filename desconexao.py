@@ -0,0 +1,50 @@
+# desconexao.py
+import asyncio
+
+# Só leituras são canceladas: um POST/PUT/DELETE interrompido no meio pode deixar a gravação
+# pela metade (ex.: usuário criado no Auth sem o perfil em 'usuarios/{uid}').
+METODOS_CANCELAVEIS = {"GET", "HEAD"}
+
+class CancelarAoDesconectar:
+    """
+    Middleware ASGI que cancela o handler HTTP de leitura (GET/HEAD) quando o cliente desconecta
+    antes da resposta. O cancelamento chega até send_command_to_agent, que então manda 'cancelar'
+    ao agente em vez de deixar a consulta rodando no computador da loja para ninguém.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") not in METODOS_CANCELAVEIS:
+            await self.app(scope, receive, send)
+            return
+
+        # As mensagens do cliente (corpo e desconexão) passam por esta fila: o handler continua
+        # recebendo tudo normalmente, enquanto o observador percebe a desconexão na hora.
+        messages: asyncio.Queue = asyncio.Queue()
+        disconnected = False
+
+        async def watch_disconnect():
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    if not app_task.done():
+                        disconnected = True
+                        app_task.cancel()
+                    return
+
+        app_task = asyncio.create_task(self.app(scope, messages.get, send))
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            if not disconnected:
+                raise
+            print(f"INFO: Cliente desconectou durante '{scope.get('path')}'; requisição cancelada.")
+        finally:
+            watcher.cancel()
+            if not app_task.done():
+                app_task.cancel()
\ No newline at end of file
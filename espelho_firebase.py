@@ -0,0 +1,213 @@
+# espelho_firebase.py
+import asyncio
+import copy
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from firebase_admin import db
+
+import firebase_async
+
+# Espelho em memória (por worker) dos nós /empresas e /usuarios do Realtime Database, mantido
+# atualizado pelos listeners de streaming do Firebase (Reference.listen, em uma thread do SDK).
+# A primeira mensagem do listener traz o nó inteiro; as seguintes trazem só o que mudou.
+# Enquanto o espelho não recebeu a primeira carga (ou depois que o listener caiu), as funções
+# de leitura consultam o Firebase diretamente.
+#
+# As entradas de primeiro nível (uma empresa, um usuário) nunca são alteradas no lugar: cada
+# evento monta uma cópia nova da entrada, então quem leu um perfil pode percorrê-lo à vontade.
+
+ESPELHO_ATIVO = os.environ.get("FIREBASE_MIRROR", "1") != "0"
+INTERVALO_VERIFICACAO_SEGUNDOS = 30
+
+def normalizar_cnpj(cnpj: Any) -> str:
+    return ''.join(filter(str.isdigit, str(cnpj)))
+
+class EspelhoArvore:
+    def __init__(self, caminho: str, chave_indice: Optional[Callable[[str], str]] = None):
+        self.caminho = caminho
+        self.chave_indice = chave_indice
+        self.pronto = False
+        self.versao = 0
+        self._dados: Dict[str, Any] = {}
+        # chave normalizada (ex.: CNPJ só com dígitos) -> chave como está no Firebase
+        self._indice: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._registro = None
+        self._falhou = False
+
+    # --- LISTENER ---
+
+    def iniciar(self):
+        self.pronto = False
+        self._falhou = False
+        self._registro = db.reference(self.caminho).listen(self._aplicar_evento)
+        print(f"INFO: Espelho de '{self.caminho}' iniciado; aguardando a carga inicial...")
+
+    def parar(self):
+        if self._registro is not None:
+            self._registro.close()
+            self._registro = None
+        self.pronto = False
+
+    def ativo(self) -> bool:
+        # O SDK não expõe o estado do listener: se a thread dele terminou, a conexão caiu.
+        # '_thread' é um atributo privado de ListenerRegistration no firebase-admin fixado em
+        # requirements.txt (6.5.0); confira se ele ainda existe antes de atualizar o SDK.
+        # Sem ele, só as falhas ao aplicar eventos (_falhou) são detectadas.
+        thread = getattr(self._registro, "_thread", None)
+        return self._registro is not None and not self._falhou and (thread is None or thread.is_alive())
+
+    def disponivel(self) -> bool:
+        """True se as leituras podem vir da memória: carga inicial feita e listener vivo."""
+        if self.pronto and not self.ativo():
+            # Listener caiu entre duas verificações de vigiar(): para de servir dados parados já
+            print(f"AVISO: Listener do Firebase em '{self.caminho}' parou; leituras vão direto ao Firebase até a recarga.")
+            self.pronto = False
+        return self.pronto
+
+    def _aplicar_evento(self, evento):
+        try:
+            partes = [parte for parte in (evento.path or "/").split("/") if parte]
+            with self._lock:
+                if not partes:
+                    if evento.event_type == "put":
+                        self._substituir_tudo(evento.data)
+                    else:
+                        for chave, valor in (evento.data or {}).items():
+                            self._alterar_entrada(chave, [], valor, "put")
+                    self.pronto = True
+                else:
+                    self._alterar_entrada(partes[0], partes[1:], evento.data, evento.event_type)
+                self.versao += 1
+        except Exception as e:
+            # Não dá para fechar o listener de dentro da thread dele: vigiar() o reinicia
+            print(f"ERRO CRÍTICO ao aplicar evento do Firebase em '{self.caminho}' ({evento.path}): {e}. O espelho será recarregado.")
+            self.pronto = False
+            self._falhou = True
+
+    def _substituir_tudo(self, dados: Optional[Dict[str, Any]]):
+        self._dados = dict(dados or {})
+        self._indice = {self.chave_indice(chave): chave for chave in self._dados} if self.chave_indice else {}
+        print(f"INFO: Espelho de '{self.caminho}' carregado ({len(self._dados)} registros).")
+
+    def _alterar_entrada(self, chave: str, caminho: List[str], valor: Any, tipo_evento: str):
+        if caminho:
+            entrada = copy.deepcopy(self._dados.get(chave))
+            if not isinstance(entrada, dict):
+                entrada = {}
+            no = entrada
+            for parte in caminho[:-1]:
+                if not isinstance(no.get(parte), dict):
+                    no[parte] = {}
+                no = no[parte]
+            _gravar(no, caminho[-1], valor, tipo_evento)
+        else:
+            entrada = copy.deepcopy(self._dados.get(chave)) if tipo_evento == "patch" else None
+            if tipo_evento == "patch" and isinstance(entrada, dict) and isinstance(valor, dict):
+                for subchave, subvalor in valor.items():
+                    _gravar(entrada, subchave, subvalor, "put")
+            else:
+                entrada = valor
+
+        # O Firebase não guarda nós vazios: entrada vazia é entrada apagada
+        if entrada in (None, {}):
+            self._dados.pop(chave, None)
+            if self.chave_indice:
+                self._indice.pop(self.chave_indice(chave), None)
+        else:
+            self._dados[chave] = entrada
+            if self.chave_indice:
+                self._indice[self.chave_indice(chave)] = chave
+
+    # --- LEITURA ---
+
+    def obter(self, chave: str) -> Any:
+        return self._dados.get(chave)
+
+    def obter_por_indice(self, chave_normalizada: str) -> Optional[Tuple[str, Any]]:
+        with self._lock:
+            chave = self._indice.get(chave_normalizada)
+            return (chave, self._dados.get(chave)) if chave is not None else None
+
+    def itens(self) -> List[Tuple[str, Any]]:
+        with self._lock:
+            return list(self._dados.items())
+
+def _gravar(no: Dict[str, Any], chave: str, valor: Any, tipo_evento: str):
+    if valor is None:
+        no.pop(chave, None)
+    elif tipo_evento == "patch" and isinstance(valor, dict) and isinstance(no.get(chave), dict):
+        for subchave, subvalor in valor.items():
+            _gravar(no[chave], subchave, subvalor, "put")
+    else:
+        no[chave] = valor
+
+empresas = EspelhoArvore("/empresas", chave_indice=normalizar_cnpj)
+usuarios = EspelhoArvore("/usuarios")
+
+# Lista de empresas ordenada pelo nome, refeita só quando o espelho muda
+_empresas_ordenadas: Tuple[int, List[Tuple[str, str]]] = (-1, [])
+
+# --- CICLO DE VIDA (chamado no lifespan) ---
+
+def iniciar():
+    if not ESPELHO_ATIVO:
+        print("INFO: Espelho do Firebase desativado (FIREBASE_MIRROR=0); as leituras vão direto ao Firebase.")
+        return
+    for espelho in (empresas, usuarios):
+        espelho.iniciar()
+
+def parar():
+    for espelho in (empresas, usuarios):
+        espelho.parar()
+
+async def vigiar():
+    """Tarefa de fundo que reinicia os listeners que caíram (até lá, as leituras vão ao Firebase)."""
+    if not ESPELHO_ATIVO:
+        return
+    while True:
+        await asyncio.sleep(INTERVALO_VERIFICACAO_SEGUNDOS)
+        for espelho in (empresas, usuarios):
+            if not espelho.ativo():
+                print(f"AVISO: Listener do Firebase em '{espelho.caminho}' parou. Reiniciando...")
+                try:
+                    await asyncio.to_thread(espelho.parar)
+                    await asyncio.to_thread(espelho.iniciar)
+                except Exception as e:
+                    print(f"AVISO: Não foi possível reiniciar o espelho de '{espelho.caminho}': {e}")
+
+# --- CONSULTAS (com leitura direta enquanto o espelho não está pronto) ---
+
+async def obter_usuario(uid: str) -> Optional[Dict[str, Any]]:
+    """Perfil em 'usuarios/{uid}'. Somente leitura."""
+    if usuarios.disponivel():
+        return usuarios.obter(uid)
+    return await firebase_async.ler(f'usuarios/{uid}')
+
+async def obter_empresa(cnpj: str) -> Optional[Tuple[str, Any]]:
+    """(chave original, dados) da empresa em '/empresas', procurada pelo CNPJ só com dígitos."""
+    cnpj_limpo = normalizar_cnpj(cnpj)
+    if empresas.disponivel():
+        return empresas.obter_por_indice(cnpj_limpo)
+    for cnpj_bruto, detalhes in (await firebase_async.ler('/empresas') or {}).items():
+        if normalizar_cnpj(cnpj_bruto) == cnpj_limpo:
+            return cnpj_bruto, detalhes
+    return None
+
+def nome_fantasia(cnpj_bruto: str, detalhes: Any) -> str:
+    return detalhes.get("nomeFantasia", cnpj_bruto).strip() if isinstance(detalhes, dict) else cnpj_bruto
+
+async def listar_empresas() -> List[Tuple[str, str]]:
+    """[(CNPJ como cadastrado, nome fantasia)] em ordem alfabética."""
+    global _empresas_ordenadas
+    if not empresas.disponivel():
+        todas = (await firebase_async.ler('/empresas') or {}).items()
+        return sorted(((cnpj, nome_fantasia(cnpj, detalhes)) for cnpj, detalhes in todas), key=lambda item: item[1])
+    versao, lista = _empresas_ordenadas
+    if versao != empresas.versao:
+        versao = empresas.versao
+        lista = sorted(((cnpj, nome_fantasia(cnpj, detalhes)) for cnpj, detalhes in empresas.itens()), key=lambda item: item[1])
+        _empresas_ordenadas = (versao, lista)
+    return lista
\ No newline at end of file
@@ -0,0 +1,91 @@
+# firebase_async.py
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from firebase_admin import auth, db
+
+from metricas import Histograma, Medidor
+from rastreamento import span
+
+# Fachada assíncrona das chamadas ao Firebase Admin SDK usadas pela API. O SDK é síncrono: cada
+# chamada direta num 'async def' parava o event loop (inclusive o loop que recebe as respostas
+# dos agentes) por uma ida e volta de rede. Aqui as chamadas rodam num pool de threads próprio e
+# limitado, separado do pool padrão do asyncio, com métricas de fila e de duração.
+
+FIREBASE_MAX_THREADS = int(os.environ.get("FIREBASE_MAX_THREADS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=FIREBASE_MAX_THREADS, thread_name_prefix="firebase")
+_lock = threading.Lock()
+_contagem = {"fila": 0, "execucao": 0}
+
+FIREBASE_DURACAO = Histograma(
+    "firebase_chamada_segundos", "Duração das chamadas ao Firebase (sem a espera no pool).", ("operacao", "resultado")
+)
+FIREBASE_ESPERA = Histograma("firebase_espera_segundos", "Espera por uma thread livre no pool do Firebase.", ("operacao",))
+Medidor("firebase_chamadas_na_fila", "Chamadas ao Firebase aguardando uma thread do pool.", funcao=lambda: _contagem["fila"])
+Medidor("firebase_chamadas_em_execucao", "Chamadas ao Firebase em andamento.", funcao=lambda: _contagem["execucao"])
+
+def _ajustar(chave: str, delta: int):
+    with _lock:
+        _contagem[chave] += delta
+
+async def executar(operacao: str, funcao: Callable[..., Any], *args, **kwargs) -> Any:
+    """Roda 'funcao' (bloqueante) no pool do Firebase e aguarda sem parar o event loop."""
+    enfileirado_em = time.perf_counter()
+    _ajustar("fila", 1)
+
+    def tarefa():
+        _ajustar("fila", -1)
+        _ajustar("execucao", 1)
+        inicio = time.perf_counter()
+        FIREBASE_ESPERA.observe(inicio - enfileirado_em, operacao=operacao)
+        resultado = "erro"
+        try:
+            retorno = funcao(*args, **kwargs)
+            resultado = "ok"
+            return retorno
+        finally:
+            FIREBASE_DURACAO.observe(time.perf_counter() - inicio, operacao=operacao, resultado=resultado)
+            _ajustar("execucao", -1)
+
+    with span(f"firebase.{operacao}"):
+        futuro = _executor.submit(tarefa)
+        try:
+            return await asyncio.wrap_future(futuro)
+        except asyncio.CancelledError:
+            # Ainda na fila: não chega a rodar. Já em execução: termina na thread e o resultado é descartado.
+            if futuro.cancel():
+                _ajustar("fila", -1)
+            raise
+
+def encerrar():
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+# --- AUTENTICAÇÃO ---
+
+async def verificar_id_token(id_token: str) -> Dict[str, Any]:
+    return await executar("verificar_token", auth.verify_id_token, id_token)
+
+async def criar_usuario(**dados) -> auth.UserRecord:
+    return await executar("criar_usuario", auth.create_user, **dados)
+
+async def atualizar_usuario(uid: str, **dados) -> auth.UserRecord:
+    return await executar("atualizar_usuario", auth.update_user, uid, **dados)
+
+async def apagar_usuario(uid: str):
+    await executar("apagar_usuario", auth.delete_user, uid)
+
+# --- REALTIME DATABASE ---
+
+async def ler(caminho: str) -> Any:
+    return await executar("ler", lambda: db.reference(caminho).get())
+
+async def gravar(caminho: str, valor: Any):
+    await executar("gravar", lambda: db.reference(caminho).set(valor))
+
+async def apagar(caminho: str):
+    await executar("apagar", lambda: db.reference(caminho).delete())
\ No newline at end of file
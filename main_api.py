@@ -1,5 +1,5 @@
 # main_api.py
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, JSONResponse
@@ -9,60 +9,1091 @@ import json
 import os
 import asyncio
 import uuid
+import time
+import hashlib
+import math
+from contextvars import ContextVar
 from datetime import date, datetime
+from collections import OrderedDict
 from contextlib import asynccontextmanager
 import redis.asyncio as redis # Importa a biblioteca do Redis
-from typing import Dict, Any
+from redis import exceptions as redis_errors # redis.asyncio não expõe o submódulo de exceções
+from typing import Dict, Any, List, Tuple, Optional, Callable, Awaitable, Union, AsyncIterator
+
+from statements import ADHOC_STATEMENTS_MAX, resolver_statement, obter_statement, normalizar_sql
+from resultados import FORMATOS_SUPORTADOS, decodificar_quadro, decodificar_dados, codificar_dados
+from desconexao import CancelarAoDesconectar
+from circuito import CircuitBreaker, MarcarRespostaDesatualizada, marcar_resposta_desatualizada
+from prioridades import PRIORIDADES, PRIORIDADE_PADRAO, prioridade_atual, usuario_atual, prioridade_do_cabecalho
+from metricas import Contador, Medidor, Histograma, MedirRequisicoes, coletar
+from rastreamento import RastrearRequisicoes, span, traceparent_atual, registrar_span
+import espelho_firebase
+import firebase_async
+import cliente_http
 
 # --- CONFIGURAÇÃO ---
 # Pega a URL do Redis a partir das variáveis de ambiente do Render
 REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost")
 
+# Limite de comandos simultâneos por empresa, para que um cliente não sobrecarregue o seu agente
+AGENT_MAX_CONCURRENCY = int(os.environ.get("AGENT_MAX_CONCURRENCY", "4"))
+
+# Cada worker do gunicorn tem o seu próprio canal de respostas no Redis. A rota de cada
+# tarefa ('rota:{id_tarefa}') diz para qual canal a resposta do agente deve ser publicada,
+# então qualquer worker pode aguardar uma tarefa cujo agente está conectado em outro worker.
+WORKER_ID = str(uuid.uuid4())
+REPLY_CHANNEL = f"respostas:{WORKER_ID}"
+ROUTE_TTL_SECONDS = 120
+
+# Canal comum a todos os workers para descartar dados mantidos em memória (ex.: o perfil de um
+# usuário alterado no painel de administração). Cada tipo de mensagem tem o seu tratador,
+# registrado em 'invalidation_handlers' pelo módulo dono do cache (chave None = descartar tudo).
+INVALIDATION_CHANNEL = "invalidacoes"
+invalidation_handlers: Dict[str, Callable[[Optional[str]], None]] = {}
+
+# Lê e apaga a rota de uma tarefa de forma atômica, para que a resposta seja entregue uma única vez.
+POP_ROUTE_SCRIPT = """
+local rotas = redis.call('LRANGE', KEYS[1], 0, -1)
+redis.call('DEL', KEYS[1])
+return rotas
+"""
+
+# Fila de comandos de cada empresa: um Redis Stream com um grupo de consumidores. Uma entrada só
+# sai da lista de pendentes (PEL) quando o agente responde; se o WebSocket cair antes disso,
+# ela é reenviada quando o agente reconectar.
+AGENT_STREAM_GROUP = "agentes"
+AGENT_STREAM_CONSUMER = "agente"
+AGENT_STREAM_MAXLEN = 10000
+
+# Prioridades: cada empresa tem um stream por faixa (ver prioridades.py). O dispatcher mantém no
+# máximo AGENT_DISPATCH_WINDOW comandos em execução no agente e, a cada vaga, entrega o comando da
+# faixa mais urgente. Para que as faixas de baixo não fiquem paradas enquanto houver trabalho
+# interativo, cada PRIORITY_AGING_SECONDS de espera sobe o comando uma faixa.
+AGENT_DISPATCH_WINDOW = int(os.environ.get("AGENT_DISPATCH_WINDOW", str(AGENT_MAX_CONCURRENCY)))
+PRIORITY_AGING_SECONDS = float(os.environ.get("PRIORITY_AGING_SECONDS", "5"))
+DISPATCH_BUFFER_MAX = int(os.environ.get("DISPATCH_BUFFER_MAX", "50"))
+
+# Dentro da mesma faixa, os usuários de uma empresa dividem o agente por fair queueing (SFQ):
+# cada comando recebe uma etiqueta de início no tempo virtual da empresa e o usuário avança
+# o seu relógio pelo custo do comando. Quem dispara muitas consultas passa a esperar a sua vez
+# em vez de ocupar todas as vagas. Consultas pesadas custam mais.
+FAIR_QUEUE_LANE_COSTS = (1.0, 1.0, 4.0)
+
+# Limites de taxa (token bucket no Redis) por empresa e por usuário, em duas categorias:
+# 'agente' (consultas ao computador da loja) e 'llm' (chamadas à IA). Cada par é
+# (capacidade do balde, fichas repostas por segundo).
+RATE_LIMITS = {
+    "agente": {
+        "empresa": (int(os.environ.get("RATE_AGENT_COMPANY_BURST", "120")), float(os.environ.get("RATE_AGENT_COMPANY_PER_SEC", "2"))),
+        "usuario": (int(os.environ.get("RATE_AGENT_USER_BURST", "60")), float(os.environ.get("RATE_AGENT_USER_PER_SEC", "1"))),
+    },
+    "llm": {
+        "empresa": (int(os.environ.get("RATE_LLM_COMPANY_BURST", "20")), float(os.environ.get("RATE_LLM_COMPANY_PER_SEC", "0.2"))),
+        "usuario": (int(os.environ.get("RATE_LLM_USER_BURST", "8")), float(os.environ.get("RATE_LLM_USER_PER_SEC", "0.05"))),
+    },
+}
+
+# Confere todos os baldes e só consome se houver fichas em todos; senão devolve a espera em ms.
+# ARGV: agora (ms), custo e, para cada balde, capacidade e reposição por segundo.
+TOKEN_BUCKET_SCRIPT = """
+local agora = tonumber(ARGV[1])
+local custo = tonumber(ARGV[2])
+local espera = 0
+local fichas = {}
+for i, chave in ipairs(KEYS) do
+    local capacidade = tonumber(ARGV[1 + i * 2])
+    local reposicao = tonumber(ARGV[2 + i * 2])
+    local estado = redis.call('HMGET', chave, 'fichas', 'ts')
+    local disponiveis = tonumber(estado[1]) or capacidade
+    local ts = tonumber(estado[2]) or agora
+    disponiveis = math.min(capacidade, disponiveis + math.max(0, agora - ts) / 1000 * reposicao)
+    if disponiveis < custo then
+        espera = math.max(espera, math.ceil((custo - disponiveis) / reposicao * 1000))
+    end
+    fichas[i] = disponiveis
+end
+if espera > 0 then
+    return espera
+end
+for i, chave in ipairs(KEYS) do
+    local capacidade = tonumber(ARGV[1 + i * 2])
+    local reposicao = tonumber(ARGV[2 + i * 2])
+    redis.call('HSET', chave, 'fichas', fichas[i] - custo, 'ts', agora)
+    redis.call('PEXPIRE', chave, math.ceil(capacidade / reposicao * 1000) + 1000)
+end
+return 0
+"""
+
+# Todo comando leva um prazo ('expira_em'). Passado o prazo ninguém mais espera pela resposta,
+# então o comando é descartado em vez de ser executado no agente. A fila também tem um limite de
+# profundidade: acima dele novos comandos são recusados na hora (503) em vez de esperar atrás
+# de trabalho que já foi abandonado.
+AGENT_TIMEOUT_SECONDS = float(os.environ.get("AGENT_TIMEOUT_SECONDS", "60"))
+AGENT_QUEUE_MAX_DEPTH = int(os.environ.get("AGENT_QUEUE_MAX_DEPTH", "200"))
+
+# Presença dos agentes: o worker que segura o WebSocket mantém 'agente:{cnpj}' vivo com um
+# heartbeat. Sem presença o comando falha em milissegundos em vez de esperar o timeout inteiro.
+AGENT_HEARTBEAT_SECONDS = 10
+AGENT_PRESENCE_TTL_SECONDS = 30
+ONLINE_AGENTS_KEY = "agentes:online"
+
+# Single-flight: consultas de leitura idênticas (empresa + ação + parâmetros) que chegam enquanto
+# outra igual ainda está em andamento compartilham a mesma ida ao agente. Dentro do worker isso é
+# feito com uma tarefa compartilhada; entre workers, com 'inflight:{cnpj}:{hash}' apontando para o
+# id_tarefa em andamento. Só pega carona quem ainda tem pelo menos este tempo de prazo pela frente.
+INFLIGHT_MIN_REMAINING_MS = int(AGENT_TIMEOUT_SECONDS * 1000 / 2)
+
+# Confere a presença do agente; se já existe uma tarefa idêntica em andamento, apenas acrescenta
+# o canal deste worker à rota dela e devolve o id_tarefa. Caso contrário, remove do início do stream
+# as entradas vencidas (o id da entrada é o horário de inserção em ms), verifica a profundidade e,
+# se houver espaço, registra a rota e enfileira o comando atomicamente.
+ENQUEUE_COMMAND_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 0 then
+    return -1
+end
+if ARGV[7] == '1' then
+    local em_andamento = redis.call('GET', KEYS[4])
+    if em_andamento and redis.call('PTTL', KEYS[4]) > tonumber(ARGV[8]) then
+        local rota = 'rota:' .. em_andamento
+        if redis.call('EXISTS', rota) == 1 then
+            redis.call('RPUSH', rota, ARGV[4])
+            return em_andamento
+        end
+    end
+end
+redis.call('XTRIM', KEYS[1], 'MINID', ARGV[1])
+if redis.call('XLEN', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('RPUSH', KEYS[2], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[6], '*', 'payload', ARGV[3], 'usuario', ARGV[11])
+if ARGV[7] == '1' then
+    redis.call('SET', KEYS[4], ARGV[9], 'PX', ARGV[10])
+end
+return 1
+"""
+
+# Só apaga a presença se ela ainda pertencer a este worker (o agente pode já ter reconectado em outro).
+CLEAR_PRESENCE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'worker') == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    redis.call('ZREM', KEYS[2], ARGV[2])
+end
+return 1
+"""
+
+# Cache de resultados (read-through) no Redis, por empresa + SQL normalizado + parâmetros.
+# O TTL é definido em cada chamada; 'tags' agrupam chaves para invalidação explícita.
+CACHE_TAG_TTL_SECONDS = 24 * 3600
+# Último resultado bom de cada consulta em cache ('ultimo_bom:{chave}'), servido como dado
+# desatualizado quando o agente está offline, em timeout ou com o circuito aberto.
+LAST_GOOD_TTL_SECONDS = int(os.environ.get("LAST_GOOD_TTL_SECONDS", str(24 * 3600)))
+# Falhas de infraestrutura (não erros de SQL) que contam para o circuit breaker e permitem dado antigo
+AGENT_UNAVAILABLE_STATUS = (408, 503)
+
+INVALIDATE_TAG_SCRIPT = """
+local chaves = redis.call('SMEMBERS', KEYS[1])
+for _, chave in ipairs(chaves) do
+    redis.call('DEL', chave)
+end
+redis.call('DEL', KEYS[1])
+return #chaves
+"""
+
+# Cancelamento: quando ninguém mais espera por uma consulta (timeout ou cliente desconectado), a
+# rota deixa de ter canais e a tarefa é marcada em 'cancelado:{id_tarefa}'. Se o comando ainda está
+# na fila, o dispatcher o descarta; se já foi entregue, o agente recebe {"tipo": "cancelar"}.
+# Só consultas de leitura são canceladas: comandos de escrita sempre vão até o fim.
+CANCEL_TASK_SCRIPT = """
+redis.call('LREM', KEYS[1], 0, ARGV[1])
+if redis.call('LLEN', KEYS[1]) > 0 then
+    return 0
+end
+redis.call('SET', KEYS[2], '1', 'PX', ARGV[2])
+if KEYS[3] ~= '' and redis.call('GET', KEYS[3]) == ARGV[3] then
+    redis.call('DEL', KEYS[3])
+end
+return 1
+"""
+
+# Texto dos statements compartilhado entre os workers ('statement:{id}' -> SQL), consultado quando
+# o agente pede um statement que não conhece ou quando o agente conectado não suporta statements.
+# Cada chave expira após STATEMENT_TTL_SECONDS sem uso (o SQL ad-hoc varia sem limite); cada
+# worker republica (renovando o TTL) o que usa, no máximo a cada STATEMENT_REFRESH_SECONDS.
+STATEMENT_TTL_SECONDS = int(os.environ.get("STATEMENT_TTL_SECONDS", str(7 * 24 * 3600)))
+STATEMENT_REFRESH_SECONDS = STATEMENT_TTL_SECONDS // 2
+
+# Streaming de resultados grandes ('query_stream'): o agente manda o resultado em partes de até
+# STREAM_CHUNK_ROWS linhas ({id_tarefa, seq, dados, fim}) e só pode ter STREAM_WINDOW partes
+# ainda não consumidas; cada parte consumida devolve um crédito ao agente. Assim a memória
+# de uma exportação fica limitada, qualquer que seja o tamanho do resultado.
+STREAM_CHUNK_ROWS = int(os.environ.get("STREAM_CHUNK_ROWS", "500"))
+STREAM_WINDOW = 4
+
+# Log de consultas lentas: toda consulta ao agente acima de SLOW_QUERY_THRESHOLD_MS (tempo de
+# execução informado pelo agente ou, sem ele, a ida e volta inteira) e todo timeout entram em
+# 'consultas_lentas:{cnpj}', uma lista com as últimas SLOW_QUERY_LOG_SIZE ocorrências.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", "2000"))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get("SLOW_QUERY_LOG_SIZE", "1000"))
+
+# Métricas: cada worker publica as suas em 'metricas:{worker}' a cada METRICS_PUBLISH_SECONDS
+# e o /metrics junta as de todos os workers ativos (ver routers/metrics.py).
+METRICS_WORKERS_KEY = "metricas:workers"
+METRICS_PUBLISH_SECONDS = 15
+METRICS_TTL_SECONDS = 4 * METRICS_PUBLISH_SECONDS
+
 tasks: Dict[str, asyncio.Future] = {}
+inflight_commands: Dict[str, asyncio.Task] = {}
+# Quantos requests deste worker aguardam cada tarefa compartilhada
+inflight_waiters: Dict[asyncio.Task, int] = {}
+company_semaphores: Dict[str, asyncio.Semaphore] = {}
+circuit_breakers: Dict[str, CircuitBreaker] = {}
+# Agentes conectados a ESTE worker e entregas aguardando ack
+# (id_tarefa -> (empresa, stream, id da entrada, envio, statement, traceparent))
+connected_agents: Dict[str, WebSocket] = {}
+pending_deliveries: Dict[str, Tuple[str, str, str, float, str, Optional[str]]] = {}
+# Comandos já lidos dos streams esperando vaga na janela do agente
+# (empresa -> [(faixa, etiqueta de início, id da entrada, stream, campos)])
+dispatch_buffers: Dict[str, List[Tuple[int, float, str, str, Dict[str, str]]]] = {}
+# Estado do fair queueing por empresa: tempo virtual e etiqueta de término de cada usuário
+fair_queue_clocks: Dict[str, float] = {}
+fair_queue_finish_tags: Dict[str, Dict[str, float]] = {}
+dispatch_locks: Dict[str, asyncio.Lock] = {}
+# Capacidades anunciadas pelo agente no 'hello' (ex.: 'statements'); agentes antigos não anunciam nada
+agent_capabilities: Dict[str, set] = {}
+# Statements já publicados por este worker (id -> instante da publicação), em LRU como os ad-hoc
+published_statements: "OrderedDict[str, float]" = OrderedDict()
+# Gravações do log de consultas lentas em andamento (referência para a task não ser coletada)
+slow_query_writes: set = set()
+# Partes de resultados em streaming aguardando consumo neste worker (id_tarefa -> fila)
+stream_queues: Dict[str, asyncio.Queue] = {}
+# Rotas das tarefas em streaming cujo agente está neste worker (id_tarefa -> (empresa, canais))
+stream_routes: Dict[str, Tuple[str, List[str]]] = {}
 redis_connection: redis.Redis = None
 
+# --- MÉTRICAS ---
+# 'statement' é o nome do statement registrado ('adhoc' para SQL dinâmico, 'lote' para query_batch),
+# para que o número de séries não cresça com o texto das consultas.
+AGENT_QUEUE_WAIT = Histograma(
+    "agente_espera_fila_segundos", "Tempo entre enfileirar o comando e entregá-lo ao agente.", ("empresa", "faixa", "statement")
+)
+AGENT_EXECUTION_TIME = Histograma(
+    "agente_execucao_segundos", "Tempo entre entregar o comando ao agente e receber a resposta.", ("empresa", "statement")
+)
+COMMAND_LATENCY = Histograma(
+    "comando_latencia_segundos", "Latência total de send_command_to_agent.", ("empresa", "statement", "resultado")
+)
+AGENT_TIMEOUTS = Contador("agente_timeouts", "Comandos sem resposta do agente dentro do timeout.", ("empresa",))
+AGENT_LATE_REPLIES = Contador(
+    "agente_respostas_descartadas", "Respostas do agente que chegaram depois do timeout ou para tarefas desconhecidas.", ("motivo",)
+)
+Medidor("tarefas_pendentes", "Tarefas aguardando resposta do agente neste worker.", funcao=lambda: len(tasks))
+Medidor("agentes_conectados", "WebSockets de agentes abertos neste worker.", funcao=lambda: len(connected_agents))
+
 # --- LÓGICA DA APLICAÇÃO ---
 def json_converter(o):
     if isinstance(o, (datetime, date)):
         return o.isoformat()
 
+def agent_stream_key(company_cnpj: str, prioridade: str = PRIORIDADE_PADRAO) -> str:
+    # A faixa interativa mantém o nome original do stream, que já existe em produção
+    if prioridade == PRIORIDADE_PADRAO:
+        return f"stream:{company_cnpj}"
+    return f"stream:{company_cnpj}:{prioridade}"
+
+def stream_priority(stream_key: str) -> str:
+    """Faixa de prioridade de um stream de comandos (inverso de agent_stream_key)."""
+    parts = stream_key.split(":")
+    return parts[2] if len(parts) > 2 else PRIORIDADE_PADRAO
+
+def agent_presence_key(company_cnpj: str) -> str:
+    return f"agente:{company_cnpj}"
+
+def get_company_semaphore(company_cnpj: str) -> asyncio.Semaphore:
+    semaphore = company_semaphores.get(company_cnpj)
+    if semaphore is None:
+        semaphore = company_semaphores[company_cnpj] = asyncio.Semaphore(AGENT_MAX_CONCURRENCY)
+    return semaphore
+
+def command_sqls(acao: str, parametros: Dict[str, Any]) -> List[str]:
+    """Devolve os SQLs de um comando de consulta, resolvendo os ids de statement registrados."""
+    if acao in ("query", "query_stream"):
+        consultas = [parametros]
+    elif acao == "query_batch":
+        consultas = parametros.get("consultas", [])
+    else:
+        return []
+    sqls = []
+    for consulta in consultas:
+        statement = obter_statement(consulta["statement_id"]) if "statement_id" in consulta else None
+        sqls.append(statement.sql if statement else consulta.get("sql", ""))
+    return sqls
+
+def is_read_only_command(acao: str, parametros: Dict[str, Any]) -> bool:
+    sqls = command_sqls(acao, parametros)
+    return bool(sqls) and all(sql.lstrip().upper().startswith(("SELECT", "WITH")) for sql in sqls)
+
+def command_metric_label(acao: str, parametros: Dict[str, Any]) -> str:
+    """Rótulo 'statement' das métricas: o nome do statement (sem o hash), 'lote' ou a própria ação."""
+    if acao == "query_batch":
+        return "lote"
+    if acao in ("query", "query_stream"):
+        statement_id = (parametros or {}).get("statement_id")
+        return statement_id.split(":", 1)[0] if statement_id else "adhoc"
+    return acao
+
+def build_inflight_key(company_cnpj: str, acao: str, parametros: Dict[str, Any]) -> str:
+    material = json.dumps({"acao": acao, "parametros": parametros}, default=json_converter, sort_keys=True)
+    return f"inflight:{company_cnpj}:{hashlib.sha1(material.encode('utf-8')).hexdigest()}"
+
+def get_circuit_breaker(company_cnpj: str) -> CircuitBreaker:
+    breaker = circuit_breakers.get(company_cnpj)
+    if breaker is None:
+        breaker = circuit_breakers[company_cnpj] = CircuitBreaker()
+    return breaker
+
+def check_circuit_breaker(company_cnpj: str) -> CircuitBreaker:
+    """Devolve o circuit breaker da empresa ou levanta 503 se as consultas estiverem suspensas."""
+    breaker = get_circuit_breaker(company_cnpj)
+    if not breaker.permitir():
+        retry_after = max(1, round(breaker.segundos_para_tentar()))
+        raise HTTPException(
+            status_code=503,
+            detail="O agente local está instável e as consultas foram suspensas por alguns segundos.",
+            headers={"Retry-After": str(retry_after)}
+        )
+    return breaker
+
 # Função send_command_to_agent atualizada para usar Redis
 async def send_command_to_agent(company_cnpj: str, acao: str, parametros: Dict[str, Any]):
+    await charge_pending_rate_limit()
+    breaker = check_circuit_breaker(company_cnpj)
+    started_at = time.monotonic()
+    outcome = "ok"
+    try:
+        with span("agente.comando", empresa=company_cnpj, acao=acao, statement=command_metric_label(acao, parametros)):
+            result = await _send_command_with_coalescing(company_cnpj, acao, parametros)
+    except HTTPException as e:
+        outcome = {408: "timeout", 503: "indisponivel"}.get(e.status_code, "erro")
+        breaker.registrar(sucesso=e.status_code not in AGENT_UNAVAILABLE_STATUS)
+        raise
+    except asyncio.CancelledError:
+        outcome = "cancelado"
+        breaker.liberar_sonda()
+        raise
+    except Exception:
+        # Falha inesperada: conta como falha do agente para não deixar a sonda do half-open presa
+        outcome = "erro"
+        breaker.registrar(sucesso=False)
+        raise
+    finally:
+        COMMAND_LATENCY.observe(
+            time.monotonic() - started_at, empresa=company_cnpj, statement=command_metric_label(acao, parametros), resultado=outcome
+        )
+    breaker.registrar(sucesso=True)
+    return result
+
+async def _send_command_with_coalescing(company_cnpj: str, acao: str, parametros: Dict[str, Any]):
+    if not is_read_only_command(acao, parametros):
+        async with get_company_semaphore(company_cnpj):
+            return await _send_command_to_agent(company_cnpj, acao, parametros)
+
+    inflight_key = build_inflight_key(company_cnpj, acao, parametros)
+    shared_task = inflight_commands.get(inflight_key)
+    if shared_task is None:
+        shared_task = asyncio.ensure_future(_send_coalesced_command(company_cnpj, acao, parametros, inflight_key))
+        inflight_commands[inflight_key] = shared_task
+        shared_task.add_done_callback(
+            lambda done: inflight_commands.pop(inflight_key, None) if inflight_commands.get(inflight_key) is done else None
+        )
+    # shield: se um dos interessados desistir, os demais continuam esperando a mesma tarefa
+    inflight_waiters[shared_task] = inflight_waiters.get(shared_task, 0) + 1
+    try:
+        return await asyncio.shield(shared_task)
+    except asyncio.CancelledError:
+        # O último interessado desistiu: cancela a tarefa compartilhada e, com ela, a consulta no agente
+        if inflight_waiters.get(shared_task) == 1 and not shared_task.done():
+            shared_task.cancel()
+        raise
+    finally:
+        remaining = inflight_waiters.get(shared_task, 1) - 1
+        if remaining:
+            inflight_waiters[shared_task] = remaining
+        else:
+            inflight_waiters.pop(shared_task, None)
+
+async def _send_coalesced_command(company_cnpj: str, acao: str, parametros: Dict[str, Any], inflight_key: str):
+    async with get_company_semaphore(company_cnpj):
+        return await _send_command_to_agent(company_cnpj, acao, parametros, inflight_key=inflight_key)
+
+async def enqueue_command(company_cnpj: str, task_id: str, acao: str, parametros: Dict[str, Any], inflight_key: Optional[str] = None):
+    """
+    Registra a rota da resposta e empurra o comando para a fila do Redis na mesma ida ao servidor.
+    Devolve o id_tarefa em andamento (str) quando pegou carona em uma tarefa idêntica de outro worker.
+    """
+    if redis_connection is None:
+        raise ConnectionError("A conexão com o Redis não foi inicializada.")
+
+    enqueued_at = time.time()
+    payload = {"id_tarefa": task_id, "acao": acao, "parametros": parametros, "expira_em": enqueued_at + AGENT_TIMEOUT_SECONDS}
+    traceparent = traceparent_atual()
+    if traceparent:
+        # O agente continua o trace e devolve os próprios tempos em 'tempos'
+        payload["traceparent"] = traceparent
+    payload_str = json.dumps(payload, default=json_converter)
+
+    stale_before_ms = int((enqueued_at - AGENT_TIMEOUT_SECONDS) * 1000)
+    with span("redis.enfileirar", id_tarefa=task_id, faixa=prioridade_atual.get()):
+        enqueued = await redis_connection.eval(
+            ENQUEUE_COMMAND_SCRIPT, 4, agent_stream_key(company_cnpj, prioridade_atual.get()), f"rota:{task_id}", agent_presence_key(company_cnpj), inflight_key or "",
+            stale_before_ms, AGENT_QUEUE_MAX_DEPTH, payload_str, REPLY_CHANNEL, ROUTE_TTL_SECONDS, AGENT_STREAM_MAXLEN,
+            "1" if inflight_key else "0", INFLIGHT_MIN_REMAINING_MS, task_id, int(AGENT_TIMEOUT_SECONDS * 1000), usuario_atual.get()
+        )
+    if enqueued == -1:
+        raise HTTPException(status_code=503, detail="O agente local da empresa está offline. Verifique se o computador da loja está ligado e conectado.")
+    if not enqueued:
+        raise HTTPException(status_code=503, detail="A fila de comandos do agente local está cheia. Tente novamente em instantes.")
+    return enqueued
+
+async def _send_command_to_agent(company_cnpj: str, acao: str, parametros: Dict[str, Any], inflight_key: Optional[str] = None):
     task_id = str(uuid.uuid4())
     loop = asyncio.get_running_loop()
     future = loop.create_future()
     tasks[task_id] = future
-
-    payload = {"id_tarefa": task_id, "acao": acao, "parametros": parametros}
-    payload_str = json.dumps(payload, default=json_converter)
+    started_at = time.monotonic()
+    joined = False
 
     try:
-        if redis_connection is None:
-            raise ConnectionError("A conexão com o Redis não foi inicializada.")
-
-        # Em vez de enviar para um WebSocket, empurra a mensagem para a fila do Redis
-        await redis_connection.rpush(f"queue:{company_cnpj}", payload_str)
+        enqueued = await enqueue_command(company_cnpj, task_id, acao, parametros, inflight_key)
+        if isinstance(enqueued, str):
+            # Outro worker já pediu exatamente a mesma consulta: aguarda a resposta da tarefa dele.
+            tasks.pop(task_id, None)
+            task_id = enqueued
+            tasks[task_id] = future
+            joined = True
         
         # Aumenta o timeout para acomodar consultas mais longas
-        result = await asyncio.wait_for(future, timeout=60.0)
+        result = await asyncio.wait_for(future, timeout=AGENT_TIMEOUT_SECONDS)
 
         if result.get("status") == "erro":
             error_message = str(result.get('mensagem', 'Erro desconhecido no agente.'))
             raise HTTPException(status_code=400, detail=f"Erro no agente local: {error_message}")
 
+        if not joined:
+            # Quem pegou carona não registra: o worker dono da tarefa já registra a consulta
+            record_slow_query(company_cnpj, acao, parametros, (time.monotonic() - started_at) * 1000, result.get("dados"), result.get("tempos"))
         return result.get("dados", [])
 
     except asyncio.TimeoutError:
+        AGENT_TIMEOUTS.inc(empresa=company_cnpj)
+        if not joined:
+            record_slow_query(company_cnpj, acao, parametros, AGENT_TIMEOUT_SECONDS * 1000, None, timed_out=True)
+        if inflight_key:
+            await cancel_agent_task(company_cnpj, task_id, inflight_key)
         raise HTTPException(status_code=408, detail="O agente local demorou para responder (timeout).")
+    except asyncio.CancelledError:
+        if inflight_key:
+            await cancel_agent_task(company_cnpj, task_id, inflight_key)
+        raise
     except ConnectionError as e:
         raise HTTPException(status_code=503, detail=str(e))
+    except (redis_errors.ConnectionError, redis_errors.TimeoutError) as e:
+        raise HTTPException(status_code=503, detail=f"O Redis está indisponível: {e}")
     finally:
         tasks.pop(task_id, None)
 
+async def cancel_agent_task(company_cnpj: str, task_id: str, inflight_key: Optional[str] = None):
+    """
+    Desiste da tarefa neste worker. Se mais ninguém (de nenhum worker) espera por ela,
+    marca a tarefa como cancelada e pede ao agente que interrompa a consulta.
+    """
+    try:
+        cancelled = await redis_connection.eval(
+            CANCEL_TASK_SCRIPT, 3, f"rota:{task_id}", f"cancelado:{task_id}", inflight_key or "",
+            REPLY_CHANNEL, int(AGENT_TIMEOUT_SECONDS * 1000), task_id
+        )
+        if cancelled:
+            await send_control_to_agent(company_cnpj, {"tipo": "cancelar", "id_tarefa": task_id})
+            print(f"INFO: Tarefa '{task_id}' de '{company_cnpj}' cancelada (ninguém mais aguarda o resultado).")
+    except Exception as e:
+        # Sem o cancelamento a consulta apenas roda até o fim no agente, como antes.
+        print(f"AVISO: Não foi possível cancelar a tarefa '{task_id}' de '{company_cnpj}': {e}")
+
+def slow_query_log_key(company_cnpj: str) -> str:
+    return f"consultas_lentas:{company_cnpj}"
+
+def params_shape(params: Optional[list]) -> List[str]:
+    """Tipos dos parâmetros (sem os valores), para agrupar execuções da mesma consulta no log de lentas."""
+    return [type(param).__name__ for param in params or []]
+
+def record_slow_query(company_cnpj: str, acao: str, parametros: Dict[str, Any], elapsed_ms: float, dados: Any,
+                      tempos: Optional[Dict[str, Any]] = None, rows: Optional[int] = None, timed_out: bool = False):
+    """
+    Registra a consulta no log de lentas da empresa se passou do limite (ou estourou o timeout).
+    A gravação no Redis roda em segundo plano: a resposta não espera por ela nem falha por ela.
+    """
+    tempos = tempos or {}
+    duration_ms = float(tempos["execucao_ms"]) if tempos.get("execucao_ms") is not None else elapsed_ms
+    if duration_ms < SLOW_QUERY_THRESHOLD_MS and not timed_out:
+        return
+
+    if acao == "query_batch":
+        shape = {consulta.get("nome"): params_shape(consulta.get("params")) for consulta in parametros.get("consultas", [])}
+        if rows is None and isinstance(dados, dict):
+            rows = sum(len(linhas or []) for linhas in dados.values())
+    else:
+        shape = params_shape(parametros.get("params"))
+        if rows is None and isinstance(dados, list):
+            rows = len(dados)
+    sql = ";\n".join(normalizar_sql(sql) for sql in command_sqls(acao, parametros))
+    entry = {
+        "sql": sql,
+        "statement": command_metric_label(acao, parametros),
+        "params": shape,
+        "empresa": company_cnpj,
+        "duracao_ms": round(duration_ms, 1),
+        "ida_e_volta_ms": round(elapsed_ms, 1),
+        "linhas": rows,
+        # Tamanho informado pelo agente; sem ele fica em branco (não vale serializar o resultado de novo)
+        "bytes": tempos.get("bytes"),
+        "timeout": timed_out,
+        "em": time.time(),
+    }
+    print(f"AVISO: Consulta lenta para '{company_cnpj}' ({'timeout' if timed_out else f'{duration_ms:.0f} ms'}): {sql[:200]}")
+    write_task = asyncio.ensure_future(write_slow_query(company_cnpj, entry))
+    slow_query_writes.add(write_task)
+    write_task.add_done_callback(slow_query_writes.discard)
+
+async def write_slow_query(company_cnpj: str, entry: Dict[str, Any]):
+    try:
+        async with redis_connection.pipeline(transaction=False) as pipe:
+            pipe.lpush(slow_query_log_key(company_cnpj), json.dumps(entry))
+            pipe.ltrim(slow_query_log_key(company_cnpj), 0, SLOW_QUERY_LOG_SIZE - 1)
+            await pipe.execute()
+    except Exception as e:
+        print(f"AVISO: Não foi possível registrar a consulta lenta de '{company_cnpj}': {e}")
+
+async def list_slow_queries(company_cnpj: str) -> List[Dict[str, Any]]:
+    """Ocorrências do log de consultas lentas da empresa, da mais recente para a mais antiga."""
+    return [json.loads(entry) for entry in await redis_connection.lrange(slow_query_log_key(company_cnpj), 0, -1)]
+
+def cache_tag_key(company_cnpj: str, tag: str) -> str:
+    return f"cache:tag:{company_cnpj}:{tag}"
+
+def build_cache_key(company_cnpj: str, sqls: List[str], params: Any) -> str:
+    sql_hash = hashlib.sha1("\n".join(normalizar_sql(sql) for sql in sqls).encode("utf-8")).hexdigest()[:16]
+    params_hash = hashlib.sha1(json.dumps(params, default=json_converter).encode("utf-8")).hexdigest()[:16]
+    return f"cache:{company_cnpj}:{sql_hash}:{params_hash}"
+
+async def read_through_cache(company_cnpj: str, cache_key: str, cache_ttl: int, cache_tags: Optional[List[str]], loader: Callable[[], Awaitable[Any]]):
+    """Devolve o resultado guardado em 'cache_key' ou chama 'loader' e guarda o resultado por 'cache_ttl' segundos."""
+    stats_key = f"cache:stats:{company_cnpj}"
+    try:
+        with span("redis.cache", empresa=company_cnpj) as cache_span:
+            cached = await redis_connection.get(cache_key)
+            if cache_span:
+                cache_span.set("cache.hit", cached is not None)
+        if cached is not None:
+            await redis_connection.hincrby(stats_key, "hits", 1)
+            return decodificar_dados(json.loads(cached))
+    except redis_errors.ConnectionError as e:
+        # O cache é só uma otimização: sem Redis a consulta segue para o agente (que também vai falhar de forma clara).
+        print(f"AVISO: Cache indisponível para '{company_cnpj}': {e}")
+
+    try:
+        result = await loader()
+    except HTTPException as e:
+        if e.status_code not in AGENT_UNAVAILABLE_STATUS:
+            raise
+        stale = await read_last_good(cache_key)
+        if stale is None:
+            raise
+        print(f"AVISO: Agente de '{company_cnpj}' indisponível ({e.detail}); servindo o último resultado bom.")
+        marcar_resposta_desatualizada()
+        return stale
+
+    try:
+        # Resultados colunares continuam colunares no cache (nomes das colunas uma única vez)
+        encoded = json.dumps(codificar_dados(result), default=json_converter)
+        async with redis_connection.pipeline(transaction=False) as pipe:
+            pipe.set(cache_key, encoded, ex=cache_ttl)
+            pipe.set(f"ultimo_bom:{cache_key}", encoded, ex=LAST_GOOD_TTL_SECONDS)
+            pipe.hincrby(stats_key, "misses", 1)
+            for tag in cache_tags or []:
+                pipe.sadd(cache_tag_key(company_cnpj, tag), cache_key)
+                pipe.expire(cache_tag_key(company_cnpj, tag), CACHE_TAG_TTL_SECONDS)
+            await pipe.execute()
+    except redis_errors.ConnectionError as e:
+        print(f"AVISO: Não foi possível gravar o cache para '{company_cnpj}': {e}")
+    return result
+
+async def read_last_good(cache_key: str):
+    try:
+        cached = await redis_connection.get(f"ultimo_bom:{cache_key}")
+    except redis_errors.ConnectionError:
+        return None
+    return decodificar_dados(json.loads(cached)) if cached is not None else None
+
+async def invalidate_cache(company_cnpj: str, tag: str) -> int:
+    """Apaga todas as entradas de cache da empresa marcadas com 'tag' (ex.: 'metas' após salvar uma meta)."""
+    return await redis_connection.eval(INVALIDATE_TAG_SCRIPT, 1, cache_tag_key(company_cnpj, tag))
+
+async def check_rate_limit(categoria: str, company_cnpj: str, uid: str, custo: int = 1) -> int:
+    """Consome 'custo' fichas dos baldes da empresa e do usuário. Devolve 0 ou a espera (ms) até haver fichas."""
+    limits = RATE_LIMITS[categoria]
+    buckets = [(f"limite:{categoria}:empresa:{company_cnpj}", limits["empresa"]), (f"limite:{categoria}:usuario:{uid}", limits["usuario"])]
+    custo = min(custo, *(capacity for _key, (capacity, _rate) in buckets))
+    args = [int(time.time() * 1000), custo]
+    for _key, (capacity, rate) in buckets:
+        args.extend([capacity, rate])
+    try:
+        return int(await redis_connection.eval(TOKEN_BUCKET_SCRIPT, len(buckets), *(key for key, _limit in buckets), *args))
+    except redis_errors.ConnectionError as e:
+        # Sem Redis o limite não é aplicado; as consultas ao agente vão falhar de forma clara logo em seguida.
+        print(f"AVISO: Limite de taxa indisponível para '{company_cnpj}': {e}")
+        return 0
+
+# Cobrança de fichas da categoria 'agente' registrada por limitar_requisicoes e feita só quando o
+# primeiro comando da requisição vai de fato ao agente (acertos de cache não gastam fichas). Um
+# custo definido na rota substitui o do router. ({categoria, empresa, uid, custo[, verificacao]})
+pending_rate_limit: ContextVar[Optional[Dict[str, Any]]] = ContextVar("pending_rate_limit", default=None)
+
+def rate_limit_exceeded(retry_after_ms: int) -> HTTPException:
+    retry_after = max(1, math.ceil(retry_after_ms / 1000))
+    return HTTPException(
+        status_code=429,
+        detail=f"Muitas requisições em pouco tempo. Tente novamente em {retry_after} segundo(s).",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+async def charge_pending_rate_limit():
+    """Cobra, uma única vez por requisição, as fichas registradas; levanta 429 se faltarem."""
+    charge = pending_rate_limit.get()
+    if charge is None:
+        return
+    if "verificacao" not in charge:
+        # Consultas em paralelo da mesma requisição aguardam a mesma verificação
+        charge["verificacao"] = asyncio.ensure_future(
+            check_rate_limit(charge["categoria"], charge["empresa"], charge["uid"], charge["custo"])
+        )
+    retry_after_ms = await asyncio.shield(charge["verificacao"])
+    if retry_after_ms:
+        raise rate_limit_exceeded(retry_after_ms)
+
+async def get_cache_stats(company_cnpj: str) -> Dict[str, int]:
+    stats = await redis_connection.hgetall(f"cache:stats:{company_cnpj}")
+    return {"hits": int(stats.get("hits", 0)), "misses": int(stats.get("misses", 0))}
+
+def statement_key(statement_id: str) -> str:
+    return f"statement:{statement_id}"
+
+async def publish_statement(sql: str) -> str:
+    """Garante que o texto do statement esteja no Redis (com o TTL renovado) e devolve o seu id."""
+    statement = resolver_statement(sql)
+    published_at = published_statements.get(statement.id)
+    if published_at is None or time.monotonic() - published_at > STATEMENT_REFRESH_SECONDS:
+        await redis_connection.set(statement_key(statement.id), statement.sql, ex=STATEMENT_TTL_SECONDS)
+        published_statements[statement.id] = time.monotonic()
+        if len(published_statements) > ADHOC_STATEMENTS_MAX:
+            published_statements.popitem(last=False)
+    published_statements.move_to_end(statement.id)
+    return statement.id
+
+async def get_statement_sql(statement_id: str) -> Optional[str]:
+    statement = obter_statement(statement_id)
+    if statement is not None:
+        return statement.sql
+    return await redis_connection.get(statement_key(statement_id))
+
+async def agent_supports(company_cnpj: str, capability: str) -> bool:
+    """Diz se o agente da empresa anunciou a capacidade no 'hello' (o agente pode estar em outro worker)."""
+    capabilities = await redis_connection.hget(agent_presence_key(company_cnpj), "capacidades") or ""
+    return capability in capabilities.split(",")
+
 # A função execute_query_via_agent continua usando send_command_to_agent
-async def execute_query_via_agent(company_cnpj: str, sql: str, params: list = []):
-    parametros = {"sql": sql, "params": params}
-    return await send_command_to_agent(company_cnpj, "query", parametros)
+async def execute_query_via_agent(company_cnpj: str, sql: str, params: list = [], cache_ttl: int = 0, cache_tags: Optional[List[str]] = None, prepare: bool = True):
+    # prepare=False manda o texto completo (ex.: SQL gerado pela IA, que nunca se repete)
+    if prepare:
+        parametros = {"statement_id": await publish_statement(sql), "params": params}
+    else:
+        parametros = {"sql": sql, "params": params}
+    if cache_ttl <= 0:
+        return await send_command_to_agent(company_cnpj, "query", parametros)
+    cache_key = build_cache_key(company_cnpj, [sql], params)
+    return await read_through_cache(
+        company_cnpj, cache_key, cache_ttl, cache_tags,
+        lambda: send_command_to_agent(company_cnpj, "query", parametros)
+    )
+
+async def execute_batch_via_agent(company_cnpj: str, consultas: Dict[str, Tuple[str, list]], cache_ttl: int = 0, cache_tags: Optional[List[str]] = None) -> Dict[str, List[dict]]:
+    """
+    Envia um lote de consultas nomeadas em um único comando 'query_batch'.
+    O agente executa todas na mesma conexão/transação e devolve os resultados
+    em uma única resposta ({nome: linhas}), custando uma ida e volta em vez de N.
+    Agentes sem a capacidade 'lote' recebem as consultas como comandos 'query' em paralelo.
+    """
+    cache_key = None
+    if cache_ttl > 0:
+        cache_key = build_cache_key(company_cnpj, [sql for sql, _params in consultas.values()], {nome: params for nome, (_sql, params) in consultas.items()})
+    if not await agent_supports(company_cnpj, "lote"):
+        try:
+            resultados = await execute_queries_concurrently(company_cnpj, consultas, return_exceptions=False, cache_ttl=cache_ttl, cache_tags=cache_tags)
+        except HTTPException as e:
+            # Agente offline: a presença (com as capacidades) some na desconexão, mas o último
+            # resultado bom continua guardado na chave do lote, não nas das consultas avulsas
+            stale = await read_last_good(cache_key) if cache_key and e.status_code in AGENT_UNAVAILABLE_STATUS else None
+            if stale is None:
+                raise
+            print(f"AVISO: Agente de '{company_cnpj}' indisponível ({e.detail}); servindo o último resultado bom do lote.")
+            marcar_resposta_desatualizada()
+            resultados = stale
+        return {nome: resultados.get(nome) or [] for nome in consultas}
+
+    parametros = {
+        "consultas": [
+            {"nome": nome, "statement_id": await publish_statement(sql), "params": params}
+            for nome, (sql, params) in consultas.items()
+        ]
+    }
+    if cache_ttl <= 0:
+        resultados = await send_command_to_agent(company_cnpj, "query_batch", parametros) or {}
+    else:
+        resultados = await read_through_cache(
+            company_cnpj, cache_key, cache_ttl, cache_tags,
+            lambda: send_command_to_agent(company_cnpj, "query_batch", parametros)
+        ) or {}
+    return {nome: resultados.get(nome) or [] for nome in consultas}
+
+async def execute_queries_concurrently(company_cnpj: str, consultas: Dict[str, Tuple[str, list]], return_exceptions: bool = True, cache_ttl: int = 0, cache_tags: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Executa consultas independentes em paralelo (limitadas pelo semáforo da empresa),
+    de forma que a latência total seja a da consulta mais lenta e não a soma de todas.
+    Uma consulta que falha não cancela as demais: com return_exceptions=True a exceção
+    ocupa o lugar do resultado; caso contrário, a primeira falha é relançada ao final.
+    """
+    nomes = list(consultas)
+    resultados = await asyncio.gather(
+        *(execute_query_via_agent(company_cnpj, sql, params, cache_ttl=cache_ttl, cache_tags=cache_tags) for sql, params in consultas.values()),
+        return_exceptions=True
+    )
+    if not return_exceptions:
+        for resultado in resultados:
+            if isinstance(resultado, BaseException):
+                raise resultado
+    return dict(zip(nomes, resultados))
+
+async def stream_query_via_agent(company_cnpj: str, sql: str, params: list = [], prepare: bool = True, chunk_rows: int = STREAM_CHUNK_ROWS) -> AsyncIterator[list]:
+    """
+    Executa uma consulta em modo streaming e devolve as partes do resultado (listas de linhas)
+    à medida que chegam do agente. Usar com 'async for'; no máximo STREAM_WINDOW partes ficam
+    em memória. Agentes sem a capacidade 'streaming' respondem a consulta inteira em uma parte só.
+
+    A vaga do semáforo da empresa e o circuit breaker valem até a primeira parte (a execução da
+    consulta no agente); depois o ritmo é o do consumidor, limitado pelos créditos da janela.
+    """
+    if not await agent_supports(company_cnpj, "streaming"):
+        yield await execute_query_via_agent(company_cnpj, sql, params, prepare=prepare)
+        return
+    await charge_pending_rate_limit()
+    breaker = check_circuit_breaker(company_cnpj)
+
+    if prepare:
+        parametros = {"statement_id": await publish_statement(sql), "params": params}
+    else:
+        parametros = {"sql": sql, "params": params}
+    parametros.update({"linhas_por_parte": chunk_rows, "janela": STREAM_WINDOW})
+
+    task_id = str(uuid.uuid4())
+    queue: asyncio.Queue = asyncio.Queue()
+    stream_queues[task_id] = queue
+    pending = False
+    waiting_first_part = True
+    started_at = time.monotonic()
+    outcome = "ok"
+    statement_label = command_metric_label("query_stream", parametros)
+    total_rows = 0
+    try:
+        try:
+            async with get_company_semaphore(company_cnpj):
+                with span("agente.comando", empresa=company_cnpj, acao="query_stream", statement=statement_label):
+                    await enqueue_command(company_cnpj, task_id, "query_stream", parametros)
+                    pending = True
+                    message = await asyncio.wait_for(queue.get(), timeout=AGENT_TIMEOUT_SECONDS)
+            waiting_first_part = False
+            breaker.registrar(sucesso=True)
+            expected_seq = 0
+            while True:
+                if message.get("status") == "erro":
+                    pending = False
+                    error_message = str(message.get('mensagem', 'Erro desconhecido no agente.'))
+                    raise HTTPException(status_code=400, detail=f"Erro no agente local: {error_message}")
+                if message.get("seq") != expected_seq:
+                    raise HTTPException(status_code=502, detail=f"Parte {message.get('seq')} do resultado chegou fora de ordem (esperada: {expected_seq}).")
+                expected_seq += 1
+                total_rows += len(message.get("dados") or [])
+                if message.get("fim"):
+                    # Registrado antes de entregar a última parte, caso o consumidor pare nela.
+                    # A ida e volta inclui o ritmo do consumidor: vale o 'execucao_ms' do agente, se houver.
+                    record_slow_query(
+                        company_cnpj, "query_stream", parametros, (time.monotonic() - started_at) * 1000, None,
+                        message.get("tempos"), rows=total_rows
+                    )
+                if message.get("dados"):
+                    yield message["dados"]
+                if message.get("fim"):
+                    pending = False
+                    break
+                await grant_stream_credit(company_cnpj, task_id)
+                # O prazo vale entre uma parte e outra, não para o resultado inteiro
+                message = await asyncio.wait_for(queue.get(), timeout=AGENT_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=408, detail="O agente local parou de enviar o resultado (timeout).")
+        except ConnectionError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except (redis_errors.ConnectionError, redis_errors.TimeoutError) as e:
+            raise HTTPException(status_code=503, detail=f"O Redis está indisponível: {e}")
+    except HTTPException as e:
+        outcome = {408: "timeout", 503: "indisponivel"}.get(e.status_code, "erro")
+        if waiting_first_part:
+            breaker.registrar(sucesso=e.status_code not in AGENT_UNAVAILABLE_STATUS)
+        raise
+    except asyncio.CancelledError:
+        outcome = "cancelado"
+        if waiting_first_part:
+            breaker.liberar_sonda()
+        raise
+    except Exception:
+        outcome = "erro"
+        if waiting_first_part:
+            breaker.registrar(sucesso=False)
+        raise
+    finally:
+        # Latência do resultado inteiro, incluindo o ritmo do consumidor
+        COMMAND_LATENCY.observe(time.monotonic() - started_at, empresa=company_cnpj, statement=statement_label, resultado=outcome)
+        stream_queues.pop(task_id, None)
+        if pending:
+            # Consumidor parou antes do fim (limite de linhas, cliente desconectou, erro)
+            await cancel_agent_task(company_cnpj, task_id)
+
+async def grant_stream_credit(company_cnpj: str, task_id: str, amount: int = 1):
+    """Libera o agente para mandar mais partes da tarefa."""
+    await send_control_to_agent(company_cnpj, {"tipo": "credito", "id_tarefa": task_id, "quantidade": amount})
+
+async def send_control_to_agent(company_cnpj: str, control: Dict[str, Any]):
+    """Manda uma mensagem de controle (crédito, cancelamento) ao agente; o WebSocket pode estar em outro worker."""
+    websocket = connected_agents.get(company_cnpj)
+    if websocket is not None:
+        await websocket.send_text(json.dumps(control))
+        return
+    worker = await redis_connection.hget(agent_presence_key(company_cnpj), "worker")
+    if worker:
+        await redis_connection.publish(f"respostas:{worker}", json.dumps({**control, "empresa": company_cnpj}))
+
+async def forward_agent_control(message: Dict[str, Any]):
+    websocket = connected_agents.get(message.pop("empresa", None))
+    if websocket is None:
+        return
+    try:
+        await websocket.send_text(json.dumps(message))
+    except Exception as e:
+        print(f"AVISO: Não foi possível repassar '{message.get('tipo')}' da tarefa '{message.get('id_tarefa')}' ao agente: {e}")
+
+
+def resolve_local_task(task_id: str, message: Dict[str, Any]):
+    queue = stream_queues.get(task_id)
+    if queue is not None:
+        queue.put_nowait(message)
+        return
+    future = tasks.pop(task_id, None)
+    if future is None:
+        AGENT_LATE_REPLIES.inc(motivo="desconhecida")
+        print(f"AVISO: Recebida resposta para tarefa desconhecida ou expirada: '{task_id}'.")
+    elif not future.done():
+        future.set_result(message)
+    else:
+        AGENT_LATE_REPLIES.inc(motivo="atrasada")
+        print(f"AVISO: Resultado para tarefa '{task_id}' chegou atrasado (após timeout).")
+
+async def deliver_agent_reply(task_id: str, message: Dict[str, Any], raw_message: Union[str, bytes]):
+    """Entrega a resposta do agente a todos os workers que aguardam a tarefa."""
+    try:
+        routes = await redis_connection.eval(POP_ROUTE_SCRIPT, 1, f"rota:{task_id}")
+    except redis_errors.ConnectionError as e:
+        # Sem Redis só é possível entregar a quem está neste mesmo worker.
+        print(f"AVISO: Não foi possível consultar a rota da tarefa '{task_id}' no Redis: {e}")
+        resolve_local_task(task_id, message)
+        return
+    if not routes:
+        AGENT_LATE_REPLIES.inc(motivo="desconhecida")
+        print(f"AVISO: Recebida resposta para tarefa desconhecida ou expirada: '{task_id}'.")
+        return
+    for channel in routes:
+        if channel == REPLY_CHANNEL:
+            resolve_local_task(task_id, message)
+        else:
+            await redis_connection.publish(channel, raw_message)
+
+async def deliver_stream_chunk(company_id: str, task_id: str, message: Dict[str, Any], raw_message: Union[str, bytes]):
+    """Entrega uma parte de um resultado em streaming. A rota é lida na primeira parte e guardada até a última."""
+    if task_id not in stream_routes:
+        await acknowledge_task(task_id, message)
+        routes = await redis_connection.eval(POP_ROUTE_SCRIPT, 1, f"rota:{task_id}")
+        stream_routes[task_id] = (company_id, routes)
+    routes = stream_routes[task_id][1]
+    if message.get("fim") or message.get("status") == "erro":
+        stream_routes.pop(task_id, None)
+    if not routes:
+        print(f"AVISO: Recebida parte de resultado para tarefa desconhecida ou expirada: '{task_id}'.")
+        return
+    for channel in routes:
+        if channel == REPLY_CHANNEL:
+            resolve_local_task(task_id, message)
+        else:
+            await redis_connection.publish(channel, raw_message)
+
+async def collect_queue_depths() -> List[Dict[str, Any]]:
+    """Profundidade dos streams de comandos (por empresa e faixa) dos agentes online, lida na hora da coleta."""
+    company_ids = await redis_connection.zrange(ONLINE_AGENTS_KEY, 0, -1)
+    async with redis_connection.pipeline(transaction=False) as pipe:
+        for company_id in company_ids:
+            for prioridade in PRIORIDADES:
+                pipe.xlen(agent_stream_key(company_id, prioridade))
+        depths = await pipe.execute() if company_ids else []
+    labels = [{"empresa": company_id, "faixa": prioridade} for company_id in company_ids for prioridade in PRIORIDADES]
+    return [{
+        "nome": "agente_fila_profundidade",
+        "tipo": "gauge",
+        "descricao": "Comandos no stream da empresa (na fila ou entregues sem resposta).",
+        "amostras": [("", label, depth) for label, depth in zip(labels, depths)],
+    }]
+
+async def publish_metrics():
+    """Tarefa de fundo (uma por worker) que publica as métricas deste worker para o /metrics."""
+    while True:
+        try:
+            now = time.time()
+            async with redis_connection.pipeline(transaction=False) as pipe:
+                pipe.set(f"metricas:{WORKER_ID}", json.dumps(coletar()), ex=METRICS_TTL_SECONDS)
+                pipe.zadd(METRICS_WORKERS_KEY, {WORKER_ID: now})
+                pipe.zremrangebyscore(METRICS_WORKERS_KEY, "-inf", now - METRICS_TTL_SECONDS)
+                await pipe.execute()
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            print(f"AVISO: Não foi possível publicar as métricas do worker: {e}")
+        await asyncio.sleep(METRICS_PUBLISH_SECONDS)
+
+async def collect_worker_metrics() -> List[Tuple[Dict[str, str], List[Dict[str, Any]]]]:
+    """Métricas de todos os workers ativos: as deste worker na hora, as dos outros da última publicação."""
+    collected = [({"worker": WORKER_ID[:8]}, coletar())]
+    worker_ids = [
+        worker_id for worker_id in await redis_connection.zrangebyscore(METRICS_WORKERS_KEY, time.time() - METRICS_TTL_SECONDS, "+inf")
+        if worker_id != WORKER_ID
+    ]
+    if worker_ids:
+        for worker_id, published in zip(worker_ids, await redis_connection.mget([f"metricas:{w}" for w in worker_ids])):
+            if published:
+                collected.append(({"worker": worker_id[:8]}, json.loads(published)))
+    collected.append(({}, await collect_queue_depths()))
+    return collected
+
+async def publish_invalidation(tipo: str, chave: str):
+    """Descarta 'chave' do cache 'tipo' neste worker e avisa os demais pelo canal de invalidação."""
+    handler = invalidation_handlers.get(tipo)
+    if handler:
+        handler(chave)
+    try:
+        await redis_connection.publish(INVALIDATION_CHANNEL, json.dumps({"tipo": tipo, "chave": chave, "worker": WORKER_ID}))
+    except redis_errors.ConnectionError as e:
+        print(f"AVISO: Não foi possível avisar os outros workers da invalidação '{tipo}:{chave}': {e}")
+
+def handle_invalidation(data: bytes):
+    try:
+        message = json.loads(data)
+    except (TypeError, ValueError):
+        print(f"AVISO: Mensagem inválida no canal de invalidação: {data!r}")
+        return
+    if message.get("worker") == WORKER_ID:
+        return
+    handler = invalidation_handlers.get(message.get("tipo"))
+    if handler:
+        handler(message.get("chave"))
+
+async def reply_listener():
+    """Tarefa de fundo (uma por worker) que recebe as respostas publicadas para este worker e as invalidações de cache."""
+    # Conexão sem decode_responses: as respostas são repassadas como o agente mandou (texto ou binário)
+    replies_connection = redis.from_url(REDIS_URL)
+    while True:
+        pubsub = replies_connection.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(REPLY_CHANNEL, INVALIDATION_CHANNEL)
+            print(f"INFO: Worker inscrito no canal de respostas '{REPLY_CHANNEL}'.")
+            # Invalidações publicadas enquanto o canal esteve fora se perderam: descarta os caches inteiros
+            for handler in invalidation_handlers.values():
+                handler(None)
+            async for item in pubsub.listen():
+                if item.get("type") != "message":
+                    continue
+                if item.get("channel") == INVALIDATION_CHANNEL.encode():
+                    handle_invalidation(item["data"])
+                    continue
+                try:
+                    message = decodificar_quadro(item["data"])
+                except (TypeError, ValueError):
+                    print(f"AVISO: Mensagem inválida no canal de respostas: {item['data']!r}")
+                    continue
+                if message.get("tipo") in ("credito", "cancelar"):
+                    await forward_agent_control(message)
+                    continue
+                resolve_local_task(message.get("id_tarefa"), message)
+        except asyncio.CancelledError:
+            break
+        except redis_errors.ConnectionError as e:
+            print(f"AVISO: Conexão do canal de respostas com Redis perdida: {e}. Tentando reconectar...")
+            await asyncio.sleep(5)
+        except Exception as e:
+            print(f"ERRO CRÍTICO no canal de respostas '{REPLY_CHANNEL}': {e}. Tentando reconectar...")
+            await asyncio.sleep(5)
+        finally:
+            await pubsub.close()
+    await replies_connection.close()
+
+
+# Definida antes da importação dos routers: routers/agents_status.py a importa de main_api
+async def list_connected_agents() -> List[Dict[str, Any]]:
+    """Lista os agentes com presença ativa, com último heartbeat e latência da última resposta."""
+    company_ids = await redis_connection.zrange(ONLINE_AGENTS_KEY, 0, -1)
+    if not company_ids:
+        return []
+    async with redis_connection.pipeline(transaction=False) as pipe:
+        for company_id in company_ids:
+            pipe.hgetall(agent_presence_key(company_id))
+            for prioridade in PRIORIDADES:
+                pipe.xlen(agent_stream_key(company_id, prioridade))
+        replies = await pipe.execute()
+    step = 1 + len(PRIORIDADES)
+    presences = replies[::step]
+    queue_depths = [dict(zip(PRIORIDADES, replies[i + 1:i + step])) for i in range(0, len(replies), step)]
+
+    agents, expired = [], []
+    for company_id, presence, depths in zip(company_ids, presences, queue_depths):
+        if not presence:
+            expired.append(company_id)
+            continue
+        agents.append({
+            "company_id": company_id,
+            "worker": presence.get("worker"),
+            "conectado_em": float(presence.get("conectado_em") or 0) or None,
+            "ultimo_heartbeat": float(presence.get("ultimo_heartbeat") or 0) or None,
+            "latencia_ms": float(presence["latencia_ms"]) if presence.get("latencia_ms") else None,
+            "capacidades": [c for c in (presence.get("capacidades") or "").split(",") if c],
+            "fila": depths,
+            "cache": await get_cache_stats(company_id),
+        })
+    if expired:
+        await redis_connection.zrem(ONLINE_AGENTS_KEY, *expired)
+    return agents
 
 
 # --- IMPORTAÇÃO DOS ROTEADORES ---
@@ -71,6 +1102,8 @@ from routers import (
     user_data, settings_panel, admin_tools, metas_panel,
     company_data,
     proactive_alerts,
+    agents_status,
+    metrics,
     text_to_speech  # Garante que o router de tts seja incluído
 )
 
@@ -80,10 +1113,14 @@ async def lifespan(app: FastAPI):
     global redis_connection
     
     redis_connection = redis.from_url(REDIS_URL, decode_responses=True)
+    reply_listener_task = stream_listener_task = metrics_task = mirror_task = None
     
     try:
         await redis_connection.ping()
         print("INFO: Conexão com Redis estabelecida e verificada com sucesso.")
+        reply_listener_task = asyncio.create_task(reply_listener())
+        stream_listener_task = asyncio.create_task(redis_listener())
+        metrics_task = asyncio.create_task(publish_metrics())
             
         cred = credentials.Certificate("firebase-service-account.json")
         if not firebase_admin._apps:
@@ -92,37 +1129,322 @@ async def lifespan(app: FastAPI):
                 # O storageBucket não é necessário na versão do Render
             })
             print("INFO: Firebase Admin SDK inicializado com sucesso.")
+        # Espelho de /empresas e /usuarios: a carga inicial chega em segundo plano
+        await asyncio.to_thread(espelho_firebase.iniciar)
+        mirror_task = asyncio.create_task(espelho_firebase.vigiar())
+        # Pool de conexões HTTP (keep-alive) para a API do Gemini
+        cliente_http.iniciar()
         
         print("INFO: Aplicação iniciada e pronta para receber conexões.")
         yield
         
     finally:
         print("INFO: Encerrando a aplicação...")
+        for background_task in (reply_listener_task, stream_listener_task, metrics_task, mirror_task):
+            if background_task:
+                background_task.cancel()
+        espelho_firebase.parar()
+        firebase_async.encerrar()
+        await cliente_http.encerrar()
         if redis_connection:
             await redis_connection.close()
             print("INFO: Conexão com Redis fechada.")
 
-app = FastAPI(title="Dashboard API", lifespan=lifespan)
+app = FastAPI(title="Dashboard API", lifespan=lifespan, dependencies=[Depends(prioridade_do_cabecalho)])
 
 # --- WebSocket Endpoint atualizado para usar o listener do Redis ---
 
-async def redis_listener(websocket: WebSocket, company_id: str):
-    """Uma tarefa de fundo que escuta a fila do Redis e envia para o agente."""
-    print(f"INFO: Listener da fila 'queue:{company_id}' iniciado.")
-    
+async def ensure_consumer_group(company_id: str):
+    for prioridade in PRIORIDADES:
+        try:
+            # id='0' para que comandos enfileirados antes do primeiro contato do agente também sejam entregues
+            await redis_connection.xgroup_create(agent_stream_key(company_id, prioridade), AGENT_STREAM_GROUP, id="0", mkstream=True)
+        except redis_errors.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+def count_in_flight(company_id: str) -> int:
+    # Entregas muito antigas (agente que nunca respondeu) deixam de ocupar a janela
+    oldest = time.monotonic() - 2 * AGENT_TIMEOUT_SECONDS
+    return sum(1 for delivery in pending_deliveries.values() if delivery[0] == company_id and delivery[3] > oldest)
+
+def buffer_entries(company_id: str, stream_key: str, lane: int, entries: List[Tuple[str, Dict[str, str]]]):
+    """Coloca as entradas lidas no buffer da empresa com a etiqueta de início do fair queueing."""
+    buffer = dispatch_buffers.setdefault(company_id, [])
+    finish_tags = fair_queue_finish_tags.setdefault(company_id, {})
+    virtual_time = fair_queue_clocks.get(company_id, 0.0)
+    for entry_id, fields in entries:
+        user = (fields or {}).get("usuario") or ""
+        start_tag = max(virtual_time, finish_tags.get(user, 0.0))
+        finish_tags[user] = start_tag + FAIR_QUEUE_LANE_COSTS[lane]
+        buffer.append((lane, start_tag, entry_id, stream_key, fields))
+
+def pick_next_entry(buffer: List[Tuple[int, float, str, str, Dict[str, str]]]) -> int:
+    """
+    Posição do próximo comando: menor faixa efetiva (faixa menos o envelhecimento); na mesma
+    faixa, a menor etiqueta de início (justiça entre usuários) e, no empate, o mais antigo.
+    """
+    now_ms = time.time() * 1000
+
+    def score(item):
+        lane, start_tag, entry_id, _stream_key, _fields = item
+        enqueued_ms = int(entry_id.split("-")[0])
+        aging = int(max(0.0, now_ms - enqueued_ms) / 1000 // PRIORITY_AGING_SECONDS)
+        return (lane - aging, start_tag, enqueued_ms)
+
+    return min(range(len(buffer)), key=lambda position: score(buffer[position]))
+
+async def drain_dispatch_buffer(company_id: str):
+    """Entrega comandos do buffer enquanto houver vaga na janela do agente."""
+    lock = dispatch_locks.setdefault(company_id, asyncio.Lock())
+    async with lock:
+        buffer = dispatch_buffers.get(company_id)
+        while buffer and company_id in connected_agents and count_in_flight(company_id) < AGENT_DISPATCH_WINDOW:
+            _lane, start_tag, entry_id, stream_key, fields = buffer.pop(pick_next_entry(buffer))
+            fair_queue_clocks[company_id] = max(fair_queue_clocks.get(company_id, 0.0), start_tag)
+            await dispatch_stream_entry(company_id, stream_key, entry_id, fields)
+        if not buffer:
+            # Fila vazia: o tempo virtual recomeça, ninguém carrega "dívida" para a próxima rajada
+            fair_queue_clocks.pop(company_id, None)
+            fair_queue_finish_tags.pop(company_id, None)
+
+async def dispatch_stream_entry(company_id: str, stream_key: str, entry_id: str, fields: Dict[str, str]):
+    websocket = connected_agents.get(company_id)
+    # Entradas já removidas pelo XTRIM continuam na lista de pendentes, mas sem campos
+    payload_str = (fields or {}).get("payload")
+    if not payload_str:
+        await acknowledge_entry(stream_key, entry_id)
+        return
+    if websocket is None:
+        # O agente desconectou depois da leitura: a entrada continua pendente e volta na reconexão.
+        return
+    payload = json.loads(payload_str)
+    task_id = payload.get("id_tarefa")
+    if payload.get("expira_em", float("inf")) < time.time():
+        # Quem pediu já desistiu (timeout): não vale a pena ocupar o agente com esse comando.
+        print(f"AVISO: Comando '{task_id}' para '{company_id}' expirou na fila e foi descartado.")
+        await acknowledge_entry(stream_key, entry_id)
+        return
+    if task_id and await redis_connection.exists(f"cancelado:{task_id}"):
+        print(f"INFO: Comando '{task_id}' para '{company_id}' foi cancelado antes da entrega e foi descartado.")
+        await acknowledge_entry(stream_key, entry_id)
+        return
+    statement_label = command_metric_label(payload.get("acao"), payload.get("parametros"))
+    enqueued_ms = int(entry_id.split("-")[0])
+    AGENT_QUEUE_WAIT.observe(
+        max(0.0, time.time() - enqueued_ms / 1000),
+        empresa=company_id, faixa=stream_priority(stream_key), statement=statement_label
+    )
+    traceparent = payload.get("traceparent")
+    if traceparent:
+        registrar_span("redis.fila", traceparent, enqueued_ms * 1_000_000, time.time_ns(), empresa=company_id, faixa=stream_priority(stream_key), id_tarefa=task_id)
+    if "statements" not in agent_capabilities.get(company_id, ()):
+        try:
+            payload_str = await expand_statements(payload)
+        except LookupError as e:
+            print(f"ERRO: Comando '{task_id}' para '{company_id}' descartado: {e}")
+            await fail_stream_entry(stream_key, entry_id, task_id, "O texto da consulta não está mais disponível no servidor. Tente novamente.")
+            return
+    if task_id:
+        pending_deliveries[task_id] = (company_id, stream_key, entry_id, time.monotonic(), statement_label, traceparent)
+    try:
+        await websocket.send_text(payload_str)
+    except Exception as e:
+        print(f"AVISO: Falha ao enviar comando '{task_id}' ao agente '{company_id}': {e}. Será reenviado na reconexão.")
+
+async def expand_statements(payload: Dict[str, Any]) -> str:
+    """
+    Troca os ids de statement pelo SQL completo, para agentes que não suportam statements.
+    Levanta LookupError se o texto de algum statement não estiver mais no Redis (expirou).
+    """
+    parametros = payload.get("parametros") or {}
+    consultas = parametros.get("consultas", []) if payload.get("acao") == "query_batch" else [parametros]
+    for consulta in consultas:
+        statement_id = consulta.pop("statement_id", None)
+        if statement_id:
+            sql = await get_statement_sql(statement_id)
+            if sql is None:
+                raise LookupError(f"Statement '{statement_id}' não encontrado.")
+            consulta["sql"] = sql
+    return json.dumps(payload, default=json_converter)
+
+async def handle_agent_message(websocket: WebSocket, company_id: str, message: Dict[str, Any]):
+    """Trata mensagens iniciadas pelo agente (sem id_tarefa): anúncio de capacidades e pedido de statements."""
+    tipo = message.get("tipo")
+    if tipo == "hello":
+        capabilities = set(message.get("capacidades") or [])
+        agent_capabilities[company_id] = capabilities
+        await redis_connection.hset(agent_presence_key(company_id), "capacidades", ",".join(sorted(capabilities)))
+        # Informa os formatos de resultado que este servidor entende; o agente escolhe entre eles
+        await websocket.send_text(json.dumps({"tipo": "hello_ack", "formatos": FORMATOS_SUPORTADOS}))
+        print(f"INFO: Agente '{company_id}' anunciou as capacidades: {sorted(capabilities)}.")
+    elif tipo == "obter_statement":
+        statement_id = message.get("statement_id")
+        sql = await get_statement_sql(statement_id) if statement_id else None
+        await websocket.send_text(json.dumps({"tipo": "statement", "statement_id": statement_id, "sql": sql}))
+    else:
+        print(f"AVISO: Mensagem do agente '{company_id}' não reconhecida: {message!r}")
+
+async def acknowledge_entry(stream_key: str, entry_id: str):
+    async with redis_connection.pipeline(transaction=False) as pipe:
+        pipe.xack(stream_key, AGENT_STREAM_GROUP, entry_id)
+        pipe.xdel(stream_key, entry_id)
+        await pipe.execute()
+
+async def acknowledge_task(task_id: str, message: Optional[Dict[str, Any]] = None):
+    delivery = pending_deliveries.pop(task_id, None)
+    if delivery:
+        company_id, stream_key, entry_id, sent_at, statement_label, traceparent = delivery
+        elapsed = time.monotonic() - sent_at
+        AGENT_EXECUTION_TIME.observe(elapsed, empresa=company_id, statement=statement_label)
+        if traceparent:
+            # Tempos informados pelo agente (ex.: fila_ms, execucao_ms, leitura_ms, serializacao_ms)
+            agent_timings = {f"agente.{nome}": valor for nome, valor in ((message or {}).get("tempos") or {}).items()}
+            now_ns = time.time_ns()
+            registrar_span(
+                "agente.execucao", traceparent, now_ns - int(elapsed * 1e9), now_ns,
+                empresa=company_id, statement=statement_label, id_tarefa=task_id, **agent_timings
+            )
+        try:
+            async with redis_connection.pipeline(transaction=False) as pipe:
+                pipe.xack(stream_key, AGENT_STREAM_GROUP, entry_id)
+                pipe.xdel(stream_key, entry_id)
+                pipe.hset(agent_presence_key(company_id), mapping={
+                    "ultimo_heartbeat": time.time(),
+                    "latencia_ms": round((time.monotonic() - sent_at) * 1000, 1),
+                })
+                await pipe.execute()
+        except redis_errors.ConnectionError as e:
+            # Sem o ack a entrada será reenviada na próxima conexão do agente.
+            print(f"AVISO: Não foi possível confirmar a tarefa '{task_id}' no Redis: {e}")
+        # Abriu uma vaga na janela do agente: entrega o próximo comando mais urgente
+        await drain_dispatch_buffer(company_id)
+
+async def refresh_agent_presence(company_id: str, connected_at: float = None):
+    now = time.time()
+    fields = {"worker": WORKER_ID, "ultimo_heartbeat": now}
+    if connected_at is not None:
+        fields["conectado_em"] = connected_at
+    async with redis_connection.pipeline(transaction=False) as pipe:
+        pipe.hset(agent_presence_key(company_id), mapping=fields)
+        pipe.expire(agent_presence_key(company_id), AGENT_PRESENCE_TTL_SECONDS)
+        pipe.zadd(ONLINE_AGENTS_KEY, {company_id: now})
+        await pipe.execute()
+
+async def agent_heartbeat(company_id: str):
+    """Renova a presença do agente enquanto o WebSocket estiver aberto."""
     while True:
         try:
-            # blpop espera uma mensagem na fila de forma eficiente
-            message = await redis_connection.blpop(f"queue:{company_id}", timeout=240)
-            if message:
-                await websocket.send_text(message[1])
+            await asyncio.sleep(AGENT_HEARTBEAT_SECONDS)
+            await refresh_agent_presence(company_id)
         except asyncio.CancelledError:
             break
-        except redis.exceptions.ConnectionError as e:
+        except Exception as e:
+            print(f"AVISO: Falha ao renovar a presença do agente '{company_id}': {e}")
+
+async def is_read_only_payload(payload: Dict[str, Any]) -> bool:
+    """is_read_only_command para um comando lido do stream (statements de outro worker vêm do Redis)."""
+    acao, parametros = payload.get("acao"), payload.get("parametros") or {}
+    consultas = parametros.get("consultas", []) if acao == "query_batch" else [parametros]
+    resolvidas = []
+    for consulta in consultas:
+        if "statement_id" in consulta:
+            consulta = {**consulta, "sql": await get_statement_sql(consulta["statement_id"]) or ""}
+            consulta.pop("statement_id")
+        resolvidas.append(consulta)
+    return is_read_only_command(acao, {"consultas": resolvidas} if acao == "query_batch" else (resolvidas or [{}])[0])
+
+async def fail_stream_entry(stream_key: str, entry_id: str, task_id: Optional[str], mensagem: str):
+    """Tira a entrada da fila sem entregá-la ao agente e devolve o erro a quem pediu."""
+    await acknowledge_entry(stream_key, entry_id)
+    if task_id:
+        message = {"id_tarefa": task_id, "status": "erro", "mensagem": mensagem}
+        await deliver_agent_reply(task_id, message, json.dumps(message))
+
+async def fail_pending_write(company_id: str, stream_key: str, entry_id: str, payload: Dict[str, Any]):
+    """
+    Gravação lida antes da queda do agente: pode ter sido executada ou não, e repetir não é seguro
+    (ex.: salvar_historico acrescentaria as mensagens de novo). Sai da fila e quem pediu recebe erro.
+    """
+    task_id = payload.get("id_tarefa")
+    print(f"AVISO: Comando '{payload.get('acao')}' ('{task_id}') de '{company_id}' não será reenviado após a reconexão (não é somente leitura).")
+    await fail_stream_entry(
+        stream_key, entry_id, task_id,
+        "A conexão com o agente caiu antes da confirmação desta gravação. Confira se ela foi aplicada antes de repetir."
+    )
+
+async def redeliver_pending_entries(company_id: str):
+    """
+    Reenvia ao agente que acabou de conectar as consultas lidas antes e nunca respondidas.
+    A entrega é "pelo menos uma vez": só comandos somente leitura são repetidos, as gravações
+    pendentes voltam como erro para quem pediu.
+    """
+    lanes = {agent_stream_key(company_id, prioridade): lane for lane, prioridade in enumerate(PRIORIDADES)}
+    response = await redis_connection.xreadgroup(
+        AGENT_STREAM_GROUP, AGENT_STREAM_CONSUMER, {stream_key: "0" for stream_key in lanes}
+    )
+    for stream_key, entries in response or []:
+        redeliverable = []
+        for entry_id, fields in entries:
+            payload_str = (fields or {}).get("payload")
+            # Entradas sem campos (removidas pelo XTRIM) seguem para o dispatch, que as confirma
+            payload = json.loads(payload_str) if payload_str else None
+            if payload is not None and not await is_read_only_payload(payload):
+                await fail_pending_write(company_id, stream_key, entry_id, payload)
+            else:
+                redeliverable.append((entry_id, fields))
+        if redeliverable:
+            print(f"INFO: Reenviando {len(redeliverable)} comando(s) pendente(s) de '{stream_key}' para o agente '{company_id}'.")
+        buffer_entries(company_id, stream_key, lanes[stream_key], redeliverable)
+    await drain_dispatch_buffer(company_id)
+
+async def redis_listener():
+    """
+    Tarefa de fundo (uma por worker) que lê, com um único XREADGROUP bloqueante,
+    os streams (todas as faixas) das empresas cujo agente está conectado a este worker.
+    O que é lido vai para o buffer da empresa e é entregue conforme a janela e a prioridade.
+    """
+    print("INFO: Listener dos streams de comandos iniciado.")
+
+    while True:
+        try:
+            if not connected_agents:
+                await asyncio.sleep(0.5)
+                continue
+            # Empresas com o buffer cheio só voltam a ser lidas quando o agente liberar vagas
+            owners = {
+                agent_stream_key(company_id, prioridade): (company_id, lane)
+                for company_id in connected_agents
+                if len(dispatch_buffers.get(company_id, ())) < DISPATCH_BUFFER_MAX
+                for lane, prioridade in enumerate(PRIORIDADES)
+            }
+            if not owners:
+                await asyncio.sleep(0.1)
+                continue
+            response = await redis_connection.xreadgroup(
+                AGENT_STREAM_GROUP, AGENT_STREAM_CONSUMER, {stream_key: ">" for stream_key in owners},
+                count=DISPATCH_BUFFER_MAX, block=1000
+            )
+            for stream_key, entries in response or []:
+                company_id, lane = owners[stream_key]
+                buffer_entries(company_id, stream_key, lane, entries)
+            for company_id in list(dispatch_buffers):
+                await drain_dispatch_buffer(company_id)
+        except asyncio.CancelledError:
+            break
+        except redis_errors.ResponseError as e:
+            if "NOGROUP" in str(e):
+                # O stream foi removido; recria os grupos das empresas conectadas.
+                for company_id in list(connected_agents):
+                    await ensure_consumer_group(company_id)
+                continue
+            print(f"ERRO CRÍTICO no listener dos streams: {e}. Tentando novamente...")
+            await asyncio.sleep(5)
+        except redis_errors.ConnectionError as e:
             print(f"AVISO: Conexão do listener com Redis perdida: {e}. Tentando reconectar...")
             await asyncio.sleep(5)
         except Exception as e:
-            print(f"ERRO CRÍTICO no listener do Redis para '{company_id}': {e}. Tentando reconectar...")
+            print(f"ERRO CRÍTICO no listener dos streams: {e}. Tentando reconectar...")
             await asyncio.sleep(5)
 
 @app.websocket("/ws/{company_id}")
@@ -130,34 +1452,65 @@ async def websocket_endpoint(websocket: WebSocket, company_id: str):
     await websocket.accept()
     print(f"INFO: Agente da empresa '{company_id}' conectou.")
     
-    # Inicia a tarefa que escuta o Redis
-    listener_task = asyncio.create_task(redis_listener(websocket, company_id))
+    # Registra o agente para o listener deste worker e reenvia o que ficou sem resposta
+    await ensure_consumer_group(company_id)
+    await refresh_agent_presence(company_id, connected_at=time.time())
+    connected_agents[company_id] = websocket
+    heartbeat_task = asyncio.create_task(agent_heartbeat(company_id))
+    await redeliver_pending_entries(company_id)
     
     try:
         # Loop principal para receber as respostas do agente
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            data = frame.get("bytes") if frame.get("bytes") is not None else frame.get("text")
+            message = decodificar_quadro(data)
             
             task_id = message.get("id_tarefa")
-            if task_id and task_id in tasks:
-                future = tasks.pop(task_id)
-                if not future.done():
-                    future.set_result(message)
-                else:
-                    print(f"AVISO: Resultado para tarefa '{task_id}' chegou atrasado (após timeout).")
+            if task_id and "seq" in message:
+                # Parte de um resultado em streaming ('query_stream')
+                await deliver_stream_chunk(company_id, task_id, message, data)
+            elif task_id:
+                await acknowledge_task(task_id, message)
+                # A tarefa pode ter sido criada por outro worker: a entrega segue a rota registrada no Redis.
+                await deliver_agent_reply(task_id, message, data)
+            elif message.get("tipo"):
+                await handle_agent_message(websocket, company_id, message)
             else:
                 print(f"AVISO: Recebida resposta para tarefa desconhecida ou expirada: '{task_id}'.")
                 
     except WebSocketDisconnect:
         print(f"INFO: Agente da empresa '{company_id}' desconectou.")
     finally:
-        # Cancela a tarefa do listener quando o agente desconecta
-        listener_task.cancel()
+        # As entregas sem resposta continuam pendentes no stream e serão reenviadas na reconexão
+        heartbeat_task.cancel()
+        if connected_agents.get(company_id) is websocket:
+            connected_agents.pop(company_id, None)
+            agent_capabilities.pop(company_id, None)
+            try:
+                await redis_connection.eval(CLEAR_PRESENCE_SCRIPT, 2, agent_presence_key(company_id), ONLINE_AGENTS_KEY, WORKER_ID, company_id)
+            except redis_errors.ConnectionError as e:
+                print(f"AVISO: Não foi possível remover a presença do agente '{company_id}': {e}")
+        for task_id, delivery in list(pending_deliveries.items()):
+            if delivery[0] == company_id:
+                pending_deliveries.pop(task_id, None)
+        # O que estava no buffer continua pendente no stream e volta na reconexão
+        dispatch_buffers.pop(company_id, None)
+        fair_queue_clocks.pop(company_id, None)
+        fair_queue_finish_tags.pop(company_id, None)
+        for task_id, (stream_company, _routes) in list(stream_routes.items()):
+            if stream_company == company_id:
+                stream_routes.pop(task_id, None)
         print(f"INFO: Listener da fila para '{company_id}' finalizado.")
 
 # O restante do arquivo permanece igual
+app.add_middleware(CancelarAoDesconectar)
+app.add_middleware(MarcarRespostaDesatualizada)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(MedirRequisicoes)
+app.add_middleware(RastrearRequisicoes)
 
 # Inclui todos os routers da sua versão local
 app.include_router(dashboard_main.router)
@@ -170,6 +1523,8 @@ app.include_router(admin_tools.router)
 app.include_router(metas_panel.router)
 app.include_router(company_data.router)
 app.include_router(proactive_alerts.router)
+app.include_router(agents_status.router)
+app.include_router(metrics.router)
 app.include_router(text_to_speech.router)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
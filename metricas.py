@@ -0,0 +1,173 @@
+# metricas.py
+import abc
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Métricas em memória (por worker) no formato de exposição de texto do Prometheus.
+# Cada worker agrega os próprios números; o endpoint /metrics junta as amostras de todos
+# os workers (publicadas no Redis) acrescentando o rótulo 'worker'.
+
+BUCKETS_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Amostra: (sufixo do nome, rótulos, valor)
+Amostra = Tuple[str, Dict[str, str], float]
+
+class Metrica(abc.ABC):
+    tipo = ""
+
+    def __init__(self, nome: str, descricao: str, rotulos: Iterable[str] = ()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+        REGISTRO.append(self)
+
+    def _chave(self, valores: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(valores.get(rotulo, "")) for rotulo in self.rotulos)
+
+    @abc.abstractmethod
+    def amostras(self) -> List[Amostra]:
+        ...
+
+class Contador(Metrica):
+    tipo = "counter"
+
+    def __init__(self, nome: str, descricao: str, rotulos: Iterable[str] = ()):
+        super().__init__(nome, descricao, rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, valor: float = 1.0, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0.0) + valor
+
+    def amostras(self) -> List[Amostra]:
+        with self._lock:
+            return [("_total", dict(zip(self.rotulos, chave)), valor) for chave, valor in self._valores.items()]
+
+class Medidor(Metrica):
+    """Gauge: valor definido diretamente ou lido na hora da coleta por uma função."""
+    tipo = "gauge"
+
+    def __init__(self, nome: str, descricao: str, rotulos: Iterable[str] = (), funcao: Optional[Callable[[], float]] = None):
+        super().__init__(nome, descricao, rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+        self._funcao = funcao
+
+    def set(self, valor: float, **rotulos):
+        with self._lock:
+            self._valores[self._chave(rotulos)] = valor
+
+    def amostras(self) -> List[Amostra]:
+        if self._funcao is not None:
+            return [("", {}, float(self._funcao()))]
+        with self._lock:
+            return [("", dict(zip(self.rotulos, chave)), valor) for chave, valor in self._valores.items()]
+
+class Histograma(Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome: str, descricao: str, rotulos: Iterable[str] = (), buckets: Tuple[float, ...] = BUCKETS_PADRAO):
+        super().__init__(nome, descricao, rotulos)
+        self.buckets = tuple(sorted(buckets))
+        # chave -> [contagem por bucket (não acumulada) + 1 para +Inf, soma]
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = ([0] * (len(self.buckets) + 1), [0.0])
+            serie[0][bisect.bisect_left(self.buckets, valor)] += 1
+            serie[1][0] += valor
+
+    def amostras(self) -> List[Amostra]:
+        resultado: List[Amostra] = []
+        with self._lock:
+            for chave, (contagens, soma) in self._series.items():
+                rotulos = dict(zip(self.rotulos, chave))
+                acumulado = 0
+                for limite, contagem in zip(self.buckets + (float("inf"),), contagens):
+                    acumulado += contagem
+                    resultado.append(("_bucket", {**rotulos, "le": _formatar_valor(limite)}, acumulado))
+                resultado.append(("_count", rotulos, acumulado))
+                resultado.append(("_sum", rotulos, soma[0]))
+        return resultado
+
+REGISTRO: List[Metrica] = []
+
+def coletar() -> List[Dict]:
+    """Estado atual de todas as métricas deste worker, em formato serializável (JSON)."""
+    return [
+        {"nome": metrica.nome, "tipo": metrica.tipo, "descricao": metrica.descricao, "amostras": metrica.amostras()}
+        for metrica in REGISTRO
+    ]
+
+def _formatar_valor(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    valor = float(valor)
+    return str(int(valor)) if valor.is_integer() and abs(valor) < 1e15 else repr(valor)
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def gerar_exposicao(coletas: Iterable[Tuple[Dict[str, str], List[Dict]]]) -> str:
+    """
+    Junta as coletas de vários workers ((rótulos extras, coleta)) em um único texto no formato
+    do Prometheus, com HELP/TYPE uma vez por métrica.
+    """
+    metricas: Dict[str, Dict] = {}
+    for rotulos_extras, coleta in coletas:
+        for metrica in coleta:
+            agregada = metricas.setdefault(metrica["nome"], {"tipo": metrica["tipo"], "descricao": metrica["descricao"], "linhas": []})
+            for sufixo, rotulos, valor in metrica["amostras"]:
+                todos = {**rotulos_extras, **rotulos}
+                texto_rotulos = ",".join(f'{nome}="{_escapar(v)}"' for nome, v in todos.items())
+                agregada["linhas"].append(f"{metrica['nome']}{sufixo}{{{texto_rotulos}}} {_formatar_valor(valor)}")
+
+    linhas = []
+    for nome, metrica in metricas.items():
+        linhas.append(f"# HELP {nome} {metrica['descricao']}")
+        linhas.append(f"# TYPE {nome} {metrica['tipo']}")
+        linhas.extend(metrica["linhas"])
+    return "\n".join(linhas) + "\n"
+
+HTTP_LATENCIA = Histograma("http_requisicao_segundos", "Latência das requisições HTTP por rota.", ("rota", "metodo", "status"))
+
+class MedirRequisicoes:
+    """
+    Middleware ASGI que mede a latência de cada requisição HTTP. O rótulo 'rota' é o caminho
+    declarado no router (ex.: '/dashboard/vendas/{ano}'), não a URL, para limitar o número de séries.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        # Sem resposta iniciada: o cliente desconectou antes (499, como no nginx)
+        status = 499
+
+        async def send_com_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_com_status)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            # O FastAPI guarda em scope['route'] a rota que atendeu a requisição
+            rota = getattr(scope.get("route"), "path", None) or "nao_roteada"
+            HTTP_LATENCIA.observe(time.perf_counter() - inicio, rota=rota, metodo=scope.get("method", ""), status=str(status))
\ No newline at end of file
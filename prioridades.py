@@ -0,0 +1,30 @@
+# prioridades.py
+from contextvars import ContextVar
+from starlette.requests import HTTPConnection
+
+# Faixas de prioridade dos comandos enviados ao agente, da mais urgente para a menos urgente:
+#   interativa  - cliques no dashboard (padrão)
+#   atualizacao - atualizações automáticas em segundo plano (Modo TV)
+#   pesada      - consultas longas: IA, exportações, históricos com muitas consultas
+PRIORIDADES = ("interativa", "atualizacao", "pesada")
+PRIORIDADE_PADRAO = "interativa"
+
+# Prioridade da requisição em andamento; lida por send_command_to_agent ao enfileirar
+prioridade_atual: ContextVar[str] = ContextVar("prioridade_atual", default=PRIORIDADE_PADRAO)
+# Usuário da requisição em andamento; usado pelo fair queueing entre usuários da mesma empresa
+usuario_atual: ContextVar[str] = ContextVar("usuario_atual", default="")
+
+async def prioridade_do_cabecalho(conexao: HTTPConnection):
+    """
+    Dependência global: o front-end pode rebaixar a requisição com o cabeçalho 'X-Prioridade'.
+    Recebe HTTPConnection porque também roda no WebSocket do agente, onde não há Request.
+    """
+    prioridade = conexao.headers.get("X-Prioridade")
+    if prioridade in PRIORIDADES:
+        prioridade_atual.set(prioridade)
+
+def usar_prioridade(prioridade: str):
+    """Dependência para routers/endpoints cujas consultas devem ir sempre para uma faixa específica."""
+    async def definir_prioridade():
+        prioridade_atual.set(prioridade)
+    return definir_prioridade
\ No newline at end of file
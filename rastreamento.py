@@ -0,0 +1,193 @@
+# rastreamento.py
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+# Rastreamento (tracing) de ponta a ponta: requisição HTTP -> autenticação no Firebase -> fila do
+# Redis -> agente (Firebird) -> Gemini. Cada requisição tem um trace id (W3C 'traceparent'),
+# que vai no payload do agente junto com o id_tarefa; o agente devolve os próprios tempos na
+# resposta ('tempos': {"fila_ms", "execucao_ms", ...}). Os spans são gravados em
+# TRACE_EXPORT_FILE, uma linha por requisição no formato OTLP/JSON, que o OpenTelemetry
+# Collector lê com o receiver 'otlpjsonfile'. Sem a variável, o rastreamento fica desligado.
+
+TRACE_EXPORT_FILE = os.environ.get("TRACE_EXPORT_FILE")
+SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "dashboard-api")
+
+# Códigos de status do OTLP
+STATUS_OK = 1
+STATUS_ERRO = 2
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "nome", "inicio_ns", "fim_ns", "atributos", "erro")
+
+    def __init__(self, nome: str, trace_id: str, parent_id: Optional[str], atributos: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.nome = nome
+        self.inicio_ns = time.time_ns()
+        self.fim_ns = 0
+        self.atributos = atributos
+        self.erro: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, chave: str, valor: Any):
+        self.atributos[chave] = valor
+
+    def para_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.nome,
+            "kind": 1,
+            "startTimeUnixNano": str(self.inicio_ns),
+            "endTimeUnixNano": str(self.fim_ns or time.time_ns()),
+            "attributes": [_atributo_otlp(chave, valor) for chave, valor in self.atributos.items() if valor is not None],
+            "status": {"code": STATUS_ERRO, "message": self.erro} if self.erro else {"code": STATUS_OK},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+def _atributo_otlp(chave: str, valor: Any) -> Dict[str, Any]:
+    if isinstance(valor, bool):
+        return {"key": chave, "value": {"boolValue": valor}}
+    if isinstance(valor, int):
+        return {"key": chave, "value": {"intValue": str(valor)}}
+    if isinstance(valor, float):
+        return {"key": chave, "value": {"doubleValue": valor}}
+    return {"key": chave, "value": {"stringValue": str(valor)}}
+
+# Spans da requisição em andamento (a lista é compartilhada com as tarefas filhas, ex.: asyncio.gather)
+_spans_requisicao: ContextVar[Optional[List[Span]]] = ContextVar("_spans_requisicao", default=None)
+_span_atual: ContextVar[Optional[Span]] = ContextVar("_span_atual", default=None)
+
+@contextmanager
+def span(nome: str, **atributos):
+    """Mede um trecho da requisição atual. Fora de uma requisição rastreada não faz nada (devolve None)."""
+    spans = _spans_requisicao.get()
+    pai = _span_atual.get()
+    if spans is None or pai is None:
+        yield None
+        return
+    atual = Span(nome, pai.trace_id, pai.span_id, atributos)
+    spans.append(atual)
+    token = _span_atual.set(atual)
+    try:
+        yield atual
+    except BaseException as e:
+        atual.erro = f"{type(e).__name__}: {getattr(e, 'detail', e)}"
+        raise
+    finally:
+        atual.fim_ns = time.time_ns()
+        _span_atual.reset(token)
+
+def traceparent_atual() -> Optional[str]:
+    """'traceparent' do span atual, para mandar ao agente junto com o comando."""
+    atual = _span_atual.get()
+    return atual.traceparent if atual is not None and _spans_requisicao.get() is not None else None
+
+def registrar_span(nome: str, traceparent: str, inicio_ns: int, fim_ns: int, **atributos):
+    """
+    Grava um span avulso de um trace iniciado em outro lugar (ex.: o worker que entregou o
+    comando ao agente não é, em geral, o worker que atende a requisição). Devolve o span.
+    """
+    partes = traceparent.split("-") if traceparent else []
+    if not TRACE_EXPORT_FILE or len(partes) != 4:
+        return None
+    novo = Span(nome, partes[1], partes[2], atributos)
+    novo.inicio_ns, novo.fim_ns = inicio_ns, fim_ns
+    exportar([novo])
+    return novo
+
+def _ler_traceparent(valor: Optional[str]):
+    partes = (valor or "").split("-")
+    if len(partes) == 4 and len(partes[1]) == 32 and len(partes[2]) == 16:
+        return partes[1], partes[2]
+    return secrets.token_hex(16), None
+
+# --- EXPORTAÇÃO ---
+# A escrita no arquivo fica numa thread própria para não bloquear o event loop.
+_fila_exportacao: "queue.SimpleQueue[str]" = queue.SimpleQueue()
+_escritor: Optional[threading.Thread] = None
+
+def _escrever_spans():
+    while True:
+        linhas = [_fila_exportacao.get()]
+        while not _fila_exportacao.empty() and len(linhas) < 500:
+            linhas.append(_fila_exportacao.get())
+        try:
+            with open(TRACE_EXPORT_FILE, "a", encoding="utf-8") as arquivo:
+                arquivo.write("\n".join(linhas) + "\n")
+        except OSError as e:
+            print(f"AVISO: Não foi possível gravar os spans em '{TRACE_EXPORT_FILE}': {e}")
+
+def exportar(spans: List[Span]):
+    global _escritor
+    if not TRACE_EXPORT_FILE or not spans:
+        return
+    if _escritor is None:
+        _escritor = threading.Thread(target=_escrever_spans, name="exportador-spans", daemon=True)
+        _escritor.start()
+    registro = {"resourceSpans": [{
+        "resource": {"attributes": [_atributo_otlp("service.name", SERVICE_NAME)]},
+        "scopeSpans": [{"scope": {"name": "rastreamento"}, "spans": [s.para_otlp() for s in spans]}],
+    }]}
+    _fila_exportacao.put(json.dumps(registro, default=str))
+
+class RastrearRequisicoes:
+    """
+    Middleware ASGI que abre o span raiz de cada requisição HTTP (continuando o 'traceparent'
+    recebido, se houver), devolve o trace id no cabeçalho 'X-Trace-Id' e, no fim, exporta
+    todos os spans da requisição de uma vez.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACE_EXPORT_FILE:
+            await self.app(scope, receive, send)
+            return
+
+        cabecalhos = dict(scope.get("headers") or [])
+        trace_id, parent_id = _ler_traceparent(cabecalhos.get(b"traceparent", b"").decode("latin-1"))
+        raiz = Span(f"{scope.get('method')} {scope.get('path')}", trace_id, parent_id, {
+            "http.method": scope.get("method"),
+            "url.path": scope.get("path"),
+        })
+        spans = [raiz]
+        token_spans = _spans_requisicao.set(spans)
+        token_span = _span_atual.set(raiz)
+
+        async def send_com_trace(message):
+            if message["type"] == "http.response.start":
+                raiz.set("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    raiz.erro = f"HTTP {message['status']}"
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-trace-id", trace_id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_com_trace)
+        except BaseException as e:
+            raiz.erro = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            rota = getattr(scope.get("route"), "path", None)
+            if rota:
+                raiz.nome = f"{scope.get('method')} {rota}"
+                raiz.set("http.route", rota)
+            raiz.fim_ns = time.time_ns()
+            _span_atual.reset(token_span)
+            _spans_requisicao.reset(token_spans)
+            exportar(spans)
\ No newline at end of file
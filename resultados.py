@@ -0,0 +1,134 @@
+# resultados.py
+import json
+from collections.abc import Mapping
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict, List, Union
+
+# Formato colunar dos resultados devolvidos pelo agente. Em vez de uma lista de dicts
+# (com o nome de cada coluna repetido em todas as linhas), o agente manda:
+#   {"formato": "colunar", "colunas": [...], "tipos": [...], "valores": [[coluna 0], [coluna 1], ...]}
+# Datas e horas chegam como texto ISO e são convertidas uma vez por coluna. O quadro inteiro
+# pode vir em msgpack e/ou comprimido com zstd (quadro binário do WebSocket), se as
+# bibliotecas estiverem instaladas; o servidor anuncia o que aceita no 'hello_ack'.
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+FORMATOS_SUPORTADOS = ["colunar"] + (["msgpack"] if msgpack else []) + (["zstd"] if zstandard else [])
+
+_CONVERSORES = {
+    "date": date.fromisoformat,
+    "datetime": datetime.fromisoformat,
+    "time": time.fromisoformat,
+}
+
+class Linha(Mapping):
+    """Linha somente leitura que lê os valores direto das colunas do resultado (sem dict por linha)."""
+    __slots__ = ("_resultado", "_indice")
+
+    def __init__(self, resultado: "ResultadoColunar", indice: int):
+        self._resultado = resultado
+        self._indice = indice
+
+    def __getitem__(self, coluna: str) -> Any:
+        return self._resultado.valores[self._resultado.posicoes[coluna]][self._indice]
+
+    def __iter__(self):
+        return iter(self._resultado.colunas)
+
+    def __len__(self) -> int:
+        return len(self._resultado.colunas)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+class ResultadoColunar(list):
+    """
+    Lista de Linha (compatível com o código que espera uma lista de dicts) que guarda
+    os dados por coluna. Pode ser serializada de volta para o formato colunar (cache).
+    """
+
+    def __init__(self, colunas: List[str], tipos: List[str], valores: List[list]):
+        self.colunas = colunas
+        self.tipos = tipos
+        self.posicoes = {coluna: posicao for posicao, coluna in enumerate(colunas)}
+        self.valores = [
+            [_CONVERSORES[tipo](v) if v is not None else None for v in coluna] if tipo in _CONVERSORES else coluna
+            for tipo, coluna in zip(tipos, valores)
+        ]
+        total_linhas = len(valores[0]) if valores else 0
+        super().__init__(Linha(self, indice) for indice in range(total_linhas))
+
+    def para_colunar(self) -> Dict[str, Any]:
+        return {
+            "formato": "colunar",
+            "colunas": self.colunas,
+            "tipos": self.tipos,
+            "valores": [
+                [v.isoformat() if v is not None else None for v in coluna] if tipo in _CONVERSORES else coluna
+                for tipo, coluna in zip(self.tipos, self.valores)
+            ],
+        }
+
+def decodificar_dados(dados: Any) -> Any:
+    """Converte os resultados colunares (de uma consulta ou de um lote {nome: resultado}) em ResultadoColunar."""
+    if isinstance(dados, dict):
+        if dados.get("formato") == "colunar":
+            return ResultadoColunar(dados.get("colunas") or [], dados.get("tipos") or [], dados.get("valores") or [])
+        return {nome: decodificar_dados(valor) for nome, valor in dados.items()}
+    return dados
+
+def codificar_dados(dados: Any) -> Any:
+    """Inverso de decodificar_dados: usado para guardar os resultados no cache ainda em formato colunar."""
+    if isinstance(dados, ResultadoColunar):
+        return dados.para_colunar()
+    if isinstance(dados, dict):
+        return {nome: codificar_dados(valor) for nome, valor in dados.items()}
+    return dados
+
+def decodificar_quadro(quadro: Union[str, bytes]) -> Dict[str, Any]:
+    """Decodifica uma mensagem do agente: texto JSON ou quadro binário (msgpack/JSON, opcionalmente zstd)."""
+    if isinstance(quadro, bytes):
+        if quadro.startswith(ZSTD_MAGIC):
+            if zstandard is None:
+                raise ValueError("Mensagem comprimida com zstd, mas o pacote 'zstandard' não está instalado.")
+            quadro = zstandard.ZstdDecompressor().decompressobj().decompress(quadro)
+        if quadro[:1] != b"{":
+            if msgpack is None:
+                raise ValueError("Mensagem em msgpack, mas o pacote 'msgpack' não está instalado.")
+            mensagem = msgpack.unpackb(quadro, raw=False)
+        else:
+            mensagem = json.loads(quadro)
+    else:
+        mensagem = json.loads(quadro)
+    if isinstance(mensagem, dict) and "dados" in mensagem:
+        mensagem["dados"] = decodificar_dados(mensagem["dados"])
+    return mensagem
+
+def valor_para_json(o):
+    """'default' do json.dumps para resultados do agente (linhas, datas e decimais)."""
+    if isinstance(o, Linha):
+        return dict(o)
+    if isinstance(o, (date, datetime, time)):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return float(o)
+    return str(o)
+
+def como_data(valor: Union[str, date, datetime]) -> date:
+    """Aceita a data já tipada (formato colunar) ou o texto 'AAAA-MM-DD' dos agentes antigos."""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return datetime.strptime(valor, '%Y-%m-%d').date()
\ No newline at end of file
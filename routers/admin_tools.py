@@ -1,13 +1,17 @@
 # /routers/admin_tools.py
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel, Field
-from typing import Dict, Optional
-from firebase_admin import auth, db
+from typing import Any, Dict, List, Optional
+import asyncio
+import math
+from firebase_admin import auth
+
+import firebase_async
 
 # ### ALTERAÇÃO APLICADA AQUI ###
 # Adicionada a dependência 'get_company_fk' para obter o ID da empresa no banco.
-from dependencies import verificar_admin_realtime_db, EmpresaInfo, get_company_fk
-from main_api import execute_query_via_agent
+from dependencies import verificar_admin_realtime_db, EmpresaInfo, get_company_fk, invalidar_perfil
+from main_api import execute_query_via_agent, invalidate_cache, list_slow_queries
 
 
 router = APIRouter(
@@ -61,13 +65,16 @@ async def list_users(empresa_info: EmpresaInfo = Depends(verificar_admin_realtim
     try:
         company_id = empresa_info.company_id
         
-        users_ref = db.reference(f'/empresas/{company_id}/usuarios').get()
+        users_ref = await firebase_async.ler(f'/empresas/{company_id}/usuarios')
         if not users_ref:
             return []
 
+        # Os perfis são lidos em paralelo (o pool do Firebase limita quantas leituras rodam juntas)
+        uids = list(users_ref.keys())
+        profiles = await asyncio.gather(*(firebase_async.ler(f'/usuarios/{uid}') for uid in uids))
+
         user_list = []
-        for uid in users_ref.keys():
-            user_details_ref = db.reference(f'/usuarios/{uid}').get()
+        for uid, user_details_ref in zip(uids, profiles):
             if user_details_ref:
                 user_company_role = user_details_ref.get('empresas', {}).get(company_id, {}).get('papel', 'usuário')
                 user_list.append({
@@ -85,7 +92,7 @@ async def list_users(empresa_info: EmpresaInfo = Depends(verificar_admin_realtim
 async def create_user(request: CreateUserRequest, empresa_info: EmpresaInfo = Depends(verificar_admin_realtime_db)):
     """ Cria um novo usuário na Autenticação do Firebase e no Realtime Database. """
     try:
-        new_user = auth.create_user(
+        new_user = await firebase_async.criar_usuario(
             email=request.email,
             password=request.password,
             display_name=request.username
@@ -99,8 +106,9 @@ async def create_user(request: CreateUserRequest, empresa_info: EmpresaInfo = De
             "username": request.username,
             "empresas": { company_id: user_company_data }
         }
-        db.reference(f'usuarios/{uid}').set(user_data_to_save)
-        db.reference(f'empresas/{company_id}/usuarios/{uid}').set(True)
+        await firebase_async.gravar(f'usuarios/{uid}', user_data_to_save)
+        await firebase_async.gravar(f'empresas/{company_id}/usuarios/{uid}', True)
+        await invalidar_perfil(uid)
 
         return {"status": "success", "message": f"Usuário {request.email} criado com sucesso.", "uid": uid}
 
@@ -108,7 +116,7 @@ async def create_user(request: CreateUserRequest, empresa_info: EmpresaInfo = De
         raise HTTPException(status_code=400, detail="O e-mail fornecido já está em uso.")
     except Exception as e:
         if 'uid' in locals():
-            auth.delete_user(uid)
+            await firebase_async.apagar_usuario(uid)
         raise HTTPException(status_code=500, detail=f"Erro ao criar usuário: {e}")
 
 
@@ -118,7 +126,7 @@ async def get_user_details(uid: str, empresa_info: EmpresaInfo = Depends(verific
     try:
         company_id = empresa_info.company_id
         
-        user_ref = db.reference(f'/usuarios/{uid}').get()
+        user_ref = await firebase_async.ler(f'/usuarios/{uid}')
         if not user_ref:
             raise HTTPException(status_code=404, detail="Usuário não encontrado.")
         
@@ -138,12 +146,15 @@ async def get_user_details(uid: str, empresa_info: EmpresaInfo = Depends(verific
 async def update_user(uid: str, request: UserData, empresa_info: EmpresaInfo = Depends(verificar_admin_realtime_db)):
     """ Atualiza os dados de um usuário. """
     try:
-        auth.update_user(uid, display_name=request.username)
+        await firebase_async.atualizar_usuario(uid, display_name=request.username)
         company_id = empresa_info.company_id
         
-        db.reference(f'usuarios/{uid}/username').set(request.username)
-        db.reference(f'usuarios/{uid}/empresas/{company_id}/papel').set(request.papel)
-        db.reference(f'usuarios/{uid}/empresas/{company_id}/acessos').set(request.acessos or {})
+        await asyncio.gather(
+            firebase_async.gravar(f'usuarios/{uid}/username', request.username),
+            firebase_async.gravar(f'usuarios/{uid}/empresas/{company_id}/papel', request.papel),
+            firebase_async.gravar(f'usuarios/{uid}/empresas/{company_id}/acessos', request.acessos or {}),
+        )
+        await invalidar_perfil(uid)
         
         return {"status": "success", "message": "Usuário atualizado com sucesso."}
     except Exception as e:
@@ -154,9 +165,10 @@ async def delete_user(uid: str, empresa_info: EmpresaInfo = Depends(verificar_ad
     """ Deleta um usuário permanentemente. """
     try:
         company_id = empresa_info.company_id
-        auth.delete_user(uid)
-        db.reference(f'usuarios/{uid}').delete()
-        db.reference(f'empresas/{company_id}/usuarios/{uid}').delete()
+        await firebase_async.apagar_usuario(uid)
+        await firebase_async.apagar(f'usuarios/{uid}')
+        await firebase_async.apagar(f'empresas/{company_id}/usuarios/{uid}')
+        await invalidar_perfil(uid)
         
         return {"status": "success", "message": "Usuário deletado com sucesso."}
     except Exception as e:
@@ -180,7 +192,7 @@ async def get_ai_settings(
         # A query agora filtra pela ID da empresa e pela chave.
         sql = "SELECT VALOR FROM DBCONFIG WHERE ID_EMPRESA = ? AND CHAVE = ?"
         params = [id_empresa, 'AI_PROMPT']
-        results = await execute_query_via_agent(empresa_info.company_id, sql, params)
+        results = await execute_query_via_agent(empresa_info.company_id, sql, params, cache_ttl=300, cache_tags=["config"])
         
         if results and results[0].get('VALOR'):
             settings["prompt"] = results[0].get('VALOR')
@@ -207,8 +219,62 @@ async def update_ai_settings(
         sql = "UPDATE OR INSERT INTO DBCONFIG (ID_EMPRESA, CHAVE, VALOR) VALUES (?, ?, ?) MATCHING (ID_EMPRESA, CHAVE)"
         params = [id_empresa, 'AI_PROMPT', settings.prompt]
         await execute_query_via_agent(empresa_info.company_id, sql, params)
+        await invalidate_cache(empresa_info.company_id, "config")
         
         return {"status": "success", "message": "Configurações da IA salvas com sucesso."}
     except Exception as e:
         if isinstance(e, HTTPException): raise e
-        raise HTTPException(status_code=500, detail=f"Erro ao salvar configurações da IA via agente: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Erro ao salvar configurações da IA via agente: {e}")
+
+
+# --- CONSULTAS LENTAS ---
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def summarize_slow_queries(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """ Agrupa as ocorrências pelo SQL normalizado (as entradas chegam da mais recente para a mais antiga). """
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in entries:
+        groups.setdefault(entry["sql"], []).append(entry)
+
+    summary = []
+    for sql, occurrences in groups.items():
+        durations = [entry["duracao_ms"] for entry in occurrences]
+        rows = [entry["linhas"] for entry in occurrences if entry.get("linhas") is not None]
+        sizes = [entry["bytes"] for entry in occurrences if entry.get("bytes") is not None]
+        summary.append({
+            "sql": sql,
+            "statement": occurrences[0].get("statement"),
+            "params": occurrences[0].get("params"),
+            "ocorrencias": len(occurrences),
+            "timeouts": sum(1 for entry in occurrences if entry.get("timeout")),
+            "total_ms": round(sum(durations), 1),
+            "p95_ms": round(percentile(durations, 0.95), 1),
+            "max_ms": round(max(durations), 1),
+            "media_linhas": round(sum(rows) / len(rows)) if rows else None,
+            "max_bytes": max(sizes) if sizes else None,
+            "ultima_em": occurrences[0].get("em"),
+        })
+    return summary
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    empresa_info: EmpresaInfo = Depends(verificar_admin_realtime_db),
+    ordenar_por: str = Query("total", pattern="^(total|p95)$"),
+    limite: int = Query(20, ge=1, le=200)
+):
+    """ Lista as consultas mais lentas da empresa (ao agente), agrupadas pelo SQL, por tempo total ou p95. """
+    try:
+        entries = await list_slow_queries(empresa_info.company_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao ler o log de consultas lentas: {e}")
+
+    summary = summarize_slow_queries(entries)
+    summary.sort(key=lambda item: item["total_ms" if ordenar_por == "total" else "p95_ms"], reverse=True)
+    return {
+        "total_ocorrencias": len(entries),
+        "desde": entries[-1].get("em") if entries else None,
+        "consultas": summary[:limite],
+    }
\ No newline at end of file
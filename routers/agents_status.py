@@ -0,0 +1,20 @@
+# /routers/agents_status.py
+from fastapi import APIRouter, Depends, HTTPException
+
+from dependencies import verificar_superadmin
+from main_api import list_connected_agents
+
+router = APIRouter(
+    prefix="/agents",
+    tags=["Agentes"],
+    dependencies=[Depends(verificar_superadmin)]
+)
+
+@router.get("/status")
+async def get_agents_status():
+    """ Lista os agentes conectados, com o último heartbeat e a latência da última resposta. """
+    try:
+        agents = await list_connected_agents()
+        return {"total": len(agents), "agents": agents}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao consultar a presença dos agentes: {e}")
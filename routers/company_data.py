@@ -2,7 +2,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List
-from firebase_admin import db
+
+import espelho_firebase
 
 # A conexão direta com o banco de dados foi removida.
 # from database import connect 
@@ -22,32 +23,14 @@ class CompanyInfo(BaseModel):
     nome_fantasia: str
 
 @router.get("/all", response_model=List[CompanyInfo], dependencies=[Depends(verificar_token_simples)])
-def get_all_companies():
+async def get_all_companies():
     """
     Busca uma lista de todas as empresas (CNPJ e Nome Fantasia)
     cadastradas no Firebase Realtime Database.
     """
     try:
-        # Acessa o nó 'empresas' na raiz do seu Realtime Database.
-        all_companies_ref = db.reference('/empresas').get()
-        if not all_companies_ref:
-            return []
-
-        companies = []
-        for cnpj_raw, details in all_companies_ref.items():
-            # Garante que 'details' é um dicionário antes de tentar acessá-lo.
-            if isinstance(details, dict):
-                # Usa o 'nomeFantasia' salvo, ou o CNPJ como alternativa.
-                nome_fantasia = details.get("nomeFantasia", cnpj_raw).strip()
-            else:
-                # Fallback caso a estrutura de dados seja inesperada.
-                nome_fantasia = cnpj_raw
-            
-            companies.append(CompanyInfo(cnpj=cnpj_raw, nome_fantasia=nome_fantasia))
-
-        # Ordena a lista em ordem alfabética pelo nome da empresa.
-        companies.sort(key=lambda c: c.nome_fantasia)
-        return companies
+        # Lista já ordenada pelo nome, mantida pelo espelho do nó 'empresas'.
+        return [CompanyInfo(cnpj=cnpj_raw, nome_fantasia=nome_fantasia) for cnpj_raw, nome_fantasia in await espelho_firebase.listar_empresas()]
 
     except Exception as e:
         # Captura qualquer erro durante a comunicação com o Firebase.
@@ -55,30 +38,19 @@ def get_all_companies():
 
 
 @router.get("/details", response_model=CompanyDetails)
-def get_company_details(empresa_info: EmpresaInfo = Depends(verificar_empresa)):
+async def get_company_details(empresa_info: EmpresaInfo = Depends(verificar_empresa)):
     """
     Busca os detalhes (Nome Fantasia e CNPJ) da empresa
     a partir do Firebase Realtime Database.
     """
     company_cnpj_clean = empresa_info.company_id
     try:
-        # Busca todas as empresas para encontrar a correspondente.
-        all_companies_ref = db.reference('/empresas').get()
-        if not all_companies_ref:
-            raise HTTPException(status_code=404, detail="Nenhuma empresa encontrada no Firebase.")
-
-        # Itera sobre as empresas cadastradas no Firebase.
-        for cnpj_raw, details in all_companies_ref.items():
-            # Compara o CNPJ limpo (sem formatação) com o CNPJ da requisição.
-            if ''.join(filter(str.isdigit, cnpj_raw)) == company_cnpj_clean:
-                if isinstance(details, dict):
-                    nome_fantasia = details.get("nomeFantasia", cnpj_raw).strip()
-                else:
-                    nome_fantasia = cnpj_raw
-                
-                return CompanyDetails(nome_fantasia=nome_fantasia, cnpj=cnpj_raw)
+        # Busca pelo CNPJ limpo (sem formatação) no índice do espelho do nó 'empresas'.
+        empresa = await espelho_firebase.obter_empresa(company_cnpj_clean)
+        if empresa:
+            cnpj_raw, details = empresa
+            return CompanyDetails(nome_fantasia=espelho_firebase.nome_fantasia(cnpj_raw, details), cnpj=cnpj_raw)
 
-        # Se o loop terminar sem encontrar a empresa, retorna um erro 404.
         raise HTTPException(status_code=404, detail="Dados da empresa especificada não foram encontrados no Firebase.")
 
     except Exception as e:
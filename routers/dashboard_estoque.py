@@ -3,15 +3,17 @@ from fastapi import APIRouter, HTTPException, Depends
 from datetime import datetime, timedelta, date
 from dateutil.relativedelta import relativedelta
 
-from dependencies import get_company_fk, EmpresaInfo, verificar_empresa
-from main_api import execute_query_via_agent
+from dependencies import get_company_fk, EmpresaInfo, verificar_empresa, limitar_requisicoes
+from main_api import execute_query_via_agent, execute_queries_concurrently
+from prioridades import usar_prioridade
 
 router = APIRouter(
     prefix="/estoque",
-    tags=["Dashboard de Estoque"]
+    tags=["Dashboard de Estoque"],
+    dependencies=[Depends(limitar_requisicoes())]
 )
 
-async def get_historical_stock_value(company_cnpj: str, id_empresa: str, target_date: date):
+def build_historical_stock_value_query(id_empresa: str, target_date: date):
     target_datetime_str = datetime.combine(target_date, datetime.max.time()).strftime('%Y-%m-%d %H:%M:%S')
     sql = """
         SELECT
@@ -21,9 +23,16 @@ async def get_historical_stock_value(company_cnpj: str, id_empresa: str, target_
         AS TOTAL FROM RDB$DATABASE
     """
     params = [id_empresa, target_datetime_str, id_empresa, target_datetime_str, id_empresa]
-    result = await execute_query_via_agent(company_cnpj, sql, params)
+    return sql, params
+
+def parse_historical_stock_value(result) -> float:
     return float(result[0]['TOTAL'] or 0.0) if result else 0.0
 
+async def get_historical_stock_value(company_cnpj: str, id_empresa: str, target_date: date):
+    sql, params = build_historical_stock_value_query(id_empresa, target_date)
+    result = await execute_query_via_agent(company_cnpj, sql, params, cache_ttl=120)
+    return parse_historical_stock_value(result)
+
 @router.get("/kpis")
 async def get_stock_kpis(empresa_info: EmpresaInfo = Depends(verificar_empresa), id_empresa: str = Depends(get_company_fk), end_date: date = None):
     try:
@@ -43,7 +52,7 @@ async def get_top_products_by_value(empresa_info: EmpresaInfo = Depends(verifica
             WHERE p.ATIVO = 'S' AND p.ESTDISPONIVEL > 0 AND p.CUSTOFINAL > 0 AND p.EMPRESA = ?
             ORDER BY VALOR_TOTAL DESC
         """
-        results = await execute_query_via_agent(empresa_info.company_id, sql, [id_empresa])
+        results = await execute_query_via_agent(empresa_info.company_id, sql, [id_empresa], cache_ttl=300)
         labels = [row['DESCRICAO'] for row in results]
         values = [float(row['VALOR_TOTAL'] or 0.0) for row in results]
         return {"labels": labels, "values": values}
@@ -51,16 +60,19 @@ async def get_top_products_by_value(empresa_info: EmpresaInfo = Depends(verifica
         if isinstance(e, HTTPException): raise e
         raise HTTPException(status_code=500, detail=f"Erro ao buscar top produtos: {e}")
 
-@router.get("/value-history")
+# Cada carga dispara 12 consultas ao agente (uma por mês)
+@router.get("/value-history", dependencies=[Depends(usar_prioridade("pesada")), Depends(limitar_requisicoes(custo=12))])
 async def get_stock_value_history(empresa_info: EmpresaInfo = Depends(verificar_empresa), id_empresa: str = Depends(get_company_fk), year: int = None):
     try:
         target_year = year if year else date.today().year
-        labels, values = [], []
+        labels, queries = [], {}
         for month in range(1, 13):
             last_day_of_month = datetime(target_year, month, 1) + relativedelta(months=1) - timedelta(days=1)
             labels.append(last_day_of_month.strftime("%b/%y"))
-            historical_value = await get_historical_stock_value(empresa_info.company_id, id_empresa, last_day_of_month.date())
-            values.append(historical_value)
+            queries[month] = build_historical_stock_value_query(id_empresa, last_day_of_month.date())
+        # Os 12 fechamentos mensais são independentes e rodam em paralelo (respeitando o limite da empresa).
+        results = await execute_queries_concurrently(empresa_info.company_id, queries, return_exceptions=False, cache_ttl=600)
+        values = [parse_historical_stock_value(results[month]) for month in range(1, 13)]
         return {"labels": labels, "values": values}
     except Exception as e:
         if isinstance(e, HTTPException): raise e
@@ -70,7 +82,7 @@ async def get_stock_value_history(empresa_info: EmpresaInfo = Depends(verificar_
 async def get_abc_analysis(empresa_info: EmpresaInfo = Depends(verificar_empresa), id_empresa: str = Depends(get_company_fk)):
     try:
         sql = "SELECT (CAST(p.CUSTOFINAL AS DOUBLE PRECISION) * CAST(p.ESTDISPONIVEL AS DOUBLE PRECISION)) as VALOR_TOTAL FROM TESTPRODUTO p WHERE p.ATIVO = 'S' AND p.ESTDISPONIVEL > 0 AND p.CUSTOFINAL > 0 AND p.EMPRESA = ? ORDER BY VALOR_TOTAL DESC"
-        results = await execute_query_via_agent(empresa_info.company_id, sql, [id_empresa])
+        results = await execute_query_via_agent(empresa_info.company_id, sql, [id_empresa], cache_ttl=300)
         products = [float(row['VALOR_TOTAL']) for row in results]
         
         if not products: return {"curve_a_count": 0, "curve_b_count": 0, "curve_c_count": 0, "curve_a_percent": 0, "curve_b_percent": 0, "curve_c_percent": 0}
@@ -93,7 +105,7 @@ async def get_abc_analysis(empresa_info: EmpresaInfo = Depends(verificar_empresa
 async def get_low_stock_products(empresa_info: EmpresaInfo = Depends(verificar_empresa), id_empresa: str = Depends(get_company_fk)):
     try:
         sql = "SELECT g.DESCRICAO, p.ESTDISPONIVEL, p.ESTOQUEMINIMO FROM TESTPRODUTO p JOIN TESTPRODUTOGERAL g ON p.PRODUTO = g.CODIGO WHERE p.ATIVO = 'S' AND p.ESTOQUEMINIMO > 0 AND p.ESTDISPONIVEL < p.ESTOQUEMINIMO AND p.EMPRESA = ? ORDER BY g.DESCRICAO"
-        results = await execute_query_via_agent(empresa_info.company_id, sql, [id_empresa])
+        results = await execute_query_via_agent(empresa_info.company_id, sql, [id_empresa], cache_ttl=300)
         return [{"product_name": r['DESCRICAO'], "current_stock": float(r['ESTDISPONIVEL']), "min_stock": float(r['ESTOQUEMINIMO'])} for r in results]
     except Exception as e:
         if isinstance(e, HTTPException): raise e
@@ -104,7 +116,7 @@ async def get_idle_products(empresa_info: EmpresaInfo = Depends(verificar_empres
     try:
         date_threshold = datetime.now() - timedelta(days=days)
         sql = "SELECT g.DESCRICAO, p.ESTDISPONIVEL FROM TESTPRODUTO p JOIN TESTPRODUTOGERAL g ON p.PRODUTO = g.CODIGO WHERE p.ATIVO = 'S' AND p.ESTDISPONIVEL > 0 AND p.EMPRESA = ? AND NOT EXISTS (SELECT 1 FROM TESTEXTRATO e WHERE e.PRODUTO = p.PRODUTO AND e.DATAHORA >= ? AND e.EMPRESA = ?) ORDER BY g.DESCRICAO"
-        results = await execute_query_via_agent(empresa_info.company_id, sql, [id_empresa, date_threshold, id_empresa])
+        results = await execute_query_via_agent(empresa_info.company_id, sql, [id_empresa, date_threshold, id_empresa], cache_ttl=600)
         return [{"product_name": r['DESCRICAO'], "current_stock": float(r['ESTDISPONIVEL'])} for r in results]
     except Exception as e:
         if isinstance(e, HTTPException): raise e
@@ -5,13 +5,16 @@ from dateutil.relativedelta import relativedelta
 import calendar
 from typing import List, Optional
 
-from dependencies import get_company_fk, EmpresaInfo, verificar_empresa
-from main_api import execute_query_via_agent
+from dependencies import get_company_fk, EmpresaInfo, verificar_empresa, limitar_requisicoes
+from main_api import execute_query_via_agent, execute_batch_via_agent, execute_queries_concurrently
+from statements import registrar_statement
+from resultados import como_data
 from routers.metas_panel import criar_tabela_metas_se_nao_existir_async
 
 router = APIRouter(
     prefix="/dashboard",
-    tags=["Dashboard Principal"]
+    tags=["Dashboard Principal"],
+    dependencies=[Depends(limitar_requisicoes())]
 )
 
 @router.get("/validate-connection")
@@ -27,7 +30,7 @@ async def get_dashboard_kpis(empresa_info: EmpresaInfo = Depends(verificar_empre
         mes_atual_dt = datetime.now()
         mes_passado_dt = mes_atual_dt - relativedelta(months=1)
 
-        sql_otimizada_kpis = """
+        sql_otimizada_kpis = registrar_statement("dashboard_kpis", """
             SELECT
                 SUM(CASE WHEN p.DATAEFE = ? AND p.TIPOVENDA = 'NM' THEN CAST(p.VALORLIQUIDO AS DOUBLE PRECISION) ELSE 0 END) as VENDAS_HOJE,
                 SUM(CASE WHEN p.DATAEFE = ? AND p.TIPOVENDA = 'NM' THEN CAST(p.VALORLIQUIDO AS DOUBLE PRECISION) ELSE 0 END) as VENDAS_ONTEM,
@@ -49,7 +52,7 @@ async def get_dashboard_kpis(empresa_info: EmpresaInfo = Depends(verificar_empre
                     (EXTRACT(YEAR FROM p.DATAEFE) = ? AND EXTRACT(MONTH FROM p.DATAEFE) = ?) OR
                     (EXTRACT(YEAR FROM p.DATAEFE) = ? AND EXTRACT(MONTH FROM p.DATAEFE) = ?)
                 )
-        """
+        """)
         
         params_kpis = [
             hoje, ontem,
@@ -63,7 +66,20 @@ async def get_dashboard_kpis(empresa_info: EmpresaInfo = Depends(verificar_empre
             mes_passado_dt.year, mes_passado_dt.month
         ]
         
-        kpi_res = await execute_query_via_agent(company_cnpj, sql_otimizada_kpis, params_kpis)
+        sql_lucro_dia = registrar_statement("dashboard_lucro_dia", """
+            SELECT
+                SUM(CASE WHEN p.DATAEFE = ? THEN (CAST(i.VLRLIQUIDO AS DOUBLE PRECISION) - (CAST(i.QTDE AS DOUBLE PRECISION) * CAST(i.CUSTOFINAL AS DOUBLE PRECISION))) ELSE 0 END) as LUCRO_HOJE,
+                SUM(CASE WHEN p.DATAEFE = ? THEN (CAST(i.VLRLIQUIDO AS DOUBLE PRECISION) - (CAST(i.QTDE AS DOUBLE PRECISION) * CAST(i.CUSTOFINAL AS DOUBLE PRECISION))) ELSE 0 END) as LUCRO_ONTEM
+            FROM TVENPEDIDO p JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA
+            WHERE p.DATAEFE IN (?, ?) AND p.STATUS = 'EFE' AND p.TIPOVENDA = 'NM' AND p.EMPRESA = ?
+        """)
+
+        # KPIs e lucro do dia seguem juntos para o agente em um único lote.
+        batch_res = await execute_batch_via_agent(company_cnpj, {
+            "kpis": (sql_otimizada_kpis, params_kpis),
+            "lucro": (sql_lucro_dia, [hoje, ontem, hoje, ontem, id_empresa]),
+        }, cache_ttl=30)
+        kpi_res = batch_res["kpis"]
 
         data = {
             "vendas_hoje": 0.0, "vendas_ontem": 0.0, "pedidos_hoje": 0, "pedidos_ontem": 0,
@@ -84,14 +100,7 @@ async def get_dashboard_kpis(empresa_info: EmpresaInfo = Depends(verificar_empre
                 "receita_mensal_passado": float(res.get('RECEITA_MES_PASSADO') or 0.0),
             })
 
-        sql_lucro_dia = """
-            SELECT
-                SUM(CASE WHEN p.DATAEFE = ? THEN (CAST(i.VLRLIQUIDO AS DOUBLE PRECISION) - (CAST(i.QTDE AS DOUBLE PRECISION) * CAST(i.CUSTOFINAL AS DOUBLE PRECISION))) ELSE 0 END) as LUCRO_HOJE,
-                SUM(CASE WHEN p.DATAEFE = ? THEN (CAST(i.VLRLIQUIDO AS DOUBLE PRECISION) - (CAST(i.QTDE AS DOUBLE PRECISION) * CAST(i.CUSTOFINAL AS DOUBLE PRECISION))) ELSE 0 END) as LUCRO_ONTEM
-            FROM TVENPEDIDO p JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA
-            WHERE p.DATAEFE IN (?, ?) AND p.STATUS = 'EFE' AND p.TIPOVENDA = 'NM' AND p.EMPRESA = ?
-        """
-        lucro_res = await execute_query_via_agent(company_cnpj, sql_lucro_dia, [hoje, ontem, hoje, ontem, id_empresa])
+        lucro_res = batch_res["lucro"]
         
         if lucro_res and lucro_res[0]:
             res_lucro = lucro_res[0]
@@ -115,10 +124,10 @@ async def get_daily_sales(days: int = 7, empresa_info: EmpresaInfo = Depends(ver
         start_date = today - timedelta(days=days - 1)
         sql = "SELECT DATAEFE, SUM(CAST(VALORLIQUIDO AS DOUBLE PRECISION)) AS TOTAL FROM TVENPEDIDO WHERE STATUS = 'EFE' AND TIPOVENDA = 'NM' AND DATAEFE >= ? AND EMPRESA = ? GROUP BY DATAEFE"
         
-        results = await execute_query_via_agent(empresa_info.company_id, sql, [start_date, id_empresa])
+        results = await execute_query_via_agent(empresa_info.company_id, sql, [start_date, id_empresa], cache_ttl=60)
 
         for row in results:
-            sale_date = datetime.strptime(row['DATAEFE'], '%Y-%m-%d').date()
+            sale_date = como_data(row['DATAEFE'])
             if sale_date in sales_by_day:
                 sales_by_day[sale_date] = float(row['TOTAL'] or 0.0)
         
@@ -138,10 +147,15 @@ async def get_monthly_performance(empresa_info: EmpresaInfo = Depends(verificar_
         
         sql = "SELECT EXTRACT(DAY FROM DATAEFE) AS DIA, SUM(CAST(VALORLIQUIDO AS DOUBLE PRECISION)) AS TOTAL FROM TVENPEDIDO WHERE STATUS = 'EFE' AND TIPOVENDA = 'NM' AND DATAEFE >= ? AND DATAEFE < ? AND EMPRESA = ? GROUP BY 1"
         
-        current_month_res = await execute_query_via_agent(empresa_info.company_id, sql, [current_month_start, current_month_start + relativedelta(months=1), id_empresa])
+        month_results = await execute_queries_concurrently(empresa_info.company_id, {
+            "current": (sql, [current_month_start, current_month_start + relativedelta(months=1), id_empresa]),
+            "previous": (sql, [prev_month_start, prev_month_start + relativedelta(months=1), id_empresa]),
+        }, return_exceptions=False, cache_ttl=60)
+
+        current_month_res = month_results["current"]
         current_month_data = {row['DIA']: (row['TOTAL'] or 0.0) for row in current_month_res}
 
-        prev_month_res = await execute_query_via_agent(empresa_info.company_id, sql, [prev_month_start, prev_month_start + relativedelta(months=1), id_empresa])
+        prev_month_res = month_results["previous"]
         prev_month_data = {row['DIA']: (row['TOTAL'] or 0.0) for row in prev_month_res}
         
         current_month_cumulative = [sum(current_month_data.get(d, 0.0) for d in range(1, day + 1)) for day in range(1, days_in_current_month + 1)]
@@ -177,7 +191,7 @@ async def get_top_vendors_month(
         else:
             final_sql = "SELECT FIRST 5 " + query_body + " GROUP BY 1 ORDER BY TOTAL DESC"
         
-        results = await execute_query_via_agent(empresa_info.company_id, final_sql, params)
+        results = await execute_query_via_agent(empresa_info.company_id, final_sql, params, cache_ttl=60)
         ranking = [{"vendedor": row['VENDEDOR'].strip(), "total": float(row['TOTAL'] or 0.0)} for row in results]
         return ranking
     except Exception as e:
@@ -191,7 +205,7 @@ async def get_metas_progress(empresa_info: EmpresaInfo = Depends(verificar_empre
         today = datetime.now()
         
         sql_metas = "SELECT INDICADOR, VALOR FROM DBMETAS WHERE ID_EMPRESA = ? AND ANO = ? AND MES = ?"
-        metas_definidas = await execute_query_via_agent(empresa_info.company_id, sql_metas, [id_empresa, today.year, today.month])
+        metas_definidas = await execute_query_via_agent(empresa_info.company_id, sql_metas, [id_empresa, today.year, today.month], cache_ttl=300, cache_tags=["metas"])
         
         progress_data = []
         for meta in metas_definidas:
@@ -202,7 +216,7 @@ async def get_metas_progress(empresa_info: EmpresaInfo = Depends(verificar_empre
                 # ### CORREÇÃO APLICADA AQUI ###
                 # Adicionado o alias 'p' para a tabela TVENPEDIDO para corrigir o erro 'Column unknown P.DATAEFE'.
                 sql_progresso = "SELECT SUM(CAST(VALORLIQUIDO AS DOUBLE PRECISION)) AS TOTAL FROM TVENPEDIDO p WHERE STATUS = 'EFE' AND TIPOVENDA = 'NM' AND EXTRACT(YEAR FROM p.DATAEFE) = ? AND EXTRACT(MONTH FROM p.DATAEFE) = ? AND EMPRESA = ?"
-                progresso_res = await execute_query_via_agent(empresa_info.company_id, sql_progresso, [today.year, today.month, id_empresa])
+                progresso_res = await execute_query_via_agent(empresa_info.company_id, sql_progresso, [today.year, today.month, id_empresa], cache_ttl=60)
                 
                 progresso_atual = float(progresso_res[0]['TOTAL'] or 0.0) if progresso_res else 0.0
                 progress_data.append({
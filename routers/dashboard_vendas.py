@@ -1,15 +1,22 @@
 # /routers/dashboard_vendas.py
 from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi.responses import StreamingResponse
 from datetime import date, datetime
 from typing import List, Optional
 from collections import defaultdict
+import csv
+import io
+import json
 
-from dependencies import get_company_fk, EmpresaInfo, verificar_empresa
-from main_api import execute_query_via_agent
+from dependencies import get_company_fk, EmpresaInfo, verificar_empresa, limitar_requisicoes
+from main_api import execute_query_via_agent, execute_batch_via_agent, stream_query_via_agent
+from resultados import como_data, valor_para_json
+from prioridades import usar_prioridade
 
 router = APIRouter(
     prefix="/vendas",
-    tags=["Dashboard de Vendas"]
+    tags=["Dashboard de Vendas"],
+    dependencies=[Depends(limitar_requisicoes())]
 )
 
 @router.get("/summary")
@@ -38,49 +45,60 @@ async def get_sales_summary(
         returns_where = " AND ".join(base_where_clauses + ["p.TIPOVENDA = 'DV'"])
 
         revenue_sql = f"SELECT SUM(CAST(p.VALORLIQUIDO AS DOUBLE PRECISION)) AS TOTAL, COUNT(p.CODIGO) AS QTD FROM TVENPEDIDO p {join_vendor_str} WHERE {main_where}"
-        revenue_res = await execute_query_via_agent(company_cnpj, revenue_sql, params)
+        profit_sql = f"SELECT SUM(CAST(i.VLRLIQUIDO AS DOUBLE PRECISION) - (CAST(i.QTDE AS DOUBLE PRECISION) * CAST(i.CUSTOFINAL AS DOUBLE PRECISION))) AS TOTAL FROM TVENPEDIDO p {join_vendor_str} JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA WHERE {main_where}"
+        # ### ADICIONADO AQUI: Cálculo de Devoluções ###
+        returns_sql = f"SELECT SUM(CAST(p.VALORLIQUIDO AS DOUBLE PRECISION)) AS TOTAL FROM TVENPEDIDO p {join_vendor_str} WHERE {returns_where}"
+        peak_where = " AND ".join(base_where_clauses + ["p.TIPOVENDA = 'NM'", "p.HORAEFE IS NOT NULL"])
+        peak_sql = f"SELECT EXTRACT(HOUR FROM p.HORAEFE) AS HORA, SUM(CAST(p.VALORLIQUIDO AS DOUBLE PRECISION)) AS TOTAL FROM TVENPEDIDO p {join_vendor_str} WHERE {peak_where} GROUP BY 1"
+        pay_where = " AND ".join(base_where_clauses + ["r.TIPOREGISTRO = 1"])
+        pay_sql = f"SELECT r.TIPOVALOR, SUM(CAST(r.VALOR AS DOUBLE PRECISION)) AS TOTAL FROM TVENREGISTROFORMA r JOIN TVENPEDIDO p ON r.IDENTIFICADOR = p.CODIGO {join_vendor_str} WHERE {pay_where} GROUP BY r.TIPOVALOR"
+        top_prod_sql = f"SELECT FIRST 10 COALESCE(g.DESCRICAOREDUZIDA, g.DESCRICAO) AS NOME, SUM(CAST(i.VLRLIQUIDO AS DOUBLE PRECISION)) AS TOTAL FROM TVENPEDIDO p JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA JOIN TESTPRODUTOGERAL g ON i.PRODUTO = g.CODIGO {join_vendor_str} WHERE {main_where} GROUP BY 1 ORDER BY TOTAL DESC"
+        top_profit_sql = f"SELECT FIRST 10 COALESCE(g.DESCRICAOREDUZIDA, g.DESCRICAO) AS NOME, SUM(CAST(i.VLRLIQUIDO AS DOUBLE PRECISION) - (CAST(i.QTDE AS DOUBLE PRECISION) * CAST(i.CUSTOFINAL AS DOUBLE PRECISION))) AS TOTAL FROM TVENPEDIDO p JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA JOIN TESTPRODUTOGERAL g ON i.PRODUTO = g.CODIGO {join_vendor_str} WHERE {main_where} GROUP BY 1 HAVING SUM(i.VLRLIQUIDO - (i.QTDE * i.CUSTOFINAL)) > 0 ORDER BY TOTAL DESC"
+        sales_group_sql = f"SELECT COALESCE(grp.DESCRICAO, 'Sem Grupo') AS NOME, SUM(CAST(p.VALORLIQUIDO AS DOUBLE PRECISION)) AS TOTAL FROM TVENPEDIDO p LEFT JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA JOIN TESTPRODUTO est ON i.PRODUTO = est.PRODUTO AND p.EMPRESA = est.EMPRESA LEFT JOIN TESTGRUPO grp ON est.GRUPO = grp.CODIGO {join_vendor_str} WHERE {main_where} GROUP BY 1 HAVING SUM(p.VALORLIQUIDO) > 0 ORDER BY TOTAL DESC"
+
+        # Todas as consultas do resumo vão ao agente em um único lote (uma ida e volta).
+        batch_res = await execute_batch_via_agent(company_cnpj, {
+            "revenue": (revenue_sql, params),
+            "profit": (profit_sql, params),
+            "returns": (returns_sql, params),
+            "peak": (peak_sql, params),
+            "payment": (pay_sql, params),
+            "top_products": (top_prod_sql, params),
+            "top_profit": (top_profit_sql, params),
+            "sales_group": (sales_group_sql, params),
+        }, cache_ttl=60)
+
+        revenue_res = batch_res["revenue"]
         total_revenue = float(revenue_res[0]['TOTAL'] or 0.0) if revenue_res else 0.0
         total_orders = int(revenue_res[0]['QTD'] or 0) if revenue_res else 0
         
-        profit_sql = f"SELECT SUM(CAST(i.VLRLIQUIDO AS DOUBLE PRECISION) - (CAST(i.QTDE AS DOUBLE PRECISION) * CAST(i.CUSTOFINAL AS DOUBLE PRECISION))) AS TOTAL FROM TVENPEDIDO p {join_vendor_str} JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA WHERE {main_where}"
-        profit_res = await execute_query_via_agent(company_cnpj, profit_sql, params)
+        profit_res = batch_res["profit"]
         net_profit = float(profit_res[0]['TOTAL'] or 0.0) if profit_res else 0.0
         avg_ticket = total_revenue / total_orders if total_orders > 0 else 0.0
 
-        # ### ADICIONADO AQUI: Cálculo de Devoluções ###
-        returns_sql = f"SELECT SUM(CAST(p.VALORLIQUIDO AS DOUBLE PRECISION)) AS TOTAL FROM TVENPEDIDO p {join_vendor_str} WHERE {returns_where}"
-        returns_res = await execute_query_via_agent(company_cnpj, returns_sql, params)
+        returns_res = batch_res["returns"]
         total_returns = float(returns_res[0]['TOTAL'] or 0.0) if returns_res else 0.0
 
-        peak_where = " AND ".join(base_where_clauses + ["p.TIPOVENDA = 'NM'", "p.HORAEFE IS NOT NULL"])
-        peak_sql = f"SELECT EXTRACT(HOUR FROM p.HORAEFE) AS HORA, SUM(CAST(p.VALORLIQUIDO AS DOUBLE PRECISION)) AS TOTAL FROM TVENPEDIDO p {join_vendor_str} WHERE {peak_where} GROUP BY 1"
-        peak_res = await execute_query_via_agent(company_cnpj, peak_sql, params)
         peak_hours_sales = [0.0] * 24
-        for row in peak_res:
+        for row in batch_res["peak"]:
             hour, sales = int(row['HORA']), float(row['TOTAL'] or 0.0)
             if 0 <= hour < 24: peak_hours_sales[hour] = sales
         
         payment_map = {1: "Dinheiro", 4: "Cartão de Crédito", 5: "Crediário", 15: "Cartão de Débito"}
-        pay_where = " AND ".join(base_where_clauses + ["r.TIPOREGISTRO = 1"])
-        pay_sql = f"SELECT r.TIPOVALOR, SUM(CAST(r.VALOR AS DOUBLE PRECISION)) AS TOTAL FROM TVENREGISTROFORMA r JOIN TVENPEDIDO p ON r.IDENTIFICADOR = p.CODIGO {join_vendor_str} WHERE {pay_where} GROUP BY r.TIPOVALOR"
-        pay_res = await execute_query_via_agent(company_cnpj, pay_sql, params)
         payment_methods_data = {}
-        for row in pay_res:
+        for row in batch_res["payment"]:
             code, total = row['TIPOVALOR'], float(row['TOTAL'] or 0.0)
             if total > 0:
                 label = payment_map.get(code, "Outros")
                 payment_methods_data[label] = payment_methods_data.get(label, 0) + total
 
-        top_prod_sql = f"SELECT FIRST 10 COALESCE(g.DESCRICAOREDUZIDA, g.DESCRICAO) AS NOME, SUM(CAST(i.VLRLIQUIDO AS DOUBLE PRECISION)) AS TOTAL FROM TVENPEDIDO p JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA JOIN TESTPRODUTOGERAL g ON i.PRODUTO = g.CODIGO {join_vendor_str} WHERE {main_where} GROUP BY 1 ORDER BY TOTAL DESC"
-        top_prod_res = await execute_query_via_agent(company_cnpj, top_prod_sql, params)
+        top_prod_res = batch_res["top_products"]
         top_products_data = {"labels": [r['NOME'] for r in top_prod_res], "data": [float(r['TOTAL'] or 0.0) for r in top_prod_res]}
         
-        top_profit_sql = f"SELECT FIRST 10 COALESCE(g.DESCRICAOREDUZIDA, g.DESCRICAO) AS NOME, SUM(CAST(i.VLRLIQUIDO AS DOUBLE PRECISION) - (CAST(i.QTDE AS DOUBLE PRECISION) * CAST(i.CUSTOFINAL AS DOUBLE PRECISION))) AS TOTAL FROM TVENPEDIDO p JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA JOIN TESTPRODUTOGERAL g ON i.PRODUTO = g.CODIGO {join_vendor_str} WHERE {main_where} GROUP BY 1 HAVING SUM(i.VLRLIQUIDO - (i.QTDE * i.CUSTOFINAL)) > 0 ORDER BY TOTAL DESC"
-        top_profit_res = await execute_query_via_agent(company_cnpj, top_profit_sql, params)
+        top_profit_res = batch_res["top_profit"]
         top_products_profit_data = {"labels": [r['NOME'] for r in top_profit_res], "data": [float(r['TOTAL'] or 0.0) for r in top_profit_res]}
 
-        sales_group_sql = f"SELECT COALESCE(grp.DESCRICAO, 'Sem Grupo') AS NOME, SUM(CAST(p.VALORLIQUIDO AS DOUBLE PRECISION)) AS TOTAL FROM TVENPEDIDO p LEFT JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA JOIN TESTPRODUTO est ON i.PRODUTO = est.PRODUTO AND p.EMPRESA = est.EMPRESA LEFT JOIN TESTGRUPO grp ON est.GRUPO = grp.CODIGO {join_vendor_str} WHERE {main_where} GROUP BY 1 HAVING SUM(p.VALORLIQUIDO) > 0 ORDER BY TOTAL DESC"
-        sales_group_res = await execute_query_via_agent(company_cnpj, sales_group_sql, params)
+        sales_group_res = batch_res["sales_group"]
         sales_by_group_data = {"labels": [r['NOME'] for r in sales_group_res], "data": [float(r['TOTAL'] or 0.0) for r in sales_group_res]}
 
         return { 
@@ -117,7 +135,7 @@ async def get_annual_summary(
             WHERE p.STATUS = 'EFE' AND p.TIPOVENDA = 'NM' AND p.GERAFINANCEIRO = 'S' AND p.EMPRESA = ? AND EXTRACT(YEAR FROM p.DATAEFE) IN (?, ?)
             GROUP BY 1, 2
         """
-        results_raw = await execute_query_via_agent(empresa_info.company_id, sql, [id_empresa, current_year, previous_year])
+        results_raw = await execute_query_via_agent(empresa_info.company_id, sql, [id_empresa, current_year, previous_year], cache_ttl=300)
         
         results = { current_year: [{"revenue": 0, "margin": 0} for _ in range(12)], previous_year: [{"revenue": 0, "margin": 0} for _ in range(12)] }
         for row in results_raw:
@@ -155,14 +173,14 @@ async def get_sales_margin_evolution(
             FROM TVENPEDIDO p JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA {join_vendor_str}
             WHERE {" AND ".join(where_clauses)} GROUP BY 1 ORDER BY 1 ASC
         """
-        results = await execute_query_via_agent(empresa_info.company_id, sql, params)
+        results = await execute_query_via_agent(empresa_info.company_id, sql, params, cache_ttl=120)
         
         evolution_data = {"dates": [], "margins": []}
         for row in results:
             revenue = float(row['FATURAMENTO'] or 0.0)
             profit = float(row['LUCRO'] or 0.0)
             margin = (profit / revenue) * 100 if revenue > 0 else 0.0
-            evolution_data["dates"].append(datetime.strptime(row['DATAEFE'], '%Y-%m-%d').strftime('%Y-%m-%d'))
+            evolution_data["dates"].append(como_data(row['DATAEFE']).strftime('%Y-%m-%d'))
             evolution_data["margins"].append(round(margin, 2))
         return evolution_data
     except Exception as e:
@@ -189,29 +207,31 @@ async def get_vendor_ranking(
         where_clause = " AND ".join(where_clauses)
         
         sql_revenue = f"SELECT p.VENDEDOR, SUM(CAST(p.VALORLIQUIDO AS DOUBLE PRECISION)) AS FT, COUNT(p.CODIGO) AS TP, SUM(CAST(p.VALORDESCONTO AS DOUBLE PRECISION)) AS TD, SUM(CAST(p.VALORBRUTO AS DOUBLE PRECISION)) AS FB FROM TVENPEDIDO p {join_vendor_str} WHERE {where_clause} GROUP BY p.VENDEDOR"
-        revenue_results = await execute_query_via_agent(empresa_info.company_id, sql_revenue, params)
+        sql_profit = f"SELECT p.VENDEDOR, SUM(CAST(i.VLRLIQUIDO AS DOUBLE PRECISION) - (CAST(i.QTDE AS DOUBLE PRECISION) * CAST(i.CUSTOFINAL AS DOUBLE PRECISION))) AS LG, SUM(CAST(i.QTDE AS DOUBLE PRECISION)) AS TPROD FROM TVENPEDIDO p JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA {join_vendor_str} WHERE {where_clause} GROUP BY p.VENDEDOR"
+        # Os nomes de todos os vendedores da empresa vêm no mesmo lote, evitando uma terceira ida ao agente.
+        sql_names = "SELECT CODIGO, NOME FROM TVENVENDEDOR WHERE EMPRESA = ?"
+
+        batch_res = await execute_batch_via_agent(empresa_info.company_id, {
+            "revenue": (sql_revenue, params),
+            "profit": (sql_profit, params),
+            "names": (sql_names, [id_empresa]),
+        }, cache_ttl=120)
         
         ranking_data = defaultdict(lambda: defaultdict(float))
-        for row in revenue_results:
+        for row in batch_res["revenue"]:
             ranking_data[row['VENDEDOR']]['faturamento_total'] = float(row['FT'] or 0.0)
             ranking_data[row['VENDEDOR']]['total_pedidos'] = int(row['TP'] or 0)
             ranking_data[row['VENDEDOR']]['total_desconto'] = float(row['TD'] or 0.0)
             ranking_data[row['VENDEDOR']]['faturamento_bruto'] = float(row['FB'] or 0.0)
 
-        sql_profit = f"SELECT p.VENDEDOR, SUM(CAST(i.VLRLIQUIDO AS DOUBLE PRECISION) - (CAST(i.QTDE AS DOUBLE PRECISION) * CAST(i.CUSTOFINAL AS DOUBLE PRECISION))) AS LG, SUM(CAST(i.QTDE AS DOUBLE PRECISION)) AS TPROD FROM TVENPEDIDO p JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA {join_vendor_str} WHERE {where_clause} GROUP BY p.VENDEDOR"
-        profit_results = await execute_query_via_agent(empresa_info.company_id, sql_profit, params)
-
-        for row in profit_results:
+        for row in batch_res["profit"]:
             ranking_data[row['VENDEDOR']]['lucro_gerado'] = float(row['LG'] or 0.0)
             ranking_data[row['VENDEDOR']]['total_produtos'] = float(row['TPROD'] or 0.0)
             
-        vendor_ids = [k for k in ranking_data.keys() if k is not None]
         vendor_names = {None: "NÃO IDENTIFICADO"}
-        if vendor_ids:
-            placeholders = ','.join(['?'] * len(vendor_ids))
-            name_results = await execute_query_via_agent(empresa_info.company_id, f"SELECT CODIGO, NOME FROM TVENVENDEDOR WHERE EMPRESA = ? AND CODIGO IN ({placeholders})", [id_empresa] + vendor_ids)
-            for row in name_results:
-                vendor_names[row['CODIGO']] = row['NOME'].strip()
+        for row in batch_res["names"]:
+            if row['CODIGO'] in ranking_data:
+                vendor_names[row['CODIGO']] = (row['NOME'] or '').strip()
 
         ranking = []
         for v_id, data in ranking_data.items():
@@ -230,23 +250,82 @@ async def get_vendor_ranking(
 @router.get("/top-products-vendedor")
 async def get_top_products_by_vendor(start_date: date, end_date: date, vendedor_nome: str, empresa_info: EmpresaInfo = Depends(verificar_empresa), id_empresa: str = Depends(get_company_fk)):
     sql = "SELECT FIRST 10 COALESCE(g.DESCRICAOREDUZIDA, g.DESCRICAO) AS NOME, SUM(CAST(i.VLRLIQUIDO AS DOUBLE PRECISION)) as TOTAL FROM TVENPEDIDO p JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA JOIN TESTPRODUTOGERAL g ON i.PRODUTO = g.CODIGO JOIN TVENVENDEDOR v ON p.VENDEDOR = v.CODIGO AND p.EMPRESA = v.EMPRESA WHERE p.STATUS = 'EFE' AND p.TIPOVENDA = 'NM' AND p.GERAFINANCEIRO = 'S' AND p.DATAEFE BETWEEN ? AND ? AND v.NOME = ? AND p.EMPRESA = ? GROUP BY 1 ORDER BY TOTAL DESC"
-    results = await execute_query_via_agent(empresa_info.company_id, sql, [start_date, end_date, vendedor_nome, id_empresa])
+    results = await execute_query_via_agent(empresa_info.company_id, sql, [start_date, end_date, vendedor_nome, id_empresa], cache_ttl=120)
     return {"labels": [r['NOME'] for r in results], "data": [float(r['TOTAL']) for r in results]}
 
 @router.get("/top-customers-vendedor")
 async def get_top_customers_by_vendor(start_date: date, end_date: date, vendedor_nome: str, empresa_info: EmpresaInfo = Depends(verificar_empresa), id_empresa: str = Depends(get_company_fk)):
     sql = "SELECT FIRST 5 p.CLIENTENOME, SUM(CAST(p.VALORLIQUIDO AS DOUBLE PRECISION)) as TOTAL FROM TVENPEDIDO p JOIN TVENVENDEDOR v ON p.VENDEDOR = v.CODIGO AND p.EMPRESA = v.EMPRESA WHERE p.STATUS = 'EFE' AND p.TIPOVENDA = 'NM' AND p.GERAFINANCEIRO = 'S' AND p.DATAEFE BETWEEN ? AND ? AND v.NOME = ? AND p.EMPRESA = ? AND p.CLIENTENOME IS NOT NULL AND p.CLIENTENOME <> '' GROUP BY 1 HAVING SUM(p.VALORLIQUIDO) > 0 ORDER BY TOTAL DESC"
-    results = await execute_query_via_agent(empresa_info.company_id, sql, [start_date, end_date, vendedor_nome, id_empresa])
+    results = await execute_query_via_agent(empresa_info.company_id, sql, [start_date, end_date, vendedor_nome, id_empresa], cache_ttl=120)
     return [{"cliente": r['CLIENTENOME'], "valor": float(r['TOTAL'])} for r in results]
 
 @router.get("/sales-evolution-vendedor")
 async def get_sales_evolution_by_vendor(start_date: date, end_date: date, vendedor_nome: str, empresa_info: EmpresaInfo = Depends(verificar_empresa), id_empresa: str = Depends(get_company_fk)):
     sql = "SELECT p.DATAEFE, SUM(CAST(p.VALORLIQUIDO AS DOUBLE PRECISION)) AS TOTAL FROM TVENPEDIDO p JOIN TVENVENDEDOR v ON p.VENDEDOR = v.CODIGO AND p.EMPRESA = v.EMPRESA WHERE p.STATUS = 'EFE' AND p.TIPOVENDA = 'NM' AND p.GERAFINANCEIRO = 'S' AND p.DATAEFE BETWEEN ? AND ? AND v.NOME = ? AND p.EMPRESA = ? GROUP BY 1 ORDER BY 1 ASC"
-    results = await execute_query_via_agent(empresa_info.company_id, sql, [start_date, end_date, vendedor_nome, id_empresa])
+    results = await execute_query_via_agent(empresa_info.company_id, sql, [start_date, end_date, vendedor_nome, id_empresa], cache_ttl=120)
     return {"dates": [r['DATAEFE'] for r in results], "sales": [float(r['TOTAL']) for r in results]}
         
 @router.get("/vendedores")
 async def get_all_vendors(empresa_info: EmpresaInfo = Depends(verificar_empresa), id_empresa: str = Depends(get_company_fk)):
     sql = "SELECT NOME FROM TVENVENDEDOR WHERE ATIVO = 'S' AND EMPRESA = ? ORDER BY NOME"
-    results = await execute_query_via_agent(empresa_info.company_id, sql, [id_empresa])
-    return [row['NOME'].strip() for row in results]
\ No newline at end of file
+    results = await execute_query_via_agent(empresa_info.company_id, sql, [id_empresa], cache_ttl=600)
+    return [row['NOME'].strip() for row in results]
+
+def format_ndjson_chunk(rows) -> str:
+    return "".join(json.dumps(dict(row), default=valor_para_json, ensure_ascii=False) + "\n" for row in rows)
+
+def format_csv_chunk(rows, include_header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    if include_header and rows:
+        writer.writerow(list(rows[0].keys()))
+    for row in rows:
+        writer.writerow([v.isoformat() if hasattr(v, "isoformat") else v for v in row.values()])
+    return buffer.getvalue()
+
+@router.get("/export", dependencies=[Depends(usar_prioridade("pesada"))])
+async def export_sales(
+    start_date: date,
+    end_date: date,
+    formato: str = "ndjson",
+    empresa_info: EmpresaInfo = Depends(verificar_empresa),
+    id_empresa: str = Depends(get_company_fk)
+):
+    """
+    Exporta os pedidos do período em NDJSON ou CSV. O resultado vem do agente em partes
+    e cada parte é repassada ao cliente assim que chega, sem montar o arquivo na memória.
+    """
+    if formato not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Formato inválido. Use 'ndjson' ou 'csv'.")
+
+    sql = "SELECT p.CODIGO, p.DATAEFE, p.HORAEFE, p.TIPOVENDA, p.CLIENTENOME, v.NOME AS VENDEDOR, CAST(p.VALORBRUTO AS DOUBLE PRECISION) AS VALORBRUTO, CAST(p.VALORDESCONTO AS DOUBLE PRECISION) AS VALORDESCONTO, CAST(p.VALORLIQUIDO AS DOUBLE PRECISION) AS VALORLIQUIDO FROM TVENPEDIDO p LEFT JOIN TVENVENDEDOR v ON p.VENDEDOR = v.CODIGO AND p.EMPRESA = v.EMPRESA WHERE p.STATUS = 'EFE' AND p.GERAFINANCEIRO = 'S' AND p.DATAEFE BETWEEN ? AND ? AND p.EMPRESA = ? ORDER BY p.DATAEFE, p.CODIGO"
+    chunks = stream_query_via_agent(empresa_info.company_id, sql, [start_date, end_date, id_empresa])
+
+    # A primeira parte é buscada antes de responder, para que agente offline, fila cheia
+    # ou erro na consulta ainda virem um status HTTP em vez de um arquivo cortado.
+    try:
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = []
+    except Exception as e:
+        if isinstance(e, HTTPException): raise e
+        raise HTTPException(status_code=500, detail=f"Erro ao exportar vendas: {e}")
+
+    async def generate():
+        try:
+            if formato == "csv":
+                yield format_csv_chunk(first_chunk, include_header=True)
+                header_sent = bool(first_chunk)
+                async for chunk in chunks:
+                    yield format_csv_chunk(chunk, include_header=not header_sent)
+                    header_sent = header_sent or bool(chunk)
+            else:
+                yield format_ndjson_chunk(first_chunk)
+                async for chunk in chunks:
+                    yield format_ndjson_chunk(chunk)
+        finally:
+            await chunks.aclose()
+
+    filename = f"vendas_{start_date.isoformat()}_{end_date.isoformat()}.{formato}"
+    media_type = "text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson"
+    return StreamingResponse(generate(), media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
\ No newline at end of file
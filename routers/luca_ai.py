@@ -1,17 +1,20 @@
 # TESTE PARA VERIFICAR O GIT
 # /routers/luca_ai.py
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import AsyncIterator, List, Optional, Dict, Tuple
 import os
 import json
 import re
 from datetime import datetime, date, timedelta
-import requests
 from pathlib import Path
 import calendar
 import random
 import io
+from contextlib import aclosing
+import httpx
 
 # --- NOVAS DEPENDÊNCIAS ---
 # Certifique-se de instalar estas bibliotecas com:
@@ -20,11 +23,18 @@ import fitz  # PyMuPDF
 import openpyxl
 import docx
 
-from main_api import send_command_to_agent, execute_query_via_agent
-from dependencies import get_company_fk, EmpresaInfo, verificar_empresa
+from main_api import send_command_to_agent, execute_query_via_agent, execute_queries_concurrently, stream_query_via_agent
+from resultados import valor_para_json
+from dependencies import get_company_fk, EmpresaInfo, verificar_empresa, limitar_requisicoes
+from prioridades import usar_prioridade
+from rastreamento import span
+import cliente_http
 
-router = APIRouter()
+# Consultas da IA são longas e imprevisíveis: vão para a faixa de menor prioridade do agente
+router = APIRouter(dependencies=[Depends(usar_prioridade("pesada"))])
 KNOWLEDGE_BASE_DIR = "base_conhecimento_local"
+# O SQL gerado pela IA pode não ter limite de linhas: o resultado é lido em partes e cortado aqui
+LUCA_MAX_RESULT_ROWS = 500
 
 def load_prompts_from_file() -> Dict:
     """Carrega os templates de prompt do arquivo PROMPT.txt."""
@@ -80,42 +90,86 @@ class LucaResponse(BaseModel):
     answer: str
     report_data: Optional[ReportData] = None
 
-def call_gemini_api(prompt: str, api_key: str):
+# GEMINI_API_URL permite apontar para um servidor simulado (tools/llm_simulado.py) nos testes de carga
+GEMINI_API_URL = os.environ.get("GEMINI_API_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+# Prazo total de cada chamada, somando as retentativas em 429/5xx
+GEMINI_TIMEOUT_SECONDS = float(os.environ.get("GEMINI_TIMEOUT_SECONDS", "90"))
+
+def build_gemini_payload(prompt: str) -> Dict:
+    return {"contents": [{"parts": [{"text": prompt}]}], "safetySettings": [{"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"}, {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"}, {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"}, {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"}]}
+
+def gemini_error_to_http(e: Exception) -> HTTPException:
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, cliente_http.PrazoEsgotado):
+        print(f"ERRO: A API Gemini não respondeu a tempo: {e}")
+        return HTTPException(status_code=504, detail="A IA demorou demais para responder. Tente novamente em instantes.")
+    if isinstance(e, httpx.HTTPStatusError):
+        print(f"ERRO HTTP da API Gemini: {e.response.status_code} - {e.response.text}")
+        return HTTPException(status_code=e.response.status_code, detail=f"Erro na API do Google AI: {e.response.text}")
+    if isinstance(e, httpx.TransportError):
+        print(f"ERRO de conexão com a API Gemini: {e!r}")
+        return HTTPException(status_code=502, detail="Não foi possível se comunicar com a API do Google AI. Tente novamente em instantes.")
+    print(f"ERRO Inesperado na chamada da API: {e}")
+    return HTTPException(status_code=500, detail=f"Ocorreu um erro inesperado na API: {e}")
+
+async def call_gemini_api(prompt: str, api_key: str):
     if not api_key:
         raise HTTPException(status_code=500, detail="A GEMINI_API_KEY não foi configurada no ambiente do servidor.")
     
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-pro-latest:generateContent?key={api_key}"
+    url = f"{GEMINI_API_URL}/v1beta/models/gemini-pro-latest:generateContent?key={api_key}"
     
-    headers = {'Content-Type': 'application/json'}
-    payload = {"contents": [{"parts": [{"text": prompt}]}], "safetySettings": [{"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"}, {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"}, {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"}, {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"}]}
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=90)
+        with span("llm.gemini", modelo="gemini-pro-latest", tamanho_prompt=len(prompt)):
+            response = await cliente_http.post_json("gemini", url, build_gemini_payload(prompt), GEMINI_TIMEOUT_SECONDS)
         response.raise_for_status()
         data = response.json()
         if not data.get('candidates'):
              raise HTTPException(status_code=500, detail="A resposta da IA foi bloqueada ou veio vazia.")
         return data['candidates'][0]['content']['parts'][0]['text']
-    except requests.exceptions.HTTPError as http_err:
-        print(f"ERRO HTTP da API Gemini: {http_err.response.status_code} - {http_err.response.text}")
-        raise HTTPException(status_code=http_err.response.status_code, detail=f"Erro na API do Google AI: {http_err.response.text}")
     except Exception as e:
-        print(f"ERRO Inesperado na chamada da API: {e}")
-        raise HTTPException(status_code=500, detail=f"Ocorreu um erro inesperado na API: {e}")
+        raise gemini_error_to_http(e)
+
+async def call_gemini_api_stream(prompt: str, api_key: str) -> AsyncIterator[str]:
+    """Como call_gemini_api, mas devolve o texto em trechos à medida que o modelo o escreve."""
+    if not api_key:
+        raise HTTPException(status_code=500, detail="A GEMINI_API_KEY não foi configurada no ambiente do servidor.")
+
+    url = f"{GEMINI_API_URL}/v1beta/models/gemini-pro-latest:streamGenerateContent?alt=sse&key={api_key}"
+
+    try:
+        with span("llm.gemini", modelo="gemini-pro-latest", tamanho_prompt=len(prompt), streaming=True):
+            async with aclosing(cliente_http.post_json_linhas("gemini", url, build_gemini_payload(prompt), GEMINI_TIMEOUT_SECONDS)) as lines:
+                async for line in lines:
+                    # Cada evento SSE traz um pedaço da resposta no mesmo formato do generateContent
+                    if not line.startswith("data:"):
+                        continue
+                    data = json.loads(line[5:])
+                    for candidate in data.get('candidates', [])[:1]:
+                        for part in candidate.get('content', {}).get('parts', []):
+                            if part.get('text'):
+                                yield part['text']
+    except Exception as e:
+        raise gemini_error_to_http(e)
 
 async def generate_goal_simulation_response(company_cnpj: str, id_empresa: str, api_key: str) -> str:
     today = date.today()
     current_year, current_month = today.year, today.month
     
     sql_meta = "SELECT VALOR FROM DBMETAS WHERE ID_EMPRESA = ? AND ANO = ? AND MES = ? AND INDICADOR = 'FATURAMENTO_MENSAL'"
-    meta_res = await execute_query_via_agent(company_cnpj, sql_meta, [id_empresa, current_year, current_month])
+    sql_performance = "SELECT SUM(CAST(VALORLIQUIDO AS DOUBLE PRECISION)) AS TOTAL_VENDIDO, COUNT(CODIGO) AS NUM_PEDIDOS FROM TVENPEDIDO WHERE EMPRESA = ? AND STATUS = 'EFE' AND TIPOVENDA = 'NM' AND EXTRACT(YEAR FROM DATAEFE) = ? AND EXTRACT(MONTH FROM DATAEFE) = ?"
+    goal_results = await execute_queries_concurrently(company_cnpj, {
+        "meta": (sql_meta, [id_empresa, current_year, current_month]),
+        "performance": (sql_performance, [id_empresa, current_year, current_month]),
+    }, return_exceptions=False)
+    meta_res = goal_results["meta"]
     
     if not meta_res or not meta_res[0].get('VALOR'):
         return "Não encontrei uma meta de faturamento definida para este mês. Para que eu possa ajudar, por favor, cadastre uma meta no painel específico."
 
     valor_meta = float(meta_res[0]['VALOR'])
 
-    sql_performance = "SELECT SUM(CAST(VALORLIQUIDO AS DOUBLE PRECISION)) AS TOTAL_VENDIDO, COUNT(CODIGO) AS NUM_PEDIDOS FROM TVENPEDIDO WHERE EMPRESA = ? AND STATUS = 'EFE' AND TIPOVENDA = 'NM' AND EXTRACT(YEAR FROM DATAEFE) = ? AND EXTRACT(MONTH FROM DATAEFE) = ?"
-    perf_res = await execute_query_via_agent(company_cnpj, sql_performance, [id_empresa, current_year, current_month])
+    perf_res = goal_results["performance"]
     
     total_vendido = float(perf_res[0].get('TOTAL_VENDIDO') or 0.0) if perf_res else 0.0
     num_pedidos = int(perf_res[0].get('NUM_PEDIDOS') or 0) if perf_res else 0
@@ -151,32 +205,35 @@ async def generate_goal_simulation_response(company_cnpj: str, id_empresa: str,
         novo_ticket_medio_sugerido=novo_ticket_medio_sugerido,
         novas_vendas_necessarias=novas_vendas_necessarias
     )
-    return call_gemini_api(prompt_contexto, api_key)
+    return await call_gemini_api(prompt_contexto, api_key)
 
 async def generate_promotion_ideas(company_cnpj: str, id_empresa: str, api_key: str) -> str:
     sql_bundles = "SELECT FIRST 5 g1.DESCRICAO as NOME_A, g2.DESCRICAO as NOME_B, COUNT(*) as VEZES_COMPRADOS_JUNTOS FROM TVENPRODUTO p1 JOIN TVENPRODUTO p2 ON p1.PEDIDO = p2.PEDIDO AND p1.PRODUTO < p2.PRODUTO AND p1.EMPRESA = p2.EMPRESA JOIN TVENPEDIDO ped ON p1.PEDIDO = ped.CODIGO AND p1.EMPRESA = ped.EMPRESA JOIN TESTPRODUTOGERAL g1 ON p1.PRODUTO = g1.CODIGO JOIN TESTPRODUTOGERAL g2 ON p2.PRODUTO = g2.CODIGO WHERE ped.EMPRESA = ? AND ped.STATUS = 'EFE' AND ped.TIPOVENDA = 'NM' AND ped.DATAEFE >= DATEADD(-90 DAY TO CURRENT_DATE) GROUP BY 1, 2 ORDER BY 3 DESC"
-    bundles_res = await execute_query_via_agent(company_cnpj, sql_bundles, [id_empresa])
 
     sql_volume = "SELECT FIRST 5 g.DESCRICAO, SUM(CAST(i.QTDE AS DOUBLE PRECISION)) as TOTAL_QTDE FROM TVENPEDIDO p JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA JOIN TESTPRODUTOGERAL g ON i.PRODUTO = g.CODIGO WHERE p.EMPRESA = ? AND p.STATUS = 'EFE' AND p.TIPOVENDA = 'NM' AND p.DATAEFE >= DATEADD(-90 DAY TO CURRENT_DATE) GROUP BY 1 ORDER BY 2 DESC"
-    volume_res = await execute_query_via_agent(company_cnpj, sql_volume, [id_empresa])
+    promotion_results = await execute_queries_concurrently(company_cnpj, {
+        "bundles": (sql_bundles, [id_empresa]),
+        "volume": (sql_volume, [id_empresa]),
+    }, return_exceptions=False)
+    bundles_res, volume_res = promotion_results["bundles"], promotion_results["volume"]
 
     if not bundles_res and not volume_res:
         return "💡 Para que eu possa sugerir promoções eficazes, preciso de um histórico maior de vendas. Continue registrando seus pedidos e em breve terei insights valiosos para você!"
 
     bundles_data_str = ""
     if bundles_res:
-        bundles_data_str = f"**Produtos Frequentemente Comprados Juntos (últimos 90 dias):**\n`{json.dumps(bundles_res, indent=2, default=str)}`\n\n"
+        bundles_data_str = f"**Produtos Frequentemente Comprados Juntos (últimos 90 dias):**\n`{json.dumps(bundles_res, indent=2, default=valor_para_json)}`\n\n"
 
     volume_data_str = ""
     if volume_res:
-        volume_data_str = f"**Produtos Mais Vendidos em Quantidade (últimos 90 dias):**\n`{json.dumps(volume_res, indent=2, default=str)}`\n\n"
+        volume_data_str = f"**Produtos Mais Vendidos em Quantidade (últimos 90 dias):**\n`{json.dumps(volume_res, indent=2, default=valor_para_json)}`\n\n"
 
     prompt_template = PROMPTS.get("promotion_ideas")
     if not prompt_template: return "Erro: Template de prompt 'promotion_ideas' não encontrado."
 
     prompt = prompt_template.format(bundles_data=bundles_data_str, volume_data=volume_data_str)
     
-    return call_gemini_api(prompt, api_key)
+    return await call_gemini_api(prompt, api_key)
 
 async def generate_surprise_insight(company_cnpj: str, id_empresa: str, api_key: str) -> str:
     async def analyze_worst_selling_day():
@@ -202,7 +259,7 @@ async def generate_surprise_insight(company_cnpj: str, id_empresa: str, api_key:
         prompt_template = PROMPTS.get("surprise_high_margin")
         if not prompt_template: return "Erro: Template 'surprise_high_margin' não encontrado."
 
-        prompt_context = prompt_template.format(results=json.dumps(results, indent=2, default=str))
+        prompt_context = prompt_template.format(results=json.dumps(results, indent=2, default=valor_para_json))
         return await call_gemini_api(prompt_context, api_key)
 
     possible_analyses = [analyze_worst_selling_day, analyze_high_margin_low_volume]
@@ -227,102 +284,173 @@ async def get_chat_history(empresa_info: EmpresaInfo = Depends(verificar_empresa
         print(f"ERRO ao buscar histórico de chat via agente: {e}")
         raise HTTPException(status_code=500, detail="Não foi possível carregar o histórico de conversas do agente local.")
 
-@router.post("/luca/chat", response_model=LucaResponse)
-async def handle_luca_chat(request: LucaRequest, empresa_info: EmpresaInfo = Depends(verificar_empresa), id_empresa: str = Depends(get_company_fk)):
-    try:
-        if not PROMPTS:
-            raise HTTPException(status_code=500, detail="O arquivo de prompts (PROMPT.txt) não foi carregado ou está vazio. Verifique os logs do servidor.")
-
-        # ### MELHORIA APLICADA AQUI ###
-        # A chave de API agora é lida a partir das variáveis de ambiente do servidor.
-        # Configure a variável 'GEMINI_API_KEY' no seu ambiente de produção (Render).
-        api_key = os.environ.get("GEMINI_API_KEY")
-        
-        user_id, company_id = empresa_info.uid, empresa_info.company_id
-        current_date_str = datetime.now().strftime('%Y-%m-%d')
-        
-        full_history = await send_command_to_agent(company_id, "carregar_historico", {"user_id": user_id})
-        today_history = full_history.get(current_date_str, [])
-        new_messages = [{"role": "user", "content": request.prompt}]
-        
-        prompt_lower = request.prompt.lower()
-        goal_keywords = ["atingir a meta", "alcançar a meta", "bater a meta"]
-        promotion_keywords = ["promoção", "promocao", "oferta", "desconto", "campanha"]
-        surprise_keyword = "me surpreenda!"
-
-        final_answer = None
-        if surprise_keyword in prompt_lower:
-            final_answer = await generate_surprise_insight(company_id, id_empresa, api_key)
-        elif any(keyword in prompt_lower for keyword in promotion_keywords):
-            final_answer = await generate_promotion_ideas(company_id, id_empresa, api_key)
-        elif any(keyword in prompt_lower for keyword in goal_keywords):
-            final_answer = await generate_goal_simulation_response(company_id, id_empresa, api_key)
-
-        if final_answer:
-            new_messages.append({"role": "model", "content": final_answer})
-            await send_command_to_agent(company_id, "salvar_historico", {"user_id": user_id, "date_str": current_date_str, "new_messages": new_messages})
-            return LucaResponse(answer=final_answer)
-
-        knowledge_base_content = load_knowledge_from_local_files(KNOWLEDGE_BASE_DIR)
-        formatted_history = "\n".join([f"  - {msg['role']}: {msg['content']}" for msg in today_history[-8:]])
-
-        prompt_template = PROMPTS.get("sql_generation")
-        if not prompt_template: return LucaResponse(answer="Erro: Template de prompt 'sql_generation' não encontrado.")
-
-        full_prompt_for_sql = prompt_template.format(
-            formatted_history=formatted_history,
-            knowledge_base_content=knowledge_base_content,
-            id_empresa=id_empresa,
-            current_date_str=current_date_str,
-            prompt=request.prompt
-        )
-
-        generated_text = call_gemini_api(full_prompt_for_sql, api_key)
-        
-        generated_sql = None
-        if "```sql" in generated_text:
-            parts = generated_text.split("```sql", 1)
-            if len(parts) > 1: generated_sql = parts[1].split("```")[0].strip()
+async def luca_chat_events(request: LucaRequest, empresa_info: EmpresaInfo, id_empresa: str, stream_summary: bool = False) -> AsyncIterator[Tuple[str, Dict]]:
+    """
+    Atendimento de uma pergunta ao LUCA como uma sequência de eventos (nome, dados), emitidos
+    à medida que cada etapa termina: 'etapa' (andamento), 'sql' (consulta gerada), 'linhas'
+    (tamanho do resultado), 'token' (trechos do resumo, com stream_summary) e, por último,
+    'fim' (resposta completa e relatório). /luca/chat usa só o 'fim'; /luca/chat/stream
+    repassa todos ao navegador.
+    """
+    if not PROMPTS:
+        raise HTTPException(status_code=500, detail="O arquivo de prompts (PROMPT.txt) não foi carregado ou está vazio. Verifique os logs do servidor.")
 
-        if not generated_sql or not generated_sql.upper().startswith("SELECT"):
-            new_messages.append({"role": "model", "content": generated_text})
-            await send_command_to_agent(company_id, "salvar_historico", {"user_id": user_id, "date_str": current_date_str, "new_messages": new_messages})
-            return LucaResponse(answer=generated_text)
+    # ### MELHORIA APLICADA AQUI ###
+    # A chave de API agora é lida a partir das variáveis de ambiente do servidor.
+    # Configure a variável 'GEMINI_API_KEY' no seu ambiente de produção (Render).
+    api_key = os.environ.get("GEMINI_API_KEY")
+    
+    user_id, company_id = empresa_info.uid, empresa_info.company_id
+    current_date_str = datetime.now().strftime('%Y-%m-%d')
+    
+    yield "etapa", {"etapa": "historico", "mensagem": "Lendo a conversa de hoje..."}
+    full_history = await send_command_to_agent(company_id, "carregar_historico", {"user_id": user_id})
+    today_history = full_history.get(current_date_str, [])
+    new_messages = [{"role": "user", "content": request.prompt}]
+    
+    prompt_lower = request.prompt.lower()
+    goal_keywords = ["atingir a meta", "alcançar a meta", "bater a meta"]
+    promotion_keywords = ["promoção", "promocao", "oferta", "desconto", "campanha"]
+    surprise_keyword = "me surpreenda!"
+
+    special_analysis = None
+    if surprise_keyword in prompt_lower:
+        special_analysis = generate_surprise_insight
+    elif any(keyword in prompt_lower for keyword in promotion_keywords):
+        special_analysis = generate_promotion_ideas
+    elif any(keyword in prompt_lower for keyword in goal_keywords):
+        special_analysis = generate_goal_simulation_response
+
+    final_answer = None
+    if special_analysis:
+        yield "etapa", {"etapa": "analisando", "mensagem": "Analisando os dados da empresa..."}
+        final_answer = await special_analysis(company_id, id_empresa, api_key)
+
+    if final_answer:
+        new_messages.append({"role": "model", "content": final_answer})
+        await send_command_to_agent(company_id, "salvar_historico", {"user_id": user_id, "date_str": current_date_str, "new_messages": new_messages})
+        yield "fim", {"answer": final_answer, "report_data": None}
+        return
+
+    knowledge_base_content = load_knowledge_from_local_files(KNOWLEDGE_BASE_DIR)
+    formatted_history = "\n".join([f"  - {msg['role']}: {msg['content']}" for msg in today_history[-8:]])
+
+    prompt_template = PROMPTS.get("sql_generation")
+    if not prompt_template:
+        yield "fim", {"answer": "Erro: Template de prompt 'sql_generation' não encontrado.", "report_data": None}
+        return
+
+    full_prompt_for_sql = prompt_template.format(
+        formatted_history=formatted_history,
+        knowledge_base_content=knowledge_base_content,
+        id_empresa=id_empresa,
+        current_date_str=current_date_str,
+        prompt=request.prompt
+    )
 
-        print(f"INFO: SQL Gerado e extraído: {generated_sql}")
-        
-        query_result = await execute_query_via_agent(company_id, generated_sql, [])
+    yield "etapa", {"etapa": "gerando_sql", "mensagem": "Entendendo a pergunta e montando a consulta..."}
+    generated_text = await call_gemini_api(full_prompt_for_sql, api_key)
+    
+    generated_sql = None
+    if "```sql" in generated_text:
+        parts = generated_text.split("```sql", 1)
+        if len(parts) > 1: generated_sql = parts[1].split("```")[0].strip()
 
-        if query_result is None or not query_result:
-            return LucaResponse(answer="Realizei a consulta, mas não encontrei nenhum resultado para sua pergunta.")
+    if not generated_sql or not generated_sql.upper().startswith("SELECT"):
+        new_messages.append({"role": "model", "content": generated_text})
+        await send_command_to_agent(company_id, "salvar_historico", {"user_id": user_id, "date_str": current_date_str, "new_messages": new_messages})
+        yield "fim", {"answer": generated_text, "report_data": None}
+        return
 
-        prompt_template_summary = PROMPTS.get("summary_generation")
-        if not prompt_template_summary: return LucaResponse(answer="Erro: Template 'summary_generation' não encontrado.")
-        
-        prompt_for_summary = prompt_template_summary.format(
-            prompt=request.prompt,
-            query_result=json.dumps(query_result, indent=2, default=str)
+    print(f"INFO: SQL Gerado e extraído: {generated_sql}")
+    yield "sql", {"sql": generated_sql}
+    
+    yield "etapa", {"etapa": "consultando", "mensagem": "Consultando o banco de dados da loja..."}
+    query_result = []
+    async with aclosing(stream_query_via_agent(company_id, generated_sql, [], prepare=False)) as chunks:
+        async for chunk in chunks:
+            query_result.extend(chunk[:LUCA_MAX_RESULT_ROWS - len(query_result)])
+            if len(query_result) >= LUCA_MAX_RESULT_ROWS:
+                break
+    yield "linhas", {"total": len(query_result), "limite_atingido": len(query_result) >= LUCA_MAX_RESULT_ROWS}
+
+    if query_result is None or not query_result:
+        yield "fim", {"answer": "Realizei a consulta, mas não encontrei nenhum resultado para sua pergunta.", "report_data": None}
+        return
+
+    prompt_template_summary = PROMPTS.get("summary_generation")
+    if not prompt_template_summary:
+        yield "fim", {"answer": "Erro: Template 'summary_generation' não encontrado.", "report_data": None}
+        return
+    
+    prompt_for_summary = prompt_template_summary.format(
+        prompt=request.prompt,
+        query_result=json.dumps(query_result, indent=2, default=valor_para_json)
+    )
+    yield "etapa", {"etapa": "resumindo", "mensagem": "Escrevendo a resposta..."}
+    if stream_summary:
+        answer_parts = []
+        async with aclosing(call_gemini_api_stream(prompt_for_summary, api_key)) as summary_chunks:
+            async for text in summary_chunks:
+                answer_parts.append(text)
+                yield "token", {"texto": text}
+        final_answer = "".join(answer_parts)
+        if not final_answer:
+            raise HTTPException(status_code=500, detail="A resposta da IA foi bloqueada ou veio vazia.")
+    else:
+        final_answer = await call_gemini_api(prompt_for_summary, api_key)
+    
+    new_messages.append({"role": "model", "content": final_answer})
+    await send_command_to_agent(company_id, "salvar_historico", {"user_id": user_id, "date_str": current_date_str, "new_messages": new_messages})
+
+    report_data = None
+    if any(keyword in request.prompt.lower() for keyword in ["relatório", "tabela", "liste"]):
+        report_data = ReportData(
+            title=f"Relatório para: {request.prompt}", summary=final_answer,
+            table_headers=list(query_result[0].keys()) if query_result else [],
+            table_rows=[dict(linha) for linha in query_result]
         )
-        final_answer = call_gemini_api(prompt_for_summary, api_key)
-        
-        new_messages.append({"role": "model", "content": final_answer})
-        await send_command_to_agent(company_id, "salvar_historico", {"user_id": user_id, "date_str": current_date_str, "new_messages": new_messages})
 
-        report_data = None
-        if any(keyword in request.prompt.lower() for keyword in ["relatório", "tabela", "liste"]):
-            report_data = ReportData(
-                title=f"Relatório para: {request.prompt}", summary=final_answer,
-                table_headers=list(query_result[0].keys()) if query_result else [],
-                table_rows=query_result
-            )
+    yield "fim", {"answer": final_answer, "report_data": report_data}
 
-        return LucaResponse(answer=final_answer, report_data=report_data)
+def format_sse_event(event: str, data: Dict) -> str:
+    # json.dumps escapa as quebras de linha: cada evento cabe numa única linha 'data:'
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+@router.post("/luca/chat", response_model=LucaResponse, dependencies=[Depends(limitar_requisicoes("llm"))])
+async def handle_luca_chat(request: LucaRequest, empresa_info: EmpresaInfo = Depends(verificar_empresa), id_empresa: str = Depends(get_company_fk)):
+    try:
+        async with aclosing(luca_chat_events(request, empresa_info, id_empresa)) as events:
+            async for event, data in events:
+                if event == "fim":
+                    return LucaResponse(**data)
+        raise HTTPException(status_code=500, detail="O LUCA terminou sem produzir uma resposta.")
 
     except Exception as e:
         if isinstance(e, HTTPException): raise e
         raise HTTPException(status_code=500, detail=f"Ocorreu um erro inesperado no servidor do LUCA: {str(e)}")
 
-@router.post("/luca/upload-and-analyze", response_model=LucaResponse)
+@router.post("/luca/chat/stream", dependencies=[Depends(limitar_requisicoes("llm"))])
+async def handle_luca_chat_stream(request: LucaRequest, empresa_info: EmpresaInfo = Depends(verificar_empresa), id_empresa: str = Depends(get_company_fk)):
+    """
+    Mesma conversa de /luca/chat em Server-Sent Events: cada etapa é enviada assim que termina
+    e o resumo chega trecho a trecho enquanto o modelo o escreve. Como o status 200 já foi
+    enviado, erros no meio do caminho chegam como um evento 'erro' com o 'detail'.
+    """
+    async def generate():
+        async with aclosing(luca_chat_events(request, empresa_info, id_empresa, stream_summary=True)) as events:
+            try:
+                async for event, data in events:
+                    yield format_sse_event(event, data)
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else f"Ocorreu um erro inesperado no servidor do LUCA: {str(e)}"
+                print(f"ERRO no chat do LUCA (streaming): {detail}")
+                yield format_sse_event("erro", {"detail": detail})
+
+    # X-Accel-Buffering: impede que um proxy reverso segure os eventos até o fim da resposta
+    return StreamingResponse(generate(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.post("/luca/upload-and-analyze", response_model=LucaResponse, dependencies=[Depends(limitar_requisicoes("llm"))])
 async def handle_file_upload(
     empresa_info: EmpresaInfo = Depends(verificar_empresa), 
     file: UploadFile = File(...)
@@ -401,7 +529,7 @@ async def handle_file_upload(
             file_content=file_content
         )
 
-        final_answer = call_gemini_api(full_prompt, api_key)
+        final_answer = await call_gemini_api(full_prompt, api_key)
         
         user_id, company_id = empresa_info.uid, empresa_info.company_id
         current_date_str = datetime.now().strftime('%Y-%m-%d')
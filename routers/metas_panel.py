@@ -2,12 +2,13 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
-from dependencies import get_company_fk, EmpresaInfo, verificar_empresa
-from main_api import execute_query_via_agent
+from dependencies import get_company_fk, EmpresaInfo, verificar_empresa, limitar_requisicoes
+from main_api import execute_query_via_agent, invalidate_cache
 
 router = APIRouter(
     prefix="/api/metas",
-    tags=["Painel de Metas"]
+    tags=["Painel de Metas"],
+    dependencies=[Depends(limitar_requisicoes())]
 )
 
 class Meta(BaseModel):
@@ -46,7 +47,7 @@ async def get_metas(empresa_info: EmpresaInfo = Depends(verificar_empresa), id_e
     try:
         await criar_tabela_metas_se_nao_existir_async(empresa_info.company_id, id_empresa)
         sql = "SELECT INDICADOR, ANO, MES, VALOR FROM DBMETAS WHERE ID_EMPRESA = ? ORDER BY ANO, MES, INDICADOR"
-        results = await execute_query_via_agent(empresa_info.company_id, sql, [id_empresa])
+        results = await execute_query_via_agent(empresa_info.company_id, sql, [id_empresa], cache_ttl=300, cache_tags=["metas"])
         return [{"indicador": r['INDICADOR'], "ano": r['ANO'], "mes": r['MES'], "valor": float(r['VALOR'] or 0.0)} for r in results]
     except Exception as e:
         if isinstance(e, HTTPException): raise e
@@ -80,6 +81,7 @@ async def set_meta(meta: Meta, empresa_info: EmpresaInfo = Depends(verificar_emp
         params = [id_empresa, meta.indicador, meta.ano, meta.mes, meta.valor]
         
         await execute_query_via_agent(empresa_info.company_id, sql, params)
+        await invalidate_cache(empresa_info.company_id, "metas")
         return {"status": "sucesso", "mensagem": "Meta salva com sucesso!"}
     except Exception as e:
         if isinstance(e, HTTPException): raise e
@@ -91,6 +93,7 @@ async def delete_meta(meta: MetaDelete, empresa_info: EmpresaInfo = Depends(veri
         await criar_tabela_metas_se_nao_existir_async(empresa_info.company_id, id_empresa)
         sql = "DELETE FROM DBMETAS WHERE ID_EMPRESA = ? AND INDICADOR = ? AND ANO = ? AND MES = ?"
         await execute_query_via_agent(empresa_info.company_id, sql, [id_empresa, meta.indicador, meta.ano, meta.mes])
+        await invalidate_cache(empresa_info.company_id, "metas")
         return {"status": "sucesso", "mensagem": "Meta removida com sucesso!"}
     except Exception as e:
         if isinstance(e, HTTPException): raise e
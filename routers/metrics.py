@@ -0,0 +1,28 @@
+# /routers/metrics.py
+import os
+import secrets
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from main_api import collect_worker_metrics
+from metricas import gerar_exposicao
+
+# Token do scrape do Prometheus ('Authorization: Bearer ...'). Sem ele configurado o endpoint
+# fica desligado: as métricas trazem os CNPJs das empresas.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+router = APIRouter(tags=["Métricas"])
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(request: Request):
+    """ Métricas do pipeline de consultas ao agente e das rotas HTTP, no formato de texto do Prometheus. """
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Métricas desativadas (METRICS_TOKEN não configurado).")
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not secrets.compare_digest(token, METRICS_TOKEN):
+        raise HTTPException(status_code=401, detail="Token de métricas inválido.")
+    try:
+        collected = await collect_worker_metrics()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao coletar as métricas: {e}")
+    return PlainTextResponse(gerar_exposicao(collected), media_type="text/plain; version=0.0.4; charset=utf-8")
\ No newline at end of file
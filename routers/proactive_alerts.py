@@ -1,19 +1,23 @@
 # routers/proactive_alerts.py
 from fastapi import APIRouter, Depends, HTTPException
-from datetime import date, timedelta, datetime
-from dependencies import verificar_empresa, get_company_fk, EmpresaInfo
-from main_api import execute_query_via_agent
+from datetime import date, timedelta
+from dependencies import verificar_empresa, get_company_fk, EmpresaInfo, limitar_requisicoes
+from main_api import execute_queries_concurrently, AGENT_UNAVAILABLE_STATUS
+from resultados import como_data
 import calendar
 
 router = APIRouter(
     prefix="/alerts",
-    tags=["Alertas Proativos"]
+    tags=["Alertas Proativos"],
+    dependencies=[Depends(limitar_requisicoes())]
 )
 
 # Mapeia o dia da semana do Python (0=Segunda) para o do Firebird (1=Domingo)
 def python_weekday_to_firebird(d):
     return (d.weekday() + 2) % 7 or 7
 
+PROACTIVE_SECTION_LABELS = {"sales": "queda nas vendas", "returns": "devoluções", "risk_clients": "clientes em risco"}
+
 
 @router.get("/proactive")
 async def get_proactive_alerts(empresa_info: EmpresaInfo = Depends(verificar_empresa), id_empresa: str = Depends(get_company_fk)):
@@ -34,11 +38,52 @@ async def get_proactive_alerts(empresa_info: EmpresaInfo = Depends(verificar_emp
         """
         firebird_weekday = python_weekday_to_firebird(today)
         history_start_date_sales = today - timedelta(weeks=4)
-        sales_res = await execute_query_via_agent(
-            empresa_info.company_id, 
-            sales_sql, 
-            [today, firebird_weekday, today, history_start_date_sales, id_empresa]
-        )
+
+        # --- 2. ALERTA DE AUMENTO NAS DEVOLUÇÕES ---
+        returns_sql = """
+            SELECT
+                SUM(CASE WHEN p.DATAEFE = ? THEN CAST(p.VALORLIQUIDO AS DOUBLE PRECISION) ELSE 0 END) as DEVOLUCOES_HOJE,
+                SUM(CASE WHEN EXTRACT(WEEKDAY FROM p.DATAEFE) = ? AND p.DATAEFE < ? AND p.DATAEFE >= ? THEN CAST(p.VALORLIQUIDO AS DOUBLE PRECISION) ELSE 0 END) as DEVOLUCOES_HISTORICO
+            FROM TVENPEDIDO p
+            WHERE p.EMPRESA = ? AND p.STATUS = 'EFE' AND p.TIPOVENDA = 'DV'
+        """
+
+        # --- 3. ALERTA DE CLIENTES EM RISCO ---
+        inactivity_threshold_days = 40
+        valuable_client_period_days = 180
+        min_valuable_amount = 1000.0
+
+        risk_clients_sql = f"""
+            SELECT FIRST 10 p.CLIENTENOME, SUM(CAST(p.VALORLIQUIDO AS DOUBLE PRECISION)) as TOTAL_VALOR, MAX(p.DATAEFE) as ULTIMA_COMPRA
+            FROM TVENPEDIDO p WHERE p.EMPRESA = ? AND p.STATUS = 'EFE' AND p.TIPOVENDA = 'NM' AND p.DATAEFE >= ? AND p.CLIENTENOME IS NOT NULL AND p.CLIENTENOME <> ''
+            GROUP BY 1 HAVING SUM(CAST(p.VALORLIQUIDO AS DOUBLE PRECISION)) > ? ORDER BY 2 DESC
+        """
+        history_start_date_clients = today - timedelta(days=valuable_client_period_days)
+
+        # As três seções são independentes: rodam em paralelo e a falha de uma não descarta as outras.
+        section_results = await execute_queries_concurrently(empresa_info.company_id, {
+            "sales": (sales_sql, [today, firebird_weekday, today, history_start_date_sales, id_empresa]),
+            "returns": (returns_sql, [today, firebird_weekday, today, history_start_date_sales, id_empresa]),
+            "risk_clients": (risk_clients_sql, [id_empresa, history_start_date_clients, min_valuable_amount]),
+        }, cache_ttl=120)
+        failed_sections = [section for section, result in section_results.items() if isinstance(result, Exception)]
+        for section in failed_sections:
+            print(f"AVISO: Seção '{section}' dos alertas proativos falhou: {section_results[section]}")
+        if len(failed_sections) == len(section_results):
+            # Uma lista vazia aqui seria lida como "nada a relatar". Limite de taxa (429), erro de
+            # SQL (400) etc. seguem com o próprio status; só agente fora do ar vira o 503 abaixo.
+            first_error = section_results[failed_sections[0]]
+            if isinstance(first_error, HTTPException) and first_error.status_code not in AGENT_UNAVAILABLE_STATUS:
+                raise first_error
+            raise HTTPException(
+                status_code=503,
+                detail="Não foi possível verificar os alertas agora: o agente local não respondeu.",
+                headers=getattr(first_error, "headers", None)
+            )
+        for section in failed_sections:
+            section_results[section] = []
+
+        sales_res = section_results["sales"]
         if sales_res and sales_res[0]:
             sales_data = sales_res[0]
             vendas_hoje = float(sales_data.get('VENDAS_HOJE') or 0.0)
@@ -53,19 +98,7 @@ async def get_proactive_alerts(empresa_info: EmpresaInfo = Depends(verificar_emp
                     "message": f"As vendas de hoje estão <strong>{percent_drop:.0f}% abaixo</strong> da média para este dia da semana (R$ {vendas_hoje:,.2f} de R$ {media_historica_vendas:,.2f})."
                 })
 
-        # --- 2. ALERTA DE AUMENTO NAS DEVOLUÇÕES ---
-        returns_sql = """
-            SELECT
-                SUM(CASE WHEN p.DATAEFE = ? THEN CAST(p.VALORLIQUIDO AS DOUBLE PRECISION) ELSE 0 END) as DEVOLUCOES_HOJE,
-                SUM(CASE WHEN EXTRACT(WEEKDAY FROM p.DATAEFE) = ? AND p.DATAEFE < ? AND p.DATAEFE >= ? THEN CAST(p.VALORLIQUIDO AS DOUBLE PRECISION) ELSE 0 END) as DEVOLUCOES_HISTORICO
-            FROM TVENPEDIDO p
-            WHERE p.EMPRESA = ? AND p.STATUS = 'EFE' AND p.TIPOVENDA = 'DV'
-        """
-        returns_res = await execute_query_via_agent(
-            empresa_info.company_id, 
-            returns_sql, 
-            [today, firebird_weekday, today, history_start_date_sales, id_empresa]
-        )
+        returns_res = section_results["returns"]
         if returns_res and returns_res[0]:
             returns_data = returns_res[0]
             devolucoes_hoje = float(returns_data.get('DEVOLUCOES_HOJE') or 0.0)
@@ -79,24 +112,13 @@ async def get_proactive_alerts(empresa_info: EmpresaInfo = Depends(verificar_emp
                     "message": f"O valor de devoluções hoje (R$ {devolucoes_hoje:,.2f}) está significativamente acima da média histórica para este dia da semana."
                 })
 
-        # --- 3. ALERTA DE CLIENTES EM RISCO ---
-        inactivity_threshold_days = 40
-        valuable_client_period_days = 180
-        min_valuable_amount = 1000.0
-
-        risk_clients_sql = f"""
-            SELECT FIRST 10 p.CLIENTENOME, SUM(CAST(p.VALORLIQUIDO AS DOUBLE PRECISION)) as TOTAL_VALOR, MAX(p.DATAEFE) as ULTIMA_COMPRA
-            FROM TVENPEDIDO p WHERE p.EMPRESA = ? AND p.STATUS = 'EFE' AND p.TIPOVENDA = 'NM' AND p.DATAEFE >= ? AND p.CLIENTENOME IS NOT NULL AND p.CLIENTENOME <> ''
-            GROUP BY 1 HAVING SUM(CAST(p.VALORLIQUIDO AS DOUBLE PRECISION)) > ? ORDER BY 2 DESC
-        """
-        history_start_date_clients = today - timedelta(days=valuable_client_period_days)
-        risk_clients_res = await execute_query_via_agent(empresa_info.company_id, risk_clients_sql, [id_empresa, history_start_date_clients, min_valuable_amount])
+        risk_clients_res = section_results["risk_clients"]
 
         if risk_clients_res:
             for client in risk_clients_res:
                 last_purchase_str = client.get('ULTIMA_COMPRA')
                 if not last_purchase_str: continue
-                last_purchase_date = datetime.strptime(last_purchase_str, '%Y-%m-%d').date()
+                last_purchase_date = como_data(last_purchase_str)
                 days_since_last_purchase = (today - last_purchase_date).days
                 if days_since_last_purchase > inactivity_threshold_days:
                     client_name = client.get('CLIENTENOME').strip()
@@ -105,8 +127,17 @@ async def get_proactive_alerts(empresa_info: EmpresaInfo = Depends(verificar_emp
                         "title": "Oportunidade de Retenção",
                         "message": f"O cliente <strong>{client_name}</strong>, um dos seus mais valiosos, não faz um pedido há <strong>{days_since_last_purchase} dias</strong>. Sugerimos entrar em contato."
                     })
+
+        if failed_sections:
+            labels = ", ".join(PROACTIVE_SECTION_LABELS[section] for section in failed_sections)
+            notifications.append({
+                "type": "warning",
+                "title": "Alertas Incompletos",
+                "message": f"Não foi possível verificar agora: <strong>{labels}</strong>. Os demais alertas estão atualizados."
+            })
         return notifications
     except Exception as e:
+        if isinstance(e, HTTPException): raise e
         print(f"ERRO ao gerar alertas proativos: {e}")
         return []
 
@@ -132,11 +163,20 @@ async def get_daily_insight(empresa_info: EmpresaInfo = Depends(verificar_empres
             FROM TVENPEDIDO p
             WHERE p.EMPRESA = ? AND p.STATUS = 'EFE' AND p.TIPOVENDA = 'NM'
         """
-        sales_res = await execute_query_via_agent(
-            empresa_info.company_id, 
-            sales_sql, 
-            [yesterday, firebird_weekday, yesterday, history_start_date, id_empresa]
-        )
+        # 2. Encontrar o produto de maior destaque ontem
+        top_product_sql = """
+            SELECT FIRST 1 g.DESCRICAOREDUZIDA
+            FROM TVENPEDIDO p
+            JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA
+            JOIN TESTPRODUTOGERAL g ON i.PRODUTO = g.CODIGO
+            WHERE p.EMPRESA = ? AND p.STATUS = 'EFE' AND p.TIPOVENDA = 'NM' AND p.DATAEFE = ?
+            GROUP BY 1 ORDER BY SUM(CAST(i.VLRLIQUIDO AS DOUBLE PRECISION)) DESC
+        """
+        insight_results = await execute_queries_concurrently(empresa_info.company_id, {
+            "sales": (sales_sql, [yesterday, firebird_weekday, yesterday, history_start_date, id_empresa]),
+            "top_product": (top_product_sql, [id_empresa, yesterday]),
+        }, return_exceptions=False, cache_ttl=600)
+        sales_res = insight_results["sales"]
         
         comparison_percent = 0
         if sales_res and sales_res[0]:
@@ -149,16 +189,7 @@ async def get_daily_insight(empresa_info: EmpresaInfo = Depends(verificar_empres
             if media_historica_vendas > 0:
                 comparison_percent = ((vendas_ontem - media_historica_vendas) / media_historica_vendas) * 100
         
-        # 2. Encontrar o produto de maior destaque ontem
-        top_product_sql = """
-            SELECT FIRST 1 g.DESCRICAOREDUZIDA
-            FROM TVENPEDIDO p
-            JOIN TVENPRODUTO i ON p.CODIGO = i.PEDIDO AND p.EMPRESA = i.EMPRESA
-            JOIN TESTPRODUTOGERAL g ON i.PRODUTO = g.CODIGO
-            WHERE p.EMPRESA = ? AND p.STATUS = 'EFE' AND p.TIPOVENDA = 'NM' AND p.DATAEFE = ?
-            GROUP BY 1 ORDER BY SUM(CAST(i.VLRLIQUIDO AS DOUBLE PRECISION)) DESC
-        """
-        top_product_res = await execute_query_via_agent(empresa_info.company_id, top_product_sql, [id_empresa, yesterday])
+        top_product_res = insight_results["top_product"]
 
         top_product = None
         if top_product_res and top_product_res[0] and top_product_res[0].get('DESCRICAOREDUZIDA'):
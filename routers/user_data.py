@@ -1,11 +1,10 @@
 # routers/user_data.py
 from fastapi import APIRouter, Depends, HTTPException
-from firebase_admin import db
 from pydantic import BaseModel
 from typing import Optional, Dict, List
 
 # A dependência 'verificar_empresa' ainda é necessária para a segurança dos outros endpoints
-from dependencies import verificar_empresa, EmpresaInfo, verificar_token_simples
+from dependencies import verificar_empresa, EmpresaInfo, verificar_token_simples, obter_perfil
 # A importação do 'connect' foi REMOVIDA
 # from database import connect
 
@@ -34,7 +33,7 @@ async def get_my_companies(uid: str = Depends(verificar_token_simples)):
     Retorna uma lista de empresas (CNPJ e Nome Fantasia) associadas
     a um usuário, buscando os dados DIRETAMENTE do Firebase Realtime Database.
     """
-    user_data = db.reference(f'usuarios/{uid}').get()
+    user_data = await obter_perfil(uid)
     if not user_data:
         raise HTTPException(status_code=404, detail="Usuário não encontrado no Realtime Database.")
 
@@ -66,10 +65,10 @@ async def get_current_user_info(empresa_info: EmpresaInfo = Depends(verificar_em
     A dependência 'verificar_empresa' ainda valida a existência da empresa no Firebird por segurança.
     """
     try:
-        uid = empresa_info.uid
         company_id_cnpj = empresa_info.company_id # CNPJ Limpo
 
-        user_data = db.reference(f'usuarios/{uid}').get()
+        # Perfil já resolvido por 'verificar_empresa' (espelho do Firebase ou cache)
+        user_data = empresa_info.perfil
         if not user_data:
             raise HTTPException(status_code=404, detail="Usuário não encontrado no Realtime Database.")
 
@@ -0,0 +1,58 @@
+# statements.py
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Registro de consultas (statements) enviadas ao agente. Cada statement tem um id estável
+# no formato '{nome}:{hash}', onde o hash vem do SQL normalizado; alterar o texto gera uma
+# nova versão. O servidor manda só o id + parâmetros e o agente mantém os statements
+# preparados por conexão, pedindo o texto ('obter_statement') apenas na primeira vez.
+
+ADHOC_STATEMENTS_MAX = 2000
+
+class Statement:
+    def __init__(self, statement_id: str, nome: str, sql: str):
+        self.id = statement_id
+        self.nome = nome
+        self.sql = sql
+
+_por_id: Dict[str, Statement] = {}
+_por_hash: Dict[str, Statement] = {}
+# Statements sem nome (SQL montado dinamicamente) ficam num LRU para não crescer sem limite
+_adhoc: "OrderedDict[str, Statement]" = OrderedDict()
+
+def normalizar_sql(sql: str) -> str:
+    return " ".join(sql.split())
+
+def _hash_sql(sql: str) -> str:
+    return hashlib.sha1(normalizar_sql(sql).encode("utf-8")).hexdigest()[:12]
+
+def registrar_statement(nome: str, sql: str) -> str:
+    """Registra um statement nomeado e devolve o próprio SQL, para uso direto nos routers."""
+    sql_hash = _hash_sql(sql)
+    statement = Statement(f"{nome}:{sql_hash}", nome, sql)
+    _por_id[statement.id] = statement
+    _por_hash[sql_hash] = statement
+    return sql
+
+def resolver_statement(sql: str) -> Statement:
+    """Devolve o statement registrado para o SQL ou cria um ad-hoc ('adhoc:{hash}')."""
+    sql_hash = _hash_sql(sql)
+    statement = _por_hash.get(sql_hash)
+    if statement is not None:
+        return statement
+    statement = _adhoc.get(sql_hash)
+    if statement is None:
+        statement = Statement(f"adhoc:{sql_hash}", "adhoc", sql)
+        _adhoc[sql_hash] = statement
+        if len(_adhoc) > ADHOC_STATEMENTS_MAX:
+            _adhoc.popitem(last=False)
+    else:
+        _adhoc.move_to_end(sql_hash)
+    return statement
+
+def obter_statement(statement_id: str) -> Optional[Statement]:
+    statement = _por_id.get(statement_id)
+    if statement is None and statement_id.startswith("adhoc:"):
+        statement = _adhoc.get(statement_id.split(":", 1)[1])
+    return statement
\ No newline at end of file
@@ -1,4 +1,4 @@
-// static/js/dashboard-loader.js v1.4
+// static/js/dashboard-loader.js v1.5
 
 document.addEventListener('DOMContentLoaded', () => {
     const contentPlaceholder = document.getElementById('content-placeholder');
@@ -46,7 +46,7 @@ document.addEventListener('DOMContentLoaded', () => {
         return Promise.all(scripts.map(scriptSrc => {
             return new Promise((resolve, reject) => {
                 const script = document.createElement('script');
-                script.src = `${scriptSrc}?v=1.4`;
+                script.src = `${scriptSrc}?v=1.5`;
                 script.defer = true;
                 script.classList.add('module-resource');
                 script.onload = resolve;
@@ -61,7 +61,7 @@ document.addEventListener('DOMContentLoaded', () => {
         return new Promise((resolve, reject) => {
             const cssLink = document.createElement('link');
             cssLink.rel = 'stylesheet';
-            cssLink.href = `${cssPath}?v=1.4`;
+            cssLink.href = `${cssPath}?v=1.5`;
             cssLink.classList.add('module-resource');
             cssLink.onload = resolve;
             cssLink.onerror = () => reject(new Error(`Falha ao carregar o CSS: ${cssPath}`));
@@ -112,17 +112,25 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // Controla as requisições da atualização em andamento: se a próxima começar antes de a
+    // anterior terminar, a anterior é abortada (e o servidor cancela as consultas no agente).
+    let refreshController = null;
+
     async function fetchDataAndPopulate() {
         console.log("Atualizando dados do Modo TV...");
+        if (refreshController) refreshController.abort();
+        refreshController = new AbortController();
+        // 'X-Prioridade' manda as consultas da TV para a faixa de atualização em segundo plano do agente
+        const tvRequestOptions = { signal: refreshController.signal, headers: { 'X-Prioridade': 'atualizacao' } };
         try {
             const today = new Date().toISOString().split('T')[0];
             
             const [kpiData, monthlyPerformanceData, topVendorsData, stockKpiData, metasProgressData] = await Promise.all([
-                fazerRequisicaoAutenticada(`/dashboard/kpis`),
-                fazerRequisicaoAutenticada(`/dashboard/monthly-performance`),
-                fazerRequisicaoAutenticada(`/dashboard/top-vendors-month`),
-                fazerRequisicaoAutenticada(`/estoque/kpis?end_date=${today}`),
-                fazerRequisicaoAutenticada(`/dashboard/metas-progress`),
+                fazerRequisicaoAutenticada(`/dashboard/kpis`, tvRequestOptions),
+                fazerRequisicaoAutenticada(`/dashboard/monthly-performance`, tvRequestOptions),
+                fazerRequisicaoAutenticada(`/dashboard/top-vendors-month`, tvRequestOptions),
+                fazerRequisicaoAutenticada(`/estoque/kpis?end_date=${today}`, tvRequestOptions),
+                fazerRequisicaoAutenticada(`/dashboard/metas-progress`, tvRequestOptions),
             ]);
 
             const allData = {
@@ -151,6 +159,7 @@ document.addEventListener('DOMContentLoaded', () => {
             }
 
         } catch (error) {
+            if (error.name === 'AbortError') return;
             console.error("Falha ao buscar dados para o Modo TV:", error);
         }
     }
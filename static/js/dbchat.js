@@ -224,6 +224,28 @@
         if (e.target === suggestionsModal) closeSuggestionsModal();
     });
 
+    function renderMessageContent(messageContent, sender, text) {
+        const urlRegex = /(\b(https?|ftp|file):\/\/[-A-Z0-9+&@#\/%?=~_|!:,.;]*[-A-Z0-9+&@#\/%=~_|])/ig;
+        let newText = text.replace(urlRegex, url => `<a href="${url}" target="_blank" rel="noopener noreferrer">${url}</a>`);
+        newText = newText.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>').replace(/\*(.*?)\*/g, '<em>$1</em>');
+        messageContent.innerHTML = newText.replace(/\n/g, '<br>');
+
+        if (sender === 'luca') {
+            const ttsButton = document.createElement('button');
+            ttsButton.className = 'tts-btn';
+            ttsButton.title = 'Ouvir resposta';
+            ttsButton.innerHTML = `<i class='bx bxs-volume-full'></i>`;
+            
+            ttsButton.addEventListener('click', (e) => {
+                e.stopPropagation();
+                const cleanText = messageContent.textContent || messageContent.innerText || '';
+                speakText(cleanText, ttsButton);
+            });
+            
+            messageContent.appendChild(ttsButton);
+        }
+    }
+
     function addMessageBubble(sender, text, isHistory = false, type = 'normal') {
         const bubble = document.createElement('div');
         bubble.className = `chat-bubble ${sender}`;
@@ -247,25 +269,7 @@
             bubble.classList.add('typing-indicator');
             messageContent.innerHTML = '<span></span><span></span><span></span>';
         } else {
-            const urlRegex = /(\b(https?|ftp|file):\/\/[-A-Z0-9+&@#\/%?=~_|!:,.;]*[-A-Z0-9+&@#\/%=~_|])/ig;
-            let newText = text.replace(urlRegex, url => `<a href="${url}" target="_blank" rel="noopener noreferrer">${url}</a>`);
-            newText = newText.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>').replace(/\*(.*?)\*/g, '<em>$1</em>');
-            messageContent.innerHTML = newText.replace(/\n/g, '<br>');
-
-            if (sender === 'luca') {
-                const ttsButton = document.createElement('button');
-                ttsButton.className = 'tts-btn';
-                ttsButton.title = 'Ouvir resposta';
-                ttsButton.innerHTML = `<i class='bx bxs-volume-full'></i>`;
-                
-                ttsButton.addEventListener('click', (e) => {
-                    e.stopPropagation();
-                    const cleanText = messageContent.textContent || messageContent.innerText || '';
-                    speakText(cleanText, ttsButton);
-                });
-                
-                messageContent.appendChild(ttsButton);
-            }
+            renderMessageContent(messageContent, sender, text);
         }
 
         bubble.appendChild(avatar);
@@ -356,15 +360,60 @@
         chatInput.dispatchEvent(new Event('keyup'));
         const typingBubble = addMessageBubble('luca', '...typing...');
         sendBtn.disabled = true;
+
+        // A resposta chega em etapas (/luca/chat/stream): o andamento aparece abaixo do indicador
+        // de digitação e o resumo é escrito na bolha conforme o modelo o gera.
+        const stageLabel = document.createElement('small');
+        stageLabel.className = 'luca-stage';
+        typingBubble.querySelector('.message-content').appendChild(stageLabel);
+        let answerBubble = null;
+        let answerText = '';
+        let renderScheduled = false;
+
+        const renderAnswer = () => {
+            renderScheduled = false;
+            renderMessageContent(answerBubble.querySelector('.message-content'), 'luca', answerText);
+            chatHistory.scrollTop = chatHistory.scrollHeight;
+        };
+        const showAnswer = (text, final = false) => {
+            answerText = text;
+            if (!answerBubble) {
+                if (typingBubble.parentNode) typingBubble.remove();
+                answerBubble = addMessageBubble('luca', '');
+            }
+            // Vários trechos podem chegar entre dois quadros: desenha uma vez por quadro
+            if (final) {
+                renderAnswer();
+            } else if (!renderScheduled) {
+                renderScheduled = true;
+                requestAnimationFrame(renderAnswer);
+            }
+        };
+
         try {
             const payload = { prompt: userText };
-            const data = await fazerRequisicaoAutenticada('/luca/chat', {
+            await lerEventosAutenticados('/luca/chat/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(payload)
+            }, (event, data) => {
+                if (event === 'etapa') {
+                    stageLabel.textContent = data.mensagem;
+                } else if (event === 'sql') {
+                    stageLabel.title = data.sql;
+                } else if (event === 'linhas') {
+                    stageLabel.textContent = data.limite_atingido
+                        ? `Encontrei mais de ${data.total} registros; vou analisar os primeiros ${data.total}.`
+                        : `Encontrei ${data.total} registro(s).`;
+                } else if (event === 'token') {
+                    showAnswer(answerText + data.texto);
+                } else if (event === 'fim') {
+                    showAnswer(data.answer || 'Desculpe, não recebi uma resposta válida.', true);
+                } else if (event === 'erro') {
+                    throw new Error(data.detail);
+                }
             });
-            if (typingBubble.parentNode) typingBubble.remove();
-            addMessageBubble('luca', data.answer || 'Desculpe, não recebi uma resposta válida.');
+            if (!answerBubble) throw new Error('A conexão foi encerrada antes da resposta.');
         } catch (error) {
             if (typingBubble.parentNode) typingBubble.remove();
             console.error(error);
@@ -10,6 +10,12 @@
 
         if (!modalBody || !badge) return;
 
+        if (alerts && alerts.erro) {
+            modalBody.innerHTML = `<p class="product-list-empty">Não foi possível verificar os alertas agora. ${alerts.erro}</p>`;
+            badge.style.display = 'none';
+            return;
+        }
+
         if (!alerts || alerts.length === 0) {
             modalBody.innerHTML = '<p class="product-list-empty">Nenhuma novidade ou oportunidade encontrada no momento.</p>';
             badge.style.display = 'none';
@@ -177,7 +183,8 @@
                     fazerRequisicaoAutenticada(`${API_BASE_URL}/dashboard/kpis`),
                     fazerRequisicaoAutenticada(`${API_BASE_URL}/dashboard/monthly-performance`),
                     fazerRequisicaoAutenticada(`${API_BASE_URL}/dashboard/metas-progress`),
-                    fazerRequisicaoAutenticada(`${API_BASE_URL}/alerts/proactive`)
+                    // Alertas indisponíveis não derrubam os KPIs nem aparecem como "nenhuma novidade"
+                    fazerRequisicaoAutenticada(`${API_BASE_URL}/alerts/proactive`).catch(error => ({ erro: error.message }))
                 ]);
 
                 if (kpiData) updateKpiCards(kpiData);
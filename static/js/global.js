@@ -73,7 +73,7 @@ function showConfirmationModal(title, message, confirmText = 'Confirmar', cancel
 
 
 // --- FUNÇÃO GLOBAL DE REQUISIÇÃO (ATUALIZADA) ---
-async function fazerRequisicaoAutenticada(url, options = {}) {
+function montarCabecalhosAutenticados(options = {}) {
     const token = sessionStorage.getItem('firebaseIdToken');
     if (!token) {
         showNotification("Sessão Expirada", "Sua sessão expirou. Por favor, faça o <a href='/login'>login novamente</a>.", "warning");
@@ -93,23 +93,31 @@ async function fazerRequisicaoAutenticada(url, options = {}) {
     if (targetCompanyId) {
         headers['X-Company-ID'] = targetCompanyId;
     }
+    return headers;
+}
 
-    try {
-        const response = await fetch(url, { ...options, headers });
+async function verificarRespostaAutenticada(response) {
+    if (response.status === 401) {
+        sessionStorage.removeItem('firebaseIdToken');
+        sessionStorage.removeItem('targetCompanyId');
+        const errorData = await response.json().catch(() => ({ detail: 'Seu token de acesso é inválido ou expirou.' }));
+        showNotification("Sessão Expirada", `${errorData.detail} Você será redirecionado para a tela de login.`, "error");
+        setTimeout(() => window.location.href = '/login', 3000);
+        throw new Error(errorData.detail);
+    }
 
-        if (response.status === 401) {
-            sessionStorage.removeItem('firebaseIdToken');
-            sessionStorage.removeItem('targetCompanyId');
-            const errorData = await response.json().catch(() => ({ detail: 'Seu token de acesso é inválido ou expirou.' }));
-            showNotification("Sessão Expirada", `${errorData.detail} Você será redirecionado para a tela de login.`, "error");
-            setTimeout(() => window.location.href = '/login', 3000);
-            throw new Error(errorData.detail);
-        }
+    if (!response.ok) {
+        const errorData = await response.json().catch(() => ({ detail: `Erro ${response.status}: ${response.statusText}` }));
+        throw new Error(errorData.detail);
+    }
+}
 
-        if (!response.ok) {
-            const errorData = await response.json().catch(() => ({ detail: `Erro ${response.status}: ${response.statusText}` }));
-            throw new Error(errorData.detail);
-        }
+async function fazerRequisicaoAutenticada(url, options = {}) {
+    const headers = montarCabecalhosAutenticados(options);
+
+    try {
+        const response = await fetch(url, { ...options, headers });
+        await verificarRespostaAutenticada(response);
 
         if (response.status === 204) {
             return { status: 'success' };
@@ -123,6 +131,43 @@ async function fazerRequisicaoAutenticada(url, options = {}) {
     }
 }
 
+// Respostas em Server-Sent Events (ex.: /luca/chat/stream). Chama onEvento(nome, dados) para
+// cada evento assim que ele chega; erros de autenticação e de status são tratados como acima.
+async function lerEventosAutenticados(url, options = {}, onEvento) {
+    const headers = { ...montarCabecalhosAutenticados(options), 'Accept': 'text/event-stream' };
+
+    try {
+        const response = await fetch(url, { ...options, headers });
+        await verificarRespostaAutenticada(response);
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Eventos terminam com uma linha em branco; o que sobra fica para a próxima leitura
+            let fim;
+            while ((fim = buffer.indexOf('\n\n')) !== -1) {
+                const bloco = buffer.slice(0, fim);
+                buffer = buffer.slice(fim + 2);
+                let nome = 'message';
+                const dados = [];
+                bloco.split('\n').forEach(linha => {
+                    if (linha.startsWith('event:')) nome = linha.slice(6).trim();
+                    else if (linha.startsWith('data:')) dados.push(linha.slice(5).trimStart());
+                });
+                if (dados.length) onEvento(nome, JSON.parse(dados.join('\n')));
+            }
+        }
+    } catch (error) {
+        console.error(`Erro na requisição para ${url}:`, error.message);
+        throw error;
+    }
+}
+
 
 function showLoading() {
     const loadingOverlay = document.getElementById('loading-overlay');
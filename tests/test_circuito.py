@@ -0,0 +1,95 @@
+# tests/test_circuito.py
+"""
+Testes do circuit breaker por empresa (circuito.py): abertura pela taxa de falhas na janela,
+sonda única no meio aberto e espera dobrada quando a sonda falha.
+
+Uso (a partir da raiz do projeto):
+    python -m pytest tests
+"""
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import circuito
+from circuito import CircuitBreaker
+
+class RelogioFalso:
+    """Relógio do módulo circuito durante o teste: avança o tempo sem esperar."""
+
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self) -> float:
+        return self.agora
+
+class CircuitBreakerTeste(unittest.TestCase):
+    def setUp(self):
+        self.relogio = RelogioFalso()
+        self.addCleanup(setattr, circuito, "time", circuito.time)
+        circuito.time = SimpleNamespace(monotonic=self.relogio)
+        self.circuito = CircuitBreaker(janela_segundos=30, minimo_amostras=4, taxa_falhas=0.5, espera_inicial=10, espera_maxima=40)
+
+    def abrir(self):
+        for _ in range(4):
+            self.assertTrue(self.circuito.permitir())
+            self.circuito.registrar(sucesso=False)
+        self.assertEqual(self.circuito.estado, circuito.ABERTO)
+
+    def test_poucas_amostras_nao_abrem(self):
+        for _ in range(3):
+            self.circuito.registrar(sucesso=False)
+        self.assertEqual(self.circuito.estado, circuito.FECHADO)
+        self.assertTrue(self.circuito.permitir())
+
+    def test_falhas_abaixo_da_taxa_nao_abrem(self):
+        for sucesso in (True, True, True, False):
+            self.circuito.registrar(sucesso=sucesso)
+        self.assertEqual(self.circuito.estado, circuito.FECHADO)
+
+    def test_falhas_fora_da_janela_sao_esquecidas(self):
+        for _ in range(3):
+            self.circuito.registrar(sucesso=False)
+        self.relogio.agora += 31
+        self.circuito.registrar(sucesso=False)
+        self.assertEqual(self.circuito.estado, circuito.FECHADO)
+
+    def test_aberto_recusa_ate_passar_a_espera(self):
+        self.abrir()
+        self.assertFalse(self.circuito.permitir())
+        self.assertEqual(self.circuito.segundos_para_tentar(), 10)
+        self.relogio.agora += 10
+        self.assertTrue(self.circuito.permitir())
+        self.assertEqual(self.circuito.estado, circuito.MEIO_ABERTO)
+
+    def test_meio_aberto_deixa_passar_uma_sonda_por_vez(self):
+        self.abrir()
+        self.relogio.agora += 10
+        self.assertTrue(self.circuito.permitir())
+        self.assertFalse(self.circuito.permitir())
+        self.circuito.liberar_sonda()
+        self.assertTrue(self.circuito.permitir())
+
+    def test_sonda_com_sucesso_fecha(self):
+        self.abrir()
+        self.relogio.agora += 10
+        self.circuito.permitir()
+        self.circuito.registrar(sucesso=True)
+        self.assertEqual(self.circuito.estado, circuito.FECHADO)
+        self.assertEqual(self.circuito.espera, 10)
+        self.assertTrue(self.circuito.permitir())
+
+    def test_sonda_com_falha_dobra_a_espera_ate_o_maximo(self):
+        self.abrir()
+        for espera in (20, 40, 40):
+            self.relogio.agora += self.circuito.segundos_para_tentar()
+            self.assertTrue(self.circuito.permitir())
+            self.circuito.registrar(sucesso=False)
+            self.assertEqual(self.circuito.estado, circuito.ABERTO)
+            self.assertEqual(self.circuito.segundos_para_tentar(), espera)
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,143 @@
+# tests/test_cliente_http.py
+"""
+Testes de cliente_http.post_json e post_json_linhas contra o Gemini simulado
+(tools/llm_simulado.py), rodando em uma thread na mesma máquina: retentativas em 429/503,
+respeito ao Retry-After e prazo total, inclusive com a resposta chegando aos poucos.
+
+Uso (a partir da raiz do projeto):
+    python -m pytest tests
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+from http.server import ThreadingHTTPServer
+
+import httpx
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [RAIZ, os.path.join(RAIZ, "tools")]
+
+import cliente_http
+import llm_simulado
+
+PAYLOAD = {"contents": [{"parts": [{"text": "Resuma as vendas do mês."}]}]}
+GERAR = ":generateContent"
+TRANSMITIR = ":streamGenerateContent?alt=sse"
+
+def opcoes(**valores) -> argparse.Namespace:
+    padrao = {
+        "latencia_ms": 0.0, "variacao_ms": 0.0, "ms_por_mil_caracteres": 0.0, "ms_por_trecho": 0.0,
+        "taxa_429": 0.0, "retry_after": 0, "taxa_erro": 0.0, "id_empresa": "1", "verboso": False,
+    }
+    padrao.update(valores)
+    return argparse.Namespace(**padrao)
+
+class ServidorSimulado(unittest.IsolatedAsyncioTestCase):
+    """Sobe um Gemini simulado por teste (porta livre) e limpa o cliente compartilhado no fim."""
+
+    def iniciar_servidor(self, metodo: str = GERAR, **valores) -> str:
+        self.contagem = llm_simulado.Contagem()
+        servidor = ThreadingHTTPServer(("127.0.0.1", 0), llm_simulado.criar_manipulador(opcoes(**valores), self.contagem))
+        servidor.daemon_threads = True
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        self.addCleanup(servidor.server_close)
+        self.addCleanup(servidor.shutdown)
+        return f"http://127.0.0.1:{servidor.server_address[1]}/v1beta/models/teste{metodo}"
+
+    def definir(self, nome: str, valor):
+        """Troca uma configuração do módulo só durante o teste."""
+        original = getattr(cliente_http, nome)
+        setattr(cliente_http, nome, valor)
+        self.addCleanup(setattr, cliente_http, nome, original)
+
+    async def asyncTearDown(self):
+        # Cada teste tem o seu event loop: o cliente compartilhado não pode passar de um para outro
+        await cliente_http.encerrar()
+
+class PostJsonTeste(ServidorSimulado):
+    async def test_resposta_sem_erro_na_primeira_tentativa(self):
+        url = self.iniciar_servidor()
+        resposta = await cliente_http.post_json("teste", url, PAYLOAD, prazo_segundos=5)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(self.contagem.valores, {"ok": 1, "429": 0, "503": 0})
+
+    async def test_429_repetido_ate_o_limite_de_tentativas(self):
+        url = self.iniciar_servidor(taxa_429=1.0, retry_after=0)
+        resposta = await cliente_http.post_json("teste", url, PAYLOAD, prazo_segundos=5)
+        self.assertEqual(resposta.status_code, 429)
+        self.assertEqual(self.contagem.valores["429"], cliente_http.HTTP_MAX_TENTATIVAS)
+
+    async def test_503_repetido_com_backoff(self):
+        self.definir("BACKOFF_BASE_SEGUNDOS", 0.01)
+        url = self.iniciar_servidor(taxa_erro=1.0)
+        resposta = await cliente_http.post_json("teste", url, PAYLOAD, prazo_segundos=5)
+        self.assertEqual(resposta.status_code, 503)
+        self.assertEqual(self.contagem.valores["503"], cliente_http.HTTP_MAX_TENTATIVAS)
+
+    async def test_retry_after_define_a_espera(self):
+        self.definir("HTTP_MAX_TENTATIVAS", 2)
+        url = self.iniciar_servidor(taxa_429=1.0, retry_after=1)
+        inicio = time.monotonic()
+        resposta = await cliente_http.post_json("teste", url, PAYLOAD, prazo_segundos=5)
+        self.assertEqual(resposta.status_code, 429)
+        self.assertEqual(self.contagem.valores["429"], 2)
+        self.assertGreaterEqual(time.monotonic() - inicio, 1.0)
+
+    async def test_retry_after_alem_do_prazo_devolve_o_429_sem_esperar(self):
+        url = self.iniciar_servidor(taxa_429=1.0, retry_after=30)
+        inicio = time.monotonic()
+        resposta = await cliente_http.post_json("teste", url, PAYLOAD, prazo_segundos=2)
+        self.assertEqual(resposta.status_code, 429)
+        self.assertEqual(self.contagem.valores["429"], 1)
+        self.assertLess(time.monotonic() - inicio, 1.0)
+
+    async def test_prazo_esgotado_aguardando_a_resposta(self):
+        url = self.iniciar_servidor(latencia_ms=2000)
+        with self.assertRaises(cliente_http.PrazoEsgotado):
+            await cliente_http.post_json("teste", url, PAYLOAD, prazo_segundos=0.3)
+
+    async def test_prazo_total_vale_para_resposta_que_chega_aos_poucos(self):
+        # Cada trecho chega antes do timeout de leitura do httpx, mas a soma passa do prazo
+        url = self.iniciar_servidor(TRANSMITIR, ms_por_trecho=300)
+        inicio = time.monotonic()
+        with self.assertRaises(cliente_http.PrazoEsgotado):
+            await cliente_http.post_json("teste", url, PAYLOAD, prazo_segundos=1)
+        self.assertLess(time.monotonic() - inicio, 1.5)
+
+class PostJsonLinhasTeste(ServidorSimulado):
+    async def ler(self, url: str, prazo_segundos: float) -> list:
+        return [linha async for linha in cliente_http.post_json_linhas("teste", url, PAYLOAD, prazo_segundos)]
+
+    async def test_transmissao_completa(self):
+        url = self.iniciar_servidor(TRANSMITIR)
+        eventos = [json.loads(linha[len("data: "):]) for linha in await self.ler(url, 5) if linha.startswith("data: ")]
+        texto = "".join(evento["candidates"][0]["content"]["parts"][0]["text"] for evento in eventos)
+        self.assertEqual(texto, llm_simulado.RESUMO_EXEMPLO)
+        self.assertEqual(eventos[-1]["candidates"][0]["finishReason"], "STOP")
+
+    async def test_429_com_retry_after_antes_da_transmissao(self):
+        self.definir("HTTP_MAX_TENTATIVAS", 2)
+        url = self.iniciar_servidor(TRANSMITIR, taxa_429=1.0, retry_after=1)
+        inicio = time.monotonic()
+        with self.assertRaises(httpx.HTTPStatusError) as contexto:
+            await self.ler(url, 5)
+        self.assertEqual(contexto.exception.response.status_code, 429)
+        self.assertEqual(self.contagem.valores["429"], 2)
+        self.assertGreaterEqual(time.monotonic() - inicio, 1.0)
+
+    async def test_prazo_esgotado_durante_a_transmissao(self):
+        url = self.iniciar_servidor(TRANSMITIR, ms_por_trecho=300)
+        linhas = []
+        inicio = time.monotonic()
+        with self.assertRaises(cliente_http.PrazoEsgotado):
+            async for linha in cliente_http.post_json_linhas("teste", url, PAYLOAD, prazo_segundos=1):
+                linhas.append(linha)
+        self.assertTrue(linhas)
+        self.assertLess(time.monotonic() - inicio, 1.5)
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
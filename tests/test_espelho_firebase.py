@@ -0,0 +1,98 @@
+# tests/test_espelho_firebase.py
+"""
+Testes do espelho em memória do Realtime Database (espelho_firebase.EspelhoArvore): aplicação
+dos eventos 'put'/'patch' do listener, índice por CNPJ, cópia nova a cada alteração e queda
+do listener.
+
+Uso (a partir da raiz do projeto):
+    python -m pytest tests
+"""
+import os
+import sys
+import threading
+import unittest
+from types import SimpleNamespace
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import espelho_firebase
+from espelho_firebase import EspelhoArvore
+
+def evento(tipo: str, caminho: str, dados):
+    return SimpleNamespace(event_type=tipo, path=caminho, data=dados)
+
+EMPRESAS = {
+    "12345678-000199": {"nomeFantasia": "Loja Centro", "plano": {"nivel": "pro", "ativo": True}},
+    "98765432-000110": {"nomeFantasia": "Loja Bairro"},
+}
+
+class AplicarEventoTeste(unittest.TestCase):
+    def setUp(self):
+        self.espelho = EspelhoArvore("/empresas", chave_indice=espelho_firebase.normalizar_cnpj)
+        self.espelho._aplicar_evento(evento("put", "/", EMPRESAS))
+
+    def test_carga_inicial(self):
+        self.assertTrue(self.espelho.pronto)
+        self.assertEqual(self.espelho.versao, 1)
+        self.assertEqual(self.espelho.obter_por_indice("12345678000199"), ("12345678-000199", EMPRESAS["12345678-000199"]))
+        self.assertEqual(len(self.espelho.itens()), 2)
+
+    def test_put_em_caminho_interno_gera_copia_nova(self):
+        antes = self.espelho.obter("12345678-000199")
+        self.espelho._aplicar_evento(evento("put", "/12345678-000199/plano/nivel", "basico"))
+        depois = self.espelho.obter("12345678-000199")
+        self.assertEqual(depois["plano"], {"nivel": "basico", "ativo": True})
+        # Quem leu a entrada antes continua com a versão antiga, sem alteração no lugar
+        self.assertEqual(antes["plano"]["nivel"], "pro")
+        self.assertIsNot(antes, depois)
+        self.assertEqual(self.espelho.versao, 2)
+
+    def test_patch_mescla_os_campos(self):
+        self.espelho._aplicar_evento(evento("patch", "/98765432-000110", {"cidade": "Recife"}))
+        self.assertEqual(self.espelho.obter("98765432-000110"), {"nomeFantasia": "Loja Bairro", "cidade": "Recife"})
+
+    def test_patch_na_raiz_substitui_cada_entrada(self):
+        self.espelho._aplicar_evento(evento("patch", "/", {"11111111-000111": {"nomeFantasia": "Loja Nova"}}))
+        self.assertEqual(self.espelho.obter_por_indice("11111111000111")[1], {"nomeFantasia": "Loja Nova"})
+        self.assertEqual(len(self.espelho.itens()), 3)
+
+    def test_put_nulo_apaga_a_entrada_e_o_indice(self):
+        self.espelho._aplicar_evento(evento("put", "/98765432-000110", None))
+        self.assertIsNone(self.espelho.obter("98765432-000110"))
+        self.assertIsNone(self.espelho.obter_por_indice("98765432000110"))
+
+    def test_apagar_o_ultimo_campo_apaga_a_entrada(self):
+        self.espelho._aplicar_evento(evento("put", "/98765432-000110/nomeFantasia", None))
+        self.assertIsNone(self.espelho.obter("98765432-000110"))
+
+    def test_evento_invalido_tira_o_espelho_do_ar(self):
+        self.espelho._aplicar_evento(evento("patch", "/", ["lista", "inesperada"]))
+        self.assertFalse(self.espelho.pronto)
+        self.assertFalse(self.espelho.ativo())
+
+class DisponivelTeste(unittest.TestCase):
+    def test_listener_morto_deixa_de_servir_a_memoria(self):
+        espelho = EspelhoArvore("/usuarios")
+        thread = threading.Thread(target=lambda: None)
+        thread.start()
+        thread.join()
+        espelho._registro = SimpleNamespace(_thread=thread)
+        espelho._aplicar_evento(evento("put", "/", {"uid1": {"nome": "Ana"}}))
+        self.assertTrue(espelho.pronto)
+        self.assertFalse(espelho.disponivel())
+        self.assertFalse(espelho.pronto)
+
+    def test_listener_vivo_continua_servindo(self):
+        espelho = EspelhoArvore("/usuarios")
+        parar = threading.Event()
+        thread = threading.Thread(target=parar.wait)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(parar.set)
+        espelho._registro = SimpleNamespace(_thread=thread)
+        espelho._aplicar_evento(evento("put", "/", {"uid1": {"nome": "Ana"}}))
+        self.assertTrue(espelho.disponivel())
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,146 @@
+# tests/test_inicializacao.py
+"""
+Testes de fumaça da inicialização: main_api importa todos os routers (que importam de volta
+funções de main_api), então um nome usado por um router e definido depois da importação
+deles impede a API de subir.
+
+O teste com o agente sobe a API de verdade (uvicorn, sem o lifespan, que depende das
+credenciais do Firebase) e conecta o agente simulado (tools/agente_simulado.py) em
+/ws/{cnpj}: handshake, reconexão, consulta, lote, streaming e uma rota HTTP autenticada. Precisa de um
+Redis em TEST_REDIS_URL (padrão redis://localhost:6379/15; o banco é APAGADO) e das
+dependências de tools/requirements.txt; sem eles o teste é pulado.
+
+Uso (a partir da raiz do projeto):
+    python -m pytest tests
+"""
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import unittest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [RAIZ, os.path.join(RAIZ, "tools")]
+
+TEST_REDIS_URL = os.environ.get("TEST_REDIS_URL", "redis://localhost:6379/15")
+CNPJ = "12345678000199"
+ID_EMPRESA = "1"
+
+class ImportacaoTeste(unittest.TestCase):
+    def test_app_importa_com_todos_os_routers(self):
+        from main_api import app
+        rotas = {getattr(rota, "path", None) for rota in app.routes}
+        for rota in ("/ws/{company_id}", "/agents/status", "/metrics", "/estoque/value-history"):
+            self.assertIn(rota, rotas)
+
+def porta_livre() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class AgenteSimuladoTeste(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        try:
+            import httpx
+            import uvicorn
+            import agente_simulado
+        except ImportError as e:
+            self.skipTest(f"Dependência de teste ausente: {e}")
+        import redis.asyncio as redis
+        import main_api
+        from dependencies import verificar_empresa, EmpresaInfo
+
+        conexao = redis.from_url(TEST_REDIS_URL, decode_responses=True)
+        try:
+            await conexao.ping()
+        except (OSError, redis.ConnectionError) as e:
+            await conexao.close()
+            self.skipTest(f"Redis de teste indisponível em {TEST_REDIS_URL}: {e}")
+        await conexao.flushdb()
+        self.main_api = main_api
+        self.addCleanup(setattr, main_api, "REDIS_URL", main_api.REDIS_URL)
+        self.addCleanup(setattr, main_api, "redis_connection", main_api.redis_connection)
+        main_api.REDIS_URL = TEST_REDIS_URL
+        main_api.redis_connection = self.conexao = conexao
+
+        # O que o lifespan faria, menos o Firebase
+        self.tarefas = [asyncio.create_task(main_api.reply_listener()), asyncio.create_task(main_api.redis_listener())]
+
+        # Usuário já autenticado: a verificação do token (Firebase) fica de fora
+        main_api.app.dependency_overrides[verificar_empresa] = lambda: EmpresaInfo(
+            "usuario-teste", CNPJ, {"empresas": {CNPJ: {"idEmpresaDb": ID_EMPRESA}}}
+        )
+        self.addCleanup(main_api.app.dependency_overrides.clear)
+
+        porta = porta_livre()
+        self.servidor = uvicorn.Server(uvicorn.Config(main_api.app, host="127.0.0.1", port=porta, lifespan="off", log_level="warning"))
+        self.tarefas.append(asyncio.create_task(self.servidor.serve()))
+        while not self.servidor.started:
+            await asyncio.sleep(0.05)
+        self.url = f"http://127.0.0.1:{porta}"
+
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        args = agente_simulado.ler_argumentos([
+            "--url", f"ws://127.0.0.1:{porta}", "--empresa", CNPJ, "--banco", os.path.join(pasta.name, "agente.db"),
+            "--id-empresa", ID_EMPRESA, "--latencia-ms", "0", "--variacao-ms", "0", "--ms-por-mil-linhas", "0",
+        ])
+        agente_simulado.preparar_banco(args)
+        self.agente = agente_simulado.AgenteSimulado(args, CNPJ, agente_simulado.BancoSimulado(args.banco, args.conexoes))
+        self.tarefas.append(asyncio.create_task(self.agente.executar()))
+        await self.aguardar_agente()
+
+    async def aguardar_agente(self):
+        for _ in range(100):
+            if self.main_api.agent_capabilities.get(CNPJ) and await self.main_api.agent_supports(CNPJ, "lote"):
+                return
+            await asyncio.sleep(0.05)
+        self.fail("O agente simulado não completou o handshake em /ws/{cnpj}.")
+
+    async def asyncTearDown(self):
+        if hasattr(self, "servidor"):
+            self.servidor.should_exit = True
+        for tarefa in reversed(getattr(self, "tarefas", [])):
+            tarefa.cancel()
+        await asyncio.gather(*getattr(self, "tarefas", []), return_exceptions=True)
+        if hasattr(self, "conexao"):
+            await self.conexao.flushdb()
+            await self.conexao.close()
+
+    async def test_consulta_lote_e_streaming_pelo_agente(self):
+        sql = "SELECT COUNT(*) AS TOTAL FROM TVENPEDIDO WHERE EMPRESA = ?"
+        linhas = await self.main_api.execute_query_via_agent(CNPJ, sql, [ID_EMPRESA])
+        self.assertGreater(linhas[0]["TOTAL"], 0)
+
+        lote = await self.main_api.execute_batch_via_agent(CNPJ, {
+            "pedidos": (sql, [ID_EMPRESA]),
+            "vendedores": ("SELECT COUNT(*) AS TOTAL FROM TVENVENDEDOR WHERE EMPRESA = ?", [ID_EMPRESA]),
+        })
+        self.assertEqual(lote["pedidos"][0]["TOTAL"], linhas[0]["TOTAL"])
+        self.assertGreater(lote["vendedores"][0]["TOTAL"], 0)
+
+        partes = [parte async for parte in self.main_api.stream_query_via_agent(
+            CNPJ, "SELECT * FROM TVENPEDIDO WHERE EMPRESA = ?", [ID_EMPRESA], chunk_rows=100
+        )]
+        self.assertGreater(len(partes), 1)
+        self.assertEqual(sum(len(parte) for parte in partes), linhas[0]["TOTAL"])
+
+    async def test_agente_reconecta(self):
+        # Na reconexão o grupo de consumidores já existe (BUSYGROUP) e os pendentes são reenviados
+        await self.agente.websocket.close()
+        while self.main_api.connected_agents.get(CNPJ) is not None:
+            await asyncio.sleep(0.05)
+        await self.aguardar_agente()
+        linhas = await self.main_api.execute_query_via_agent(CNPJ, "SELECT COUNT(*) AS TOTAL FROM TVENVENDEDOR WHERE EMPRESA = ?", [ID_EMPRESA])
+        self.assertGreater(linhas[0]["TOTAL"], 0)
+
+    async def test_rota_http_autenticada(self):
+        import httpx
+        async with httpx.AsyncClient(base_url=self.url) as cliente:
+            resposta = await cliente.get("/estoque/kpis", headers={"X-Prioridade": "atualizacao"})
+        self.assertEqual(resposta.status_code, 200, resposta.text)
+        self.assertIn("total_value", resposta.json())
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,76 @@
+# tests/test_resultados.py
+"""
+Testes do formato colunar (resultados.py): decodificação das mensagens do agente em texto,
+msgpack e zstd, conversão das datas por coluna e ida e volta pelo cache.
+
+Uso (a partir da raiz do projeto):
+    python -m pytest tests
+"""
+import json
+import os
+import sys
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import resultados
+
+COLUNAR = {
+    "formato": "colunar",
+    "colunas": ["DIA", "TOTAL", "ATUALIZADO"],
+    "tipos": ["date", "", "datetime"],
+    "valores": [["2024-05-01", "2024-05-02"], [10.5, None], ["2024-05-01T08:30:00", None]],
+}
+
+class DecodificarQuadroTeste(unittest.TestCase):
+    def test_texto_json_com_resultado_colunar(self):
+        mensagem = resultados.decodificar_quadro(json.dumps({"id_tarefa": "t1", "status": "sucesso", "dados": COLUNAR}))
+        linhas = mensagem["dados"]
+        self.assertEqual(len(linhas), 2)
+        self.assertEqual(linhas[0]["DIA"], date(2024, 5, 1))
+        self.assertEqual(linhas[0]["ATUALIZADO"], datetime(2024, 5, 1, 8, 30))
+        self.assertIsNone(linhas[1]["TOTAL"])
+        self.assertIsNone(linhas[1]["ATUALIZADO"])
+        self.assertEqual(list(linhas[1]), ["DIA", "TOTAL", "ATUALIZADO"])
+
+    def test_lista_de_dicts_dos_agentes_antigos_passa_intacta(self):
+        dados = [{"DIA": "2024-05-01", "TOTAL": 1}]
+        self.assertEqual(resultados.decodificar_quadro(json.dumps({"id_tarefa": "t1", "dados": dados}))["dados"], dados)
+
+    def test_lote_decodifica_cada_resultado(self):
+        mensagem = resultados.decodificar_quadro(json.dumps({"id_tarefa": "t1", "dados": {"vendas": COLUNAR, "vazio": []}}))
+        self.assertEqual(mensagem["dados"]["vendas"][1]["DIA"], date(2024, 5, 2))
+        self.assertEqual(mensagem["dados"]["vazio"], [])
+
+    def test_quadro_binario_json(self):
+        mensagem = resultados.decodificar_quadro(json.dumps({"id_tarefa": "t1", "dados": COLUNAR}).encode("utf-8"))
+        self.assertEqual(mensagem["dados"][0]["TOTAL"], 10.5)
+
+    @unittest.skipIf(resultados.msgpack is None, "msgpack não instalado")
+    def test_quadro_msgpack(self):
+        quadro = resultados.msgpack.packb({"id_tarefa": "t1", "dados": COLUNAR}, use_bin_type=True)
+        self.assertEqual(resultados.decodificar_quadro(quadro)["dados"][1]["DIA"], date(2024, 5, 2))
+
+    @unittest.skipIf(resultados.msgpack is None or resultados.zstandard is None, "msgpack/zstandard não instalados")
+    def test_quadro_msgpack_comprimido_com_zstd(self):
+        quadro = resultados.msgpack.packb({"id_tarefa": "t1", "dados": COLUNAR}, use_bin_type=True)
+        quadro = resultados.zstandard.ZstdCompressor().compress(quadro)
+        self.assertEqual(resultados.decodificar_quadro(quadro)["dados"][0]["DIA"], date(2024, 5, 1))
+
+class CodificarDadosTeste(unittest.TestCase):
+    def test_ida_e_volta_pelo_cache(self):
+        dados = resultados.decodificar_dados({"vendas": COLUNAR})
+        guardado = json.loads(json.dumps(resultados.codificar_dados(dados)))
+        self.assertEqual(guardado["vendas"], COLUNAR)
+        self.assertEqual(resultados.decodificar_dados(guardado)["vendas"][0]["ATUALIZADO"], datetime(2024, 5, 1, 8, 30))
+
+    def test_valor_para_json(self):
+        linha = resultados.decodificar_dados(COLUNAR)[0]
+        texto = json.dumps({"linha": linha, "valor": Decimal("1.5")}, default=resultados.valor_para_json)
+        self.assertEqual(json.loads(texto), {"linha": {"DIA": "2024-05-01", "TOTAL": 10.5, "ATUALIZADO": "2024-05-01T08:30:00"}, "valor": 1.5})
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,298 @@
+# tools/agente_simulado.py
+"""
+Agente simulado: substitui o computador da loja (Firebird) para testes e benchmarks.
+
+Conecta em /ws/{cnpj} como o agente real, anuncia as capacidades ('statements', 'streaming', 'lote'),
+responde 'query', 'query_batch', 'query_stream', 'carregar_historico' e 'salvar_historico'
+a partir de uma cópia em SQLite das tabelas do ERP (ver esquema_erp.py) e atende 'credito'
+e 'cancelar'. O SQL de Firebird é traduzido para SQLite (dialeto_firebird.py).
+
+A latência do computador da loja é simulada com --latencia-ms (base), --variacao-ms (sorteada
+para mais ou para menos) e --ms-por-mil-linhas (custo proporcional ao resultado), e o número de
+conexões simultâneas ao banco com --conexoes.
+
+Uso (a partir da raiz do projeto):
+    pip install -r tools/requirements.txt
+    python tools/agente_simulado.py --url ws://localhost:8000 --empresa 12345678000199 --id-empresa 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, datetime, time as hora
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+import websockets
+
+from dialeto_firebird import traduzir_sql, adaptar_parametros
+from esquema_erp import conectar, criar_esquema, popular_exemplo
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CAPACIDADES = ["statements", "streaming", "lote"]
+
+def _valor_json(valor: Any):
+    if isinstance(valor, (date, datetime, hora)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return str(valor)
+
+def _tipo_coluna(valores: list) -> str:
+    amostra = next((v for v in valores if v is not None), None)
+    if isinstance(amostra, datetime):
+        return "datetime"
+    if isinstance(amostra, date):
+        return "date"
+    if isinstance(amostra, hora):
+        return "time"
+    return ""
+
+class BancoSimulado:
+    """Uma conexão SQLite por thread; o semáforo faz o papel do pool de conexões do Firebird."""
+
+    def __init__(self, caminho: str, conexoes: int):
+        self.caminho = caminho
+        self.local = threading.local()
+        self.escrita = threading.Lock()
+        self.vagas = asyncio.Semaphore(conexoes)
+
+    def _conexao(self) -> sqlite3.Connection:
+        conexao = getattr(self.local, "conexao", None)
+        if conexao is None:
+            conexao = self.local.conexao = conectar(self.caminho)
+        return conexao
+
+    def executar(self, sql: str, params: List[Any]):
+        """Executa (em uma thread) e devolve (colunas, linhas)."""
+        conexao = self._conexao()
+        sql_sqlite = traduzir_sql(sql)
+        if sql_sqlite.lstrip().upper().startswith(("SELECT", "WITH")):
+            cursor = conexao.execute(sql_sqlite, adaptar_parametros(params))
+            colunas = [descricao[0].upper() for descricao in cursor.description or []]
+            return colunas, [tuple(linha) for linha in cursor.fetchall()]
+        with self.escrita:
+            conexao.execute(sql_sqlite, adaptar_parametros(params))
+            conexao.commit()
+        return [], []
+
+class AgenteSimulado:
+    def __init__(self, args: argparse.Namespace, empresa: str, banco: BancoSimulado):
+        self.args = args
+        self.empresa = empresa
+        self.banco = banco
+        self.url = f"{args.url.rstrip('/')}/ws/{empresa}"
+        self.statements: Dict[str, str] = {}
+        self.pedidos_statement: Dict[str, asyncio.Future] = {}
+        self.tarefas: Dict[str, asyncio.Task] = {}
+        self.creditos: Dict[str, asyncio.Semaphore] = {}
+        self.formatos: List[str] = []
+        self.websocket = None
+        self.envio = asyncio.Lock()
+
+    # --- CONEXÃO ---
+
+    async def executar(self):
+        espera = 1
+        while True:
+            try:
+                async with websockets.connect(self.url, max_size=None) as websocket:
+                    self.websocket = websocket
+                    espera = 1
+                    print(f"INFO: Agente simulado '{self.empresa}' conectado em {self.url}.")
+                    await self.enviar({"tipo": "hello", "capacidades": CAPACIDADES})
+                    async for quadro in websocket:
+                        await self.tratar_mensagem(json.loads(quadro))
+            except (OSError, websockets.exceptions.WebSocketException) as e:
+                print(f"AVISO: Agente simulado '{self.empresa}' desconectado: {e}. Reconectando em {espera}s...")
+            finally:
+                for tarefa in self.tarefas.values():
+                    tarefa.cancel()
+                self.tarefas.clear()
+                self.websocket = None
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, 30)
+
+    async def enviar(self, mensagem: Dict[str, Any]):
+        if self.websocket is None:
+            return
+        if self.args.binario and msgpack and "msgpack" in self.formatos:
+            quadro = msgpack.packb(mensagem, default=_valor_json, use_bin_type=True)
+            if zstandard and "zstd" in self.formatos:
+                quadro = zstandard.ZstdCompressor().compress(quadro)
+        else:
+            quadro = json.dumps(mensagem, default=_valor_json)
+        async with self.envio:
+            await self.websocket.send(quadro)
+
+    async def tratar_mensagem(self, mensagem: Dict[str, Any]):
+        tipo = mensagem.get("tipo")
+        if tipo == "hello_ack":
+            self.formatos = mensagem.get("formatos") or []
+        elif tipo == "statement":
+            pedido = self.pedidos_statement.pop(mensagem.get("statement_id"), None)
+            if pedido and not pedido.done():
+                pedido.set_result(mensagem.get("sql"))
+        elif tipo == "credito":
+            creditos = self.creditos.get(mensagem.get("id_tarefa"))
+            for _ in range(int(mensagem.get("quantidade", 1))):
+                if creditos:
+                    creditos.release()
+        elif tipo == "cancelar":
+            tarefa = self.tarefas.get(mensagem.get("id_tarefa"))
+            if tarefa:
+                tarefa.cancel()
+        elif mensagem.get("id_tarefa") and mensagem.get("acao"):
+            id_tarefa = mensagem["id_tarefa"]
+            tarefa = asyncio.create_task(self.tratar_comando(mensagem))
+            self.tarefas[id_tarefa] = tarefa
+            tarefa.add_done_callback(lambda _t: self.tarefas.pop(id_tarefa, None))
+        else:
+            print(f"AVISO: Mensagem não reconhecida: {mensagem!r}")
+
+    # --- COMANDOS ---
+
+    async def tratar_comando(self, comando: Dict[str, Any]):
+        id_tarefa, acao, parametros = comando["id_tarefa"], comando["acao"], comando.get("parametros") or {}
+        try:
+            if acao == "query":
+                dados, tempos = await self.consultar(parametros)
+            elif acao == "query_batch":
+                dados, tempos = {}, {"fila_ms": 0.0, "execucao_ms": 0.0}
+                for consulta in parametros.get("consultas", []):
+                    dados[consulta["nome"]], tempos_consulta = await self.consultar(consulta)
+                    tempos["fila_ms"] += tempos_consulta["fila_ms"]
+                    tempos["execucao_ms"] += tempos_consulta["execucao_ms"]
+            elif acao == "query_stream":
+                await self.consultar_em_partes(id_tarefa, parametros)
+                return
+            elif acao == "carregar_historico":
+                dados, tempos = await asyncio.to_thread(self.carregar_historico, parametros["user_id"]), {}
+            elif acao == "salvar_historico":
+                await asyncio.to_thread(self.salvar_historico, parametros["user_id"], parametros["date_str"], parametros["new_messages"])
+                dados, tempos = None, {}
+            else:
+                raise ValueError(f"Ação '{acao}' não suportada pelo agente simulado.")
+            await self.enviar({"id_tarefa": id_tarefa, "status": "sucesso", "dados": dados, "tempos": tempos})
+        except asyncio.CancelledError:
+            print(f"INFO: Tarefa '{id_tarefa}' cancelada pelo servidor.")
+        except Exception as e:
+            erro = {"id_tarefa": id_tarefa, "status": "erro", "mensagem": str(e)}
+            if acao == "query_stream":
+                # Com 'seq', o servidor trata o erro como parte do resultado em streaming
+                erro["seq"] = 0
+            await self.enviar(erro)
+
+    async def obter_sql(self, consulta: Dict[str, Any]) -> str:
+        if "sql" in consulta:
+            return consulta["sql"]
+        statement_id = consulta["statement_id"]
+        if statement_id not in self.statements:
+            pedido = self.pedidos_statement.get(statement_id)
+            if pedido is None:
+                pedido = self.pedidos_statement[statement_id] = asyncio.get_running_loop().create_future()
+                await self.enviar({"tipo": "obter_statement", "statement_id": statement_id})
+            sql = await asyncio.wait_for(pedido, timeout=10)
+            if not sql:
+                raise ValueError(f"Statement '{statement_id}' desconhecido pelo servidor.")
+            self.statements[statement_id] = sql
+        return self.statements[statement_id]
+
+    async def executar_sql(self, consulta: Dict[str, Any]):
+        sql = await self.obter_sql(consulta)
+        chegada = time.perf_counter()
+        async with self.banco.vagas:
+            inicio = time.perf_counter()
+            colunas, linhas = await asyncio.to_thread(self.banco.executar, sql, consulta.get("params") or [])
+            atraso = self.args.latencia_ms + random.uniform(-self.args.variacao_ms, self.args.variacao_ms)
+            atraso += len(linhas) / 1000 * self.args.ms_por_mil_linhas
+            await asyncio.sleep(max(0.0, atraso) / 1000)
+            fim = time.perf_counter()
+        tempos = {"fila_ms": round((inicio - chegada) * 1000, 1), "execucao_ms": round((fim - inicio) * 1000, 1)}
+        return colunas, linhas, tempos
+
+    def formatar(self, colunas: List[str], linhas: List[tuple]):
+        if "colunar" in self.formatos:
+            valores = [list(coluna) for coluna in zip(*linhas)] if linhas else [[] for _ in colunas]
+            tipos = [_tipo_coluna(coluna) for coluna in valores]
+            return {"formato": "colunar", "colunas": colunas, "tipos": tipos, "valores": valores}
+        return [dict(zip(colunas, linha)) for linha in linhas]
+
+    async def consultar(self, consulta: Dict[str, Any]):
+        colunas, linhas, tempos = await self.executar_sql(consulta)
+        return self.formatar(colunas, linhas), tempos
+
+    async def consultar_em_partes(self, id_tarefa: str, parametros: Dict[str, Any]):
+        colunas, linhas, tempos = await self.executar_sql(parametros)
+        por_parte = max(1, int(parametros.get("linhas_por_parte") or 500))
+        creditos = self.creditos[id_tarefa] = asyncio.Semaphore(int(parametros.get("janela") or 4))
+        try:
+            partes = [linhas[i:i + por_parte] for i in range(0, len(linhas), por_parte)] or [[]]
+            for seq, parte in enumerate(partes):
+                await creditos.acquire()
+                fim = seq == len(partes) - 1
+                mensagem = {"id_tarefa": id_tarefa, "seq": seq, "dados": self.formatar(colunas, parte), "fim": fim}
+                if fim:
+                    mensagem["tempos"] = tempos
+                await self.enviar(mensagem)
+        finally:
+            self.creditos.pop(id_tarefa, None)
+
+    def carregar_historico(self, usuario: str) -> Dict[str, list]:
+        linhas = self.banco._conexao().execute("SELECT DATA, MENSAGENS FROM LUCA_HISTORICO WHERE USUARIO = ?", (usuario,)).fetchall()
+        return {linha["DATA"]: json.loads(linha["MENSAGENS"]) for linha in linhas}
+
+    def salvar_historico(self, usuario: str, data: str, novas: List[Dict[str, Any]]):
+        conexao = self.banco._conexao()
+        with self.banco.escrita:
+            linha = conexao.execute("SELECT MENSAGENS FROM LUCA_HISTORICO WHERE USUARIO = ? AND DATA = ?", (usuario, data)).fetchone()
+            mensagens = (json.loads(linha["MENSAGENS"]) if linha else []) + list(novas)
+            conexao.execute("INSERT OR REPLACE INTO LUCA_HISTORICO VALUES (?, ?, ?)", (usuario, data, json.dumps(mensagens)))
+            conexao.commit()
+
+def preparar_banco(args: argparse.Namespace):
+    novo = not os.path.exists(args.banco)
+    conexao = conectar(args.banco)
+    criar_esquema(conexao)
+    if novo or conexao.execute("SELECT COUNT(*) FROM TVENPEDIDO").fetchone()[0] == 0:
+        print(f"INFO: Banco '{args.banco}' vazio; gerando dados de exemplo para a empresa '{args.id_empresa}'...")
+        popular_exemplo(conexao, args.id_empresa)
+    conexao.close()
+
+async def principal(args: argparse.Namespace):
+    preparar_banco(args)
+    banco = BancoSimulado(args.banco, args.conexoes)
+    await asyncio.gather(*(AgenteSimulado(args, empresa, banco).executar() for empresa in args.empresa))
+
+def ler_argumentos(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Agente simulado (SQLite) para testes de carga do Dashboard.")
+    parser.add_argument("--url", default="ws://localhost:8000", help="URL do servidor (ws:// ou wss://)")
+    parser.add_argument("--empresa", nargs="+", required=True, help="CNPJ(s) das empresas atendidas por este processo")
+    parser.add_argument("--banco", default="agente_simulado.db", help="Arquivo SQLite com as tabelas do ERP")
+    parser.add_argument("--id-empresa", default="1", help="Valor da coluna EMPRESA (idEmpresaDb no Firebase) para os dados de exemplo")
+    parser.add_argument("--conexoes", type=int, default=4, help="Consultas simultâneas no banco")
+    parser.add_argument("--latencia-ms", type=float, default=30.0, help="Latência base de cada consulta")
+    parser.add_argument("--variacao-ms", type=float, default=10.0, help="Variação aleatória da latência (+/-)")
+    parser.add_argument("--ms-por-mil-linhas", type=float, default=5.0, help="Custo extra por mil linhas do resultado")
+    parser.add_argument("--binario", action="store_true", help="Responder em msgpack (e zstd) quando o servidor aceitar")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(principal(ler_argumentos()))
+    except KeyboardInterrupt:
+        sys.exit(0)
\ No newline at end of file
@@ -0,0 +1,86 @@
+# tools/dialeto_firebird.py
+import re
+from functools import lru_cache
+from typing import Any, List
+
+# Tradução do SQL de Firebird que os routers (e a IA) mandam ao agente para o SQLite do agente
+# simulado. Cobre o que o projeto usa: FIRST/SKIP, EXTRACT, DATEADD, CAST ... DOUBLE PRECISION,
+# RDB$DATABASE/RDB$RELATIONS, UPDATE OR INSERT ... MATCHING e MERGE (upsert de uma linha).
+
+_EXTRACT = {
+    "YEAR": "%Y", "MONTH": "%m", "DAY": "%d", "HOUR": "%H", "MINUTE": "%M", "SECOND": "%S",
+    # WEEKDAY do Firebird: 0 = domingo, igual ao %w do SQLite
+    "WEEKDAY": "%w", "YEARDAY": "%j",
+}
+
+def _traduzir_first_skip(sql: str) -> str:
+    # 'SELECT FIRST n [SKIP m]' do SELECT mais externo vira 'LIMIT n OFFSET m' no fim do comando
+    padrao = re.compile(r"\bSELECT\s+FIRST\s+(\d+|\?)(?:\s+SKIP\s+(\d+|\?))?\s+", re.I)
+    encontrado = padrao.search(sql)
+    if not encontrado:
+        return sql
+    primeiro, pulo = encontrado.group(1), encontrado.group(2)
+    if "?" in (primeiro, pulo):
+        raise ValueError("FIRST/SKIP com parâmetro não é suportado pelo agente simulado.")
+    sql = sql[:encontrado.start()] + "SELECT " + sql[encontrado.end():]
+    sql = sql.rstrip().rstrip(";") + f" LIMIT {primeiro}" + (f" OFFSET {pulo}" if pulo else "")
+    return _traduzir_first_skip(sql) if padrao.search(sql) else sql
+
+def _traduzir_extract(encontrado: re.Match) -> str:
+    parte, expressao = encontrado.group(1).upper(), encontrado.group(2)
+    formato = _EXTRACT[parte]
+    if parte == "YEARDAY":
+        return f"(CAST(strftime('{formato}', {expressao}) AS INTEGER) - 1)"
+    return f"CAST(strftime('{formato}', {expressao}) AS INTEGER)"
+
+def _traduzir_dateadd(encontrado: re.Match) -> str:
+    quantidade, unidade, expressao = encontrado.group(1), encontrado.group(2).lower(), encontrado.group(3).strip()
+    return f"date({expressao}, '{int(quantidade):+d} {unidade}')"
+
+def _traduzir_update_or_insert(encontrado: re.Match) -> str:
+    tabela, colunas, valores, chaves = encontrado.groups()
+    lista_colunas = [coluna.strip() for coluna in colunas.split(",")]
+    lista_chaves = [chave.strip() for chave in chaves.split(",")]
+    atualizar = ", ".join(f"{c} = excluded.{c}" for c in lista_colunas if c not in lista_chaves)
+    return f"INSERT INTO {tabela} ({colunas}) VALUES ({valores}) ON CONFLICT ({chaves}) DO UPDATE SET {atualizar}"
+
+def _traduzir_merge(encontrado: re.Match) -> str:
+    # MERGE INTO T USING (SELECT <expr> AS C1, ... FROM RDB$DATABASE) AS S ON (T.K = S.K AND ...) ...
+    tabela, selecao, condicao = encontrado.group(1), encontrado.group(2), encontrado.group(3)
+    colunas = re.findall(r"\bAS\s+(\w+)\s*(?:,|$)", selecao.strip(), re.I)
+    expressoes = [e.strip() for e in re.split(r"\bAS\s+\w+\s*(?:,|$)", selecao.strip(), flags=re.I) if e.strip()]
+    chaves = re.findall(r"\w+\.(\w+)\s*=\s*\w+\.\1", condicao)
+    atualizar = ", ".join(f"{c} = excluded.{c}" for c in colunas if c not in chaves)
+    return (f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join(expressoes)}) "
+            f"ON CONFLICT ({', '.join(chaves)}) DO UPDATE SET {atualizar}")
+
+@lru_cache(maxsize=1024)
+def traduzir_sql(sql: str) -> str:
+    sql = " ".join(sql.split())
+    sql = re.sub(
+        r"MERGE INTO (\w+)(?: AS \w+)? USING \( ?SELECT (.*?) FROM RDB\$DATABASE ?\) AS \w+ ON \((.*?)\) WHEN MATCHED.*$",
+        _traduzir_merge, sql, flags=re.I
+    )
+    sql = re.sub(
+        r"UPDATE OR INSERT INTO (\w+) \((.*?)\) VALUES \((.*?)\) MATCHING \((.*?)\)",
+        _traduzir_update_or_insert, sql, flags=re.I
+    )
+    sql = re.sub(
+        r"SELECT 1 FROM RDB\$RELATIONS WHERE RDB\$RELATION_NAME = ('\w+')",
+        r"SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = \1", sql, flags=re.I
+    )
+    sql = re.sub(r"\s+FROM RDB\$DATABASE\b", "", sql, flags=re.I)
+    sql = re.sub(r"BLOB SUB_TYPE (?:TEXT|1)", "TEXT", sql, flags=re.I)
+    sql = re.sub(r"\bDOUBLE PRECISION\b", "REAL", sql, flags=re.I)
+    sql = re.sub(r"EXTRACT\(\s*(\w+)\s+FROM\s+([\w.]+)\s*\)", _traduzir_extract, sql, flags=re.I)
+    sql = re.sub(r"DATEADD\(\s*(-?\d+)\s+(DAY|MONTH|YEAR)\s+TO\s+([^)]+)\)", _traduzir_dateadd, sql, flags=re.I)
+    sql = re.sub(r"\bCURRENT_DATE\b", "date('now', 'localtime')", sql, flags=re.I)
+    sql = re.sub(r"\bCURRENT_TIMESTAMP\b", "datetime('now', 'localtime')", sql, flags=re.I)
+    sql = _traduzir_first_skip(sql)
+    return sql
+
+_DATA_HORA_ISO = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}")
+
+def adaptar_parametros(params: List[Any]) -> List[Any]:
+    """O servidor manda datetime como ISO com 'T'; no SQLite as datas/horas ficam com espaço."""
+    return [p.replace("T", " ", 1) if isinstance(p, str) and _DATA_HORA_ISO.match(p) else p for p in params or []]
\ No newline at end of file
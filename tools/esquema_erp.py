@@ -0,0 +1,173 @@
+# tools/esquema_erp.py
+import random
+import sqlite3
+from datetime import date, datetime, time, timedelta
+
+# Cópia em SQLite das tabelas do ERP (Firebird) que os routers consultam, com as colunas que
+# eles usam. Serve ao agente simulado (tools/agente_simulado.py) e ao gerador de dados.
+# Os tipos declarados DATE/TIME/TIMESTAMP fazem o sqlite3 devolver date/time/datetime.
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS TVENPEDIDO (
+    EMPRESA VARCHAR(11) NOT NULL,
+    CODIGO INTEGER NOT NULL,
+    DATAEFE DATE,
+    HORAEFE TIME,
+    STATUS VARCHAR(3),
+    TIPOVENDA VARCHAR(2),
+    GERAFINANCEIRO CHAR(1),
+    VENDEDOR INTEGER,
+    CLIENTE INTEGER,
+    CLIENTENOME VARCHAR(100),
+    VALORBRUTO NUMERIC(15, 2),
+    VALORDESCONTO NUMERIC(15, 2),
+    VALORLIQUIDO NUMERIC(15, 2),
+    PRIMARY KEY (EMPRESA, CODIGO)
+);
+CREATE INDEX IF NOT EXISTS IDX_TVENPEDIDO_DATAEFE ON TVENPEDIDO (EMPRESA, DATAEFE);
+
+CREATE TABLE IF NOT EXISTS TVENPRODUTO (
+    EMPRESA VARCHAR(11) NOT NULL,
+    PEDIDO INTEGER NOT NULL,
+    ITEM INTEGER NOT NULL,
+    PRODUTO INTEGER NOT NULL,
+    QTDE NUMERIC(15, 3),
+    QTDEDEVOLVIDA NUMERIC(15, 3) DEFAULT 0,
+    PRVENDIDO NUMERIC(15, 2),
+    VLRDESC NUMERIC(15, 2),
+    VLRLIQUIDO NUMERIC(15, 2),
+    CUSTOFINAL NUMERIC(15, 4),
+    PRIMARY KEY (EMPRESA, PEDIDO, ITEM)
+);
+CREATE INDEX IF NOT EXISTS IDX_TVENPRODUTO_PRODUTO ON TVENPRODUTO (EMPRESA, PRODUTO);
+
+CREATE TABLE IF NOT EXISTS TVENREGISTROFORMA (
+    EMPRESA VARCHAR(11) NOT NULL,
+    IDENTIFICADOR INTEGER NOT NULL,
+    TIPOREGISTRO SMALLINT,
+    TIPOVALOR SMALLINT,
+    VALOR NUMERIC(15, 2)
+);
+CREATE INDEX IF NOT EXISTS IDX_TVENREGISTROFORMA_PEDIDO ON TVENREGISTROFORMA (IDENTIFICADOR);
+
+CREATE TABLE IF NOT EXISTS TVENVENDEDOR (
+    EMPRESA VARCHAR(11) NOT NULL,
+    CODIGO INTEGER NOT NULL,
+    NOME VARCHAR(60),
+    ATIVO CHAR(1),
+    PRIMARY KEY (EMPRESA, CODIGO)
+);
+
+CREATE TABLE IF NOT EXISTS TESTGRUPO (
+    EMPRESA VARCHAR(11),
+    CODIGO INTEGER PRIMARY KEY,
+    DESCRICAO VARCHAR(60),
+    TIPO CHAR(1)
+);
+
+CREATE TABLE IF NOT EXISTS TESTPRODUTOGERAL (
+    CODIGO INTEGER PRIMARY KEY,
+    DESCRICAO VARCHAR(100),
+    DESCRICAOREDUZIDA VARCHAR(40),
+    CODIGOBARRA VARCHAR(20),
+    EMBALAGEM VARCHAR(3)
+);
+
+CREATE TABLE IF NOT EXISTS TESTPRODUTO (
+    EMPRESA VARCHAR(11) NOT NULL,
+    PRODUTO INTEGER NOT NULL,
+    GRUPO INTEGER,
+    ATIVO CHAR(1),
+    CUSTOFINAL NUMERIC(15, 4),
+    PRPRATICADO NUMERIC(15, 2),
+    ESTDISPONIVEL NUMERIC(15, 3),
+    ESTOQUEMINIMO NUMERIC(15, 3),
+    PRIMARY KEY (EMPRESA, PRODUTO)
+);
+
+CREATE TABLE IF NOT EXISTS TESTEXTRATO (
+    EMPRESA VARCHAR(11) NOT NULL,
+    CODIGO INTEGER NOT NULL,
+    PRODUTO INTEGER NOT NULL,
+    DATAHORA TIMESTAMP,
+    QTDE NUMERIC(15, 3),
+    VALOR NUMERIC(15, 2),
+    ENTRADASAIDA CHAR(1),
+    CODIGOID INTEGER,
+    PRIMARY KEY (EMPRESA, CODIGO)
+);
+CREATE INDEX IF NOT EXISTS IDX_TESTEXTRATO_PRODUTO ON TESTEXTRATO (EMPRESA, PRODUTO, DATAHORA);
+CREATE INDEX IF NOT EXISTS IDX_TESTEXTRATO_DATAHORA ON TESTEXTRATO (EMPRESA, DATAHORA);
+
+-- Histórico do Luca: no agente real fica em arquivos no computador da loja
+CREATE TABLE IF NOT EXISTS LUCA_HISTORICO (
+    USUARIO VARCHAR(128) NOT NULL,
+    DATA VARCHAR(10) NOT NULL,
+    MENSAGENS TEXT NOT NULL,
+    PRIMARY KEY (USUARIO, DATA)
+);
+"""
+
+def conectar(caminho: str) -> sqlite3.Connection:
+    conexao = sqlite3.connect(caminho, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+    conexao.row_factory = sqlite3.Row
+    conexao.execute("PRAGMA journal_mode = WAL")
+    conexao.execute("PRAGMA synchronous = OFF")
+    return conexao
+
+def criar_esquema(conexao: sqlite3.Connection):
+    conexao.executescript(ESQUEMA)
+    conexao.commit()
+
+# Conversores dos tipos declarados (os padrões do sqlite3 estão obsoletos e não tratam TIME)
+sqlite3.register_converter("DATE", lambda valor: date.fromisoformat(valor.decode()))
+sqlite3.register_converter("TIME", lambda valor: time.fromisoformat(valor.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda valor: datetime.fromisoformat(valor.decode()))
+sqlite3.register_adapter(date, lambda valor: valor.isoformat())
+sqlite3.register_adapter(datetime, lambda valor: valor.isoformat(" "))
+
+def popular_exemplo(conexao: sqlite3.Connection, empresa: str, dias: int = 120, pedidos_por_dia: int = 40, semente: int = 42):
+    """Base pequena e determinística para subir o agente simulado sem o gerador de dados."""
+    aleatorio = random.Random(semente)
+    grupos = ["BEBIDAS", "MERCEARIA", "LIMPEZA", "HIGIENE", "HORTIFRUTI"]
+    conexao.executemany("INSERT OR IGNORE INTO TESTGRUPO VALUES (?, ?, ?, 'R')", [(empresa, i + 1, g) for i, g in enumerate(grupos)])
+    conexao.executemany("INSERT OR IGNORE INTO TVENVENDEDOR VALUES (?, ?, ?, 'S')",
+                        [(empresa, i + 1, nome) for i, nome in enumerate(["ANA", "BRUNO", "CARLA", "DIEGO"])])
+
+    produtos = []
+    for codigo in range(1, 201):
+        custo = round(aleatorio.uniform(2, 80), 2)
+        preco = round(custo * aleatorio.uniform(1.2, 1.9), 2)
+        produtos.append((codigo, custo, preco))
+        conexao.execute("INSERT OR IGNORE INTO TESTPRODUTOGERAL VALUES (?, ?, ?, NULL, 'UN')",
+                        (codigo, f"PRODUTO {codigo:04d}", f"PROD {codigo:04d}"))
+        conexao.execute("INSERT OR IGNORE INTO TESTPRODUTO VALUES (?, ?, ?, 'S', ?, ?, ?, ?)",
+                        (empresa, codigo, aleatorio.randint(1, len(grupos)), custo, preco,
+                         aleatorio.randint(0, 300), aleatorio.choice([0, 10, 20])))
+
+    pedido = extrato = 0
+    hoje = date.today()
+    for dia in range(dias, -1, -1):
+        data = hoje - timedelta(days=dia)
+        for _ in range(pedidos_por_dia):
+            pedido += 1
+            tipo = "DV" if aleatorio.random() < 0.03 else "NM"
+            hora = f"{aleatorio.randint(8, 19):02d}:{aleatorio.randint(0, 59):02d}:00"
+            total = 0.0
+            for item in range(1, aleatorio.randint(1, 5) + 1):
+                codigo, custo, preco = aleatorio.choice(produtos)
+                qtde = aleatorio.randint(1, 4)
+                total += qtde * preco
+                conexao.execute("INSERT INTO TVENPRODUTO VALUES (?, ?, ?, ?, ?, 0, ?, 0, ?, ?)",
+                                (empresa, pedido, item, codigo, qtde, preco, round(qtde * preco, 2), custo))
+                extrato += 1
+                conexao.execute("INSERT INTO TESTEXTRATO VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                (empresa, extrato, codigo, f"{data.isoformat()} {hora}", qtde, round(qtde * custo, 2),
+                                 "E" if tipo == "DV" else "S", pedido))
+            total = round(total, 2)
+            conexao.execute("INSERT INTO TVENPEDIDO VALUES (?, ?, ?, ?, 'EFE', ?, 'S', ?, NULL, ?, ?, 0, ?)",
+                            (empresa, pedido, data.isoformat(), hora, tipo, aleatorio.randint(1, 4),
+                             aleatorio.choice(["", "MARIA SILVA", "JOAO SOUZA", "CONSUMIDOR"]), total, total))
+            conexao.execute("INSERT INTO TVENREGISTROFORMA VALUES (?, ?, 1, ?, ?)",
+                            (empresa, pedido, aleatorio.choice([1, 4, 5, 15]), total))
+    conexao.commit()
\ No newline at end of file
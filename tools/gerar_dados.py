@@ -0,0 +1,348 @@
+# tools/gerar_dados.py
+"""
+Gerador de dados sintéticos do ERP para benchmarks: pedidos (TVENPEDIDO), itens (TVENPRODUTO),
+formas de pagamento (TVENREGISTROFORMA, TIPOVALOR 1/4/5/15), movimentações de estoque
+(TESTEXTRATO), produtos, grupos e vendedores, com sazonalidade (mês, dia da semana e hora),
+crescimento ano a ano, curva ABC de produtos, descontos, devoluções (TIPOVENDA = 'DV'),
+pedidos cancelados e reposição de estoque.
+
+É determinístico: a mesma semente, o mesmo preset e a mesma data final (--ate) geram
+exatamente os mesmos dados. Grava no SQLite do agente simulado (esquema_erp.py) ou em CSV
+(um arquivo por tabela, com cabeçalho).
+
+Uso:
+    python tools/gerar_dados.py --preset loja --saida loja.db
+    python tools/gerar_dados.py --preset rede --formato csv --saida dados_rede/ --ate 2025-12-31
+    python tools/agente_simulado.py --empresa 12345678000199 --banco loja.db
+"""
+import argparse
+import csv
+import itertools
+import math
+import os
+import random
+import time
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from esquema_erp import conectar, criar_esquema
+
+# Tamanhos prontos. 'pedidos_dia' é a média de um dia comum para uma loja de porte 1.0.
+PRESETS = {
+    "mini": {"empresas": 1, "dias": 30, "pedidos_dia": 40, "produtos": 300, "vendedores": 4},
+    # Loja pequena: ~55 mil pedidos e ~170 mil itens
+    "loja": {"empresas": 1, "dias": 365, "pedidos_dia": 150, "produtos": 2_000, "vendedores": 6},
+    # Rede: 10 lojas de portes diferentes, ~3,5 milhões de pedidos e ~11 milhões de itens
+    "rede": {"empresas": 10, "dias": 730, "pedidos_dia": 550, "produtos": 15_000, "vendedores": 20},
+    # Vários anos de uma loja grande: ~2,8 milhões de pedidos e ~8,5 milhões de itens
+    "plurianual": {"empresas": 1, "dias": 5 * 365, "pedidos_dia": 1_300, "produtos": 8_000, "vendedores": 25},
+}
+
+# Multiplicadores de movimento (varejo brasileiro: Black Friday, Natal, Dia das Mães; janeiro e fevereiro fracos)
+SAZONALIDADE_MES = {1: 0.82, 2: 0.85, 3: 0.95, 4: 0.97, 5: 1.10, 6: 1.00, 7: 0.98, 8: 1.02, 9: 0.97, 10: 1.03, 11: 1.18, 12: 1.45}
+# date.weekday(): 0 = segunda ... 6 = domingo
+SAZONALIDADE_SEMANA = (0.85, 0.90, 0.95, 1.00, 1.15, 1.30, 0.55)
+# Distribuição das vendas ao longo do dia (pico no almoço e no fim da tarde)
+PESOS_HORA = {8: 2, 9: 4, 10: 7, 11: 10, 12: 11, 13: 8, 14: 7, 15: 7, 16: 8, 17: 10, 18: 11, 19: 8, 20: 4, 21: 2}
+CRESCIMENTO_ANUAL = 0.08
+
+# Formas de pagamento (TIPOVALOR) e participação: dinheiro, crédito, crediário, débito
+FORMAS_PAGAMENTO = (1, 4, 5, 15)
+PESOS_FORMAS = (0.25, 0.35, 0.10, 0.30)
+
+TAXA_DEVOLUCAO = 0.025
+TAXA_CANCELAMENTO = 0.01
+TAXA_SEM_FINANCEIRO = 0.02
+
+GRUPOS = [
+    "BEBIDAS", "MERCEARIA", "LIMPEZA", "HIGIENE", "HORTIFRUTI", "PADARIA", "FRIOS", "CONGELADOS",
+    "PET", "BAZAR", "PAPELARIA", "UTILIDADES", "ELETRONICOS", "FERRAMENTAS", "BRINQUEDOS",
+]
+NOMES = ["ANA", "BRUNO", "CARLA", "DIEGO", "EDUARDA", "FABIO", "GABRIELA", "HUGO", "ISABELA", "JOAO",
+         "KARINA", "LUCAS", "MARIA", "NICOLAS", "OLIVIA", "PEDRO", "RAFAELA", "SERGIO", "TATIANA", "VITOR"]
+SOBRENOMES = ["SILVA", "SOUZA", "OLIVEIRA", "SANTOS", "LIMA", "PEREIRA", "COSTA", "ALMEIDA", "FERREIRA", "RODRIGUES"]
+
+COLUNAS = {
+    "TVENPEDIDO": ("EMPRESA", "CODIGO", "DATAEFE", "HORAEFE", "STATUS", "TIPOVENDA", "GERAFINANCEIRO", "VENDEDOR",
+                   "CLIENTE", "CLIENTENOME", "VALORBRUTO", "VALORDESCONTO", "VALORLIQUIDO"),
+    "TVENPRODUTO": ("EMPRESA", "PEDIDO", "ITEM", "PRODUTO", "QTDE", "QTDEDEVOLVIDA", "PRVENDIDO", "VLRDESC", "VLRLIQUIDO", "CUSTOFINAL"),
+    "TVENREGISTROFORMA": ("EMPRESA", "IDENTIFICADOR", "TIPOREGISTRO", "TIPOVALOR", "VALOR"),
+    "TVENVENDEDOR": ("EMPRESA", "CODIGO", "NOME", "ATIVO"),
+    "TESTGRUPO": ("EMPRESA", "CODIGO", "DESCRICAO", "TIPO"),
+    "TESTPRODUTOGERAL": ("CODIGO", "DESCRICAO", "DESCRICAOREDUZIDA", "CODIGOBARRA", "EMBALAGEM"),
+    "TESTPRODUTO": ("EMPRESA", "PRODUTO", "GRUPO", "ATIVO", "CUSTOFINAL", "PRPRATICADO", "ESTDISPONIVEL", "ESTOQUEMINIMO"),
+    "TESTEXTRATO": ("EMPRESA", "CODIGO", "PRODUTO", "DATAHORA", "QTDE", "VALOR", "ENTRADASAIDA", "CODIGOID"),
+}
+
+# --- DESTINOS ---
+
+class DestinoSQLite:
+    def __init__(self, caminho: str):
+        self.conexao = conectar(caminho)
+        # Carga em massa: sem journal, o arquivo só precisa estar consistente no fim
+        self.conexao.execute("PRAGMA journal_mode = OFF")
+        criar_esquema(self.conexao)
+
+    def gravar(self, tabela: str, linhas: Sequence[tuple]):
+        marcadores = ", ".join("?" * len(COLUNAS[tabela]))
+        self.conexao.executemany(f"INSERT INTO {tabela} ({', '.join(COLUNAS[tabela])}) VALUES ({marcadores})", linhas)
+
+    def confirmar(self):
+        self.conexao.commit()
+
+    def fechar(self):
+        self.conexao.commit()
+        self.conexao.execute("ANALYZE")
+        self.conexao.execute("PRAGMA journal_mode = WAL")
+        self.conexao.close()
+
+class DestinoCSV:
+    def __init__(self, diretorio: str):
+        os.makedirs(diretorio, exist_ok=True)
+        self.arquivos = {}
+        self.escritores = {}
+        for tabela, colunas in COLUNAS.items():
+            arquivo = self.arquivos[tabela] = open(os.path.join(diretorio, f"{tabela}.csv"), "w", newline="", encoding="utf-8")
+            self.escritores[tabela] = csv.writer(arquivo)
+            self.escritores[tabela].writerow(colunas)
+
+    def gravar(self, tabela: str, linhas: Sequence[tuple]):
+        self.escritores[tabela].writerows(("" if v is None else v for v in linha) for linha in linhas)
+
+    def confirmar(self):
+        pass
+
+    def fechar(self):
+        for arquivo in self.arquivos.values():
+            arquivo.close()
+
+# --- GERAÇÃO ---
+
+def _pesos_acumulados(pesos: Iterable[float]) -> List[float]:
+    return list(itertools.accumulate(pesos))
+
+class Loja:
+    """Estado de uma empresa durante a geração: catálogo, preços, estoque e vendedores."""
+
+    def __init__(self, empresa: str, porte: float, produtos: List[int], args: argparse.Namespace, semente: str):
+        self.empresa = empresa
+        self.porte = porte
+        self.aleatorio = random.Random(semente)
+        aleatorio = self.aleatorio
+        self.produtos = produtos
+        self.custo: Dict[int, float] = {}
+        self.preco: Dict[int, float] = {}
+        self.estoque: Dict[int, float] = {}
+        self.minimo: Dict[int, float] = {}
+        self.ativo: Dict[int, str] = {}
+        # Popularidade em lei de potência (Zipf): poucos produtos concentram as vendas (curva ABC)
+        ordem = produtos[:]
+        aleatorio.shuffle(ordem)
+        self.ordem_popularidade = ordem
+        self.pesos_produtos = _pesos_acumulados(1 / (posicao + 1) ** 1.05 for posicao in range(len(ordem)))
+        venda_media_dia = args.pedidos_dia * porte * 2.9 / self.pesos_produtos[-1]
+        for posicao, produto in enumerate(ordem):
+            custo = round(math.exp(aleatorio.gauss(2.6, 0.9)) + 0.5, 2)
+            self.custo[produto] = custo
+            self.preco[produto] = round(custo * aleatorio.uniform(1.25, 2.1), 2)
+            giro_dia = venda_media_dia / (posicao + 1) ** 1.05
+            self.minimo[produto] = float(max(0, round(giro_dia * aleatorio.choice([3, 5, 7])))) if aleatorio.random() < 0.7 else 0.0
+            self.estoque[produto] = float(round(giro_dia * aleatorio.uniform(10, 30)) + aleatorio.randint(0, 20))
+            self.ativo[produto] = "N" if aleatorio.random() < 0.05 else "S"
+        self.vendedores = list(range(1, args.vendedores + 1))
+        self.pesos_vendedores = _pesos_acumulados(aleatorio.uniform(0.5, 1.5) for _ in self.vendedores)
+        self.clientes = [
+            (codigo, f"{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)} {aleatorio.choice(SOBRENOMES)}")
+            for codigo in range(1, max(50, args.pedidos_dia * 4) + 1)
+        ]
+        self.estoque_inicial = dict(self.estoque)
+        # Produtos que saíram no dia: só eles podem ter caído abaixo do ponto de reposição
+        self.movimentados: set = set()
+        self.vendidos_recentes: List[tuple] = []
+
+    def sortear_produtos(self, quantidade: int) -> List[int]:
+        return self.aleatorio.choices(self.ordem_popularidade, cum_weights=self.pesos_produtos, k=quantidade)
+
+    def sortear_vendedor(self) -> int:
+        return self.aleatorio.choices(self.vendedores, cum_weights=self.pesos_vendedores)[0]
+
+class Gerador:
+    def __init__(self, args: argparse.Namespace, destino):
+        self.args = args
+        self.destino = destino
+        self.proximo_pedido = itertools.count(1)
+        self.proximo_extrato = itertools.count(1)
+        self.pesos_horas = _pesos_acumulados(PESOS_HORA.values())
+        self.horas = list(PESOS_HORA)
+
+    def gerar(self):
+        args = self.args
+        aleatorio = random.Random(f"{args.semente}:catalogo")
+        fim = args.ate
+        inicio = fim - timedelta(days=args.dias - 1)
+        print(f"INFO: Gerando {args.empresas} empresa(s) de {inicio} a {fim} (semente {args.semente})...")
+
+        grupos = [(None, codigo, nome, "R") for codigo, nome in enumerate(GRUPOS, start=1)]
+        produtos = list(range(1, args.produtos + 1))
+        catalogo = []
+        grupo_do_produto = {}
+        for produto in produtos:
+            grupo = grupo_do_produto[produto] = aleatorio.randint(1, len(GRUPOS))
+            descricao = f"{GRUPOS[grupo - 1]} ITEM {produto:05d}"
+            catalogo.append((produto, descricao, descricao[:40], f"789{aleatorio.randint(0, 10**10 - 1):010d}", aleatorio.choice(["UN", "UN", "UN", "KG", "CX"])))
+        self.destino.gravar("TESTGRUPO", grupos)
+        self.destino.gravar("TESTPRODUTOGERAL", catalogo)
+
+        # O ID da empresa no ERP (idEmpresaDb no Firebase) é 1, 2, 3... a partir de --id-empresa-inicial
+        lojas = []
+        for indice in range(args.empresas):
+            empresa = str(args.id_empresa_inicial + indice)
+            porte = 1.0 if args.empresas == 1 else round(aleatorio.uniform(0.4, 1.6), 2)
+            lojas.append(Loja(empresa, porte, produtos, args, f"{args.semente}:{empresa}"))
+            self.destino.gravar("TVENVENDEDOR", [
+                (empresa, codigo, f"{NOMES[(codigo - 1) % len(NOMES)]} {codigo:02d}", "S" if codigo <= args.vendedores * 0.9 else "N")
+                for codigo in range(1, args.vendedores + 1)
+            ])
+
+        inicio_relogio = time.monotonic()
+        totais = {"pedidos": 0, "itens": 0}
+        dia = inicio
+        while dia <= fim:
+            for loja in lojas:
+                pedidos, itens = self.gerar_dia(loja, dia, inicio)
+                totais["pedidos"] += pedidos
+                totais["itens"] += itens
+            self.destino.confirmar()
+            if dia.day == 1 or dia == fim:
+                print(f"INFO: {dia:%Y-%m} | {totais['pedidos']:,} pedidos | {totais['itens']:,} itens | {time.monotonic() - inicio_relogio:.0f}s")
+            dia += timedelta(days=1)
+
+        for loja in lojas:
+            self.destino.gravar("TESTPRODUTO", [
+                (loja.empresa, produto, grupo_do_produto[produto], loja.ativo[produto], loja.custo[produto],
+                 loja.preco[produto], round(loja.estoque[produto], 3), loja.minimo[produto])
+                for produto in produtos
+            ])
+        self.destino.fechar()
+        print(f"INFO: Concluído: {totais['pedidos']:,} pedidos e {totais['itens']:,} itens em {time.monotonic() - inicio_relogio:.0f}s.")
+
+    def gerar_dia(self, loja: Loja, dia: date, inicio: date):
+        aleatorio = loja.aleatorio
+        anos = (dia - inicio).days / 365
+        media = (self.args.pedidos_dia * loja.porte * SAZONALIDADE_MES[dia.month] * SAZONALIDADE_SEMANA[dia.weekday()]
+                 * (1 + CRESCIMENTO_ANUAL) ** anos)
+        total_pedidos = max(0, round(aleatorio.gauss(media, math.sqrt(media))))
+
+        pedidos, itens, formas, extrato = [], [], [], []
+        horarios = sorted(
+            (aleatorio.choices(self.horas, cum_weights=self.pesos_horas)[0], aleatorio.randint(0, 59), aleatorio.randint(0, 59))
+            for _ in range(total_pedidos)
+        )
+        for hora, minuto, segundo in horarios:
+            codigo = next(self.proximo_pedido)
+            horario = f"{hora:02d}:{minuto:02d}:{segundo:02d}"
+            devolucao = bool(loja.vendidos_recentes) and aleatorio.random() < TAXA_DEVOLUCAO
+            status = "CAN" if aleatorio.random() < TAXA_CANCELAMENTO else "EFE"
+            gera_financeiro = "N" if aleatorio.random() < TAXA_SEM_FINANCEIRO else "S"
+
+            if devolucao:
+                # Devolução de um item vendido nos últimos dias
+                produto, quantidade, preco = aleatorio.choice(loja.vendidos_recentes)
+                linhas = [(produto, quantidade, preco, 0.0)]
+            else:
+                quantidade_itens = min(30, 1 + int(aleatorio.expovariate(1 / 2.6)))
+                desconto_pedido = aleatorio.choice([0.05, 0.1]) if aleatorio.random() < 0.15 else 0.0
+                linhas = []
+                for produto in loja.sortear_produtos(quantidade_itens):
+                    quantidade = 1 + int(aleatorio.expovariate(1.2))
+                    preco = loja.preco[produto]
+                    linhas.append((produto, quantidade, preco, round(quantidade * preco * desconto_pedido, 2)))
+
+            bruto = desconto = 0.0
+            for item, (produto, quantidade, preco, valor_desconto) in enumerate(linhas, start=1):
+                valor_bruto = round(quantidade * preco, 2)
+                bruto += valor_bruto
+                desconto += valor_desconto
+                custo = loja.custo[produto]
+                itens.append((loja.empresa, codigo, item, produto, quantidade, 0, preco, valor_desconto,
+                              round(valor_bruto - valor_desconto, 2), custo))
+                if status == "EFE":
+                    loja.estoque[produto] += quantidade if devolucao else -quantidade
+                    loja.movimentados.add(produto)
+                    extrato.append((loja.empresa, next(self.proximo_extrato), produto, f"{dia.isoformat()} {horario}",
+                                    quantidade, round(quantidade * custo, 2), "E" if devolucao else "S", codigo))
+                    if not devolucao and aleatorio.random() < 0.05:
+                        loja.vendidos_recentes.append((produto, quantidade, preco))
+            liquido = round(bruto - desconto, 2)
+
+            forma = aleatorio.choices(FORMAS_PAGAMENTO, PESOS_FORMAS)[0]
+            # Crediário exige cliente identificado; nas outras formas a maioria é consumidor final
+            if forma == 5 or aleatorio.random() < 0.35:
+                cliente, nome_cliente = aleatorio.choice(loja.clientes)
+            else:
+                cliente, nome_cliente = None, aleatorio.choice(["", "CONSUMIDOR FINAL"])
+            pedidos.append((loja.empresa, codigo, dia.isoformat(), horario, status, "DV" if devolucao else "NM", gera_financeiro,
+                            loja.sortear_vendedor(), cliente, nome_cliente, round(bruto, 2), round(desconto, 2), liquido))
+            if not devolucao and liquido > 20 and aleatorio.random() < 0.1:
+                # Pagamento dividido em duas formas
+                parte = round(liquido * aleatorio.uniform(0.2, 0.8), 2)
+                outra = aleatorio.choice([f for f in FORMAS_PAGAMENTO if f != forma])
+                formas += [(loja.empresa, codigo, 1, forma, parte), (loja.empresa, codigo, 1, outra, round(liquido - parte, 2))]
+            else:
+                formas.append((loja.empresa, codigo, 1, forma, liquido))
+
+        if len(loja.vendidos_recentes) > 2_000:
+            del loja.vendidos_recentes[:-1_000]
+        extrato += self.repor_estoque(loja, dia)
+
+        self.destino.gravar("TVENPEDIDO", pedidos)
+        self.destino.gravar("TVENPRODUTO", itens)
+        self.destino.gravar("TVENREGISTROFORMA", formas)
+        self.destino.gravar("TESTEXTRATO", extrato)
+        return len(pedidos), len(itens)
+
+    def repor_estoque(self, loja: Loja, dia: date) -> List[tuple]:
+        """Compras do dia seguinte (07h) para os produtos que ficaram abaixo do ponto de reposição."""
+        aleatorio = loja.aleatorio
+        movimentados, loja.movimentados = loja.movimentados, set()
+        if dia + timedelta(days=1) > self.args.ate:
+            return []
+        chegada = f"{(dia + timedelta(days=1)).isoformat()} 07:{aleatorio.randint(0, 59):02d}:00"
+        entradas = []
+        for produto in sorted(movimentados):
+            ponto = max(loja.minimo[produto], 2.0)
+            if loja.estoque[produto] < ponto and loja.ativo[produto] == "S":
+                lote = float(max(6, round(loja.estoque_inicial[produto] * aleatorio.uniform(0.8, 1.5))))
+                loja.estoque[produto] += lote
+                entradas.append((loja.empresa, next(self.proximo_extrato), produto, chegada, lote,
+                                 round(lote * loja.custo[produto], 2), "E", None))
+        return entradas
+
+def ler_argumentos(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Gerador determinístico de dados do ERP para benchmarks.")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="loja", help="Tamanho da base")
+    parser.add_argument("--saida", required=True, help="Arquivo SQLite ou diretório dos CSV")
+    parser.add_argument("--formato", choices=["sqlite", "csv"], default="sqlite")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--ate", type=date.fromisoformat, default=date.today(), help="Último dia gerado (AAAA-MM-DD); fixe-o para bases reprodutíveis")
+    parser.add_argument("--id-empresa-inicial", type=int, default=1, help="Valor da coluna EMPRESA da primeira empresa")
+    for opcao in ("empresas", "dias", "pedidos-dia", "produtos", "vendedores"):
+        parser.add_argument(f"--{opcao}", type=int, help="Sobrescreve o valor do preset")
+    args = parser.parse_args(argv)
+    for chave, valor in PRESETS[args.preset].items():
+        if getattr(args, chave) is None:
+            setattr(args, chave, valor)
+    return args
+
+def principal():
+    args = ler_argumentos()
+    if args.formato == "sqlite":
+        if os.path.exists(args.saida):
+            raise SystemExit(f"ERRO: '{args.saida}' já existe; apague o arquivo ou escolha outra saída.")
+        destino = DestinoSQLite(args.saida)
+    else:
+        destino = DestinoCSV(args.saida)
+    Gerador(args, destino).gerar()
+
+if __name__ == "__main__":
+    principal()
\ No newline at end of file
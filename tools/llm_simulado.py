@@ -0,0 +1,163 @@
+# tools/llm_simulado.py
+"""
+Servidor simulado da API do Gemini (generateContent) para testes de carga do LUCA sem gastar
+cota nem depender da latência do Google.
+
+Responde POST /v1beta/models/{modelo}:generateContent e :streamGenerateContent?alt=sse no
+formato da API real. Para o prompt de geração de SQL devolve uma consulta Firebird válida para o
+agente simulado (agente_simulado.py); para os demais, um texto de resumo. A latência (até o
+primeiro trecho, no streaming) é --latencia-ms (+/- --variacao-ms) mais --ms-por-mil-caracteres
+do prompt; no streaming cada trecho seguinte leva --ms-por-trecho. --taxa-429 / --taxa-erro
+sorteiam respostas 429 (com Retry-After) e 503 para exercitar as retentativas da API.
+
+Uso (a partir da raiz do projeto):
+    python tools/llm_simulado.py --porta 8090 --latencia-ms 1500 --taxa-429 0.05
+    GEMINI_API_URL=http://localhost:8090 GEMINI_API_KEY=teste uvicorn main_api:app
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROTA = re.compile(r"^/v1beta/models/[^/:]+:(generateContent|streamGenerateContent)$")
+PALAVRAS_POR_TRECHO = 3
+MARCADOR_SQL = "consulta SQL Firebird"
+
+SQL_EXEMPLO = (
+    "SELECT FIRST 10 EXTRACT(DAY FROM DATAEFE) AS DIA, SUM(CAST(VALORLIQUIDO AS DOUBLE PRECISION)) AS FATURAMENTO "
+    "FROM TVENPEDIDO WHERE EMPRESA = '{id_empresa}' AND STATUS = 'EFE' AND TIPOVENDA = 'NM' "
+    "AND DATAEFE >= DATEADD(-30 DAY TO CURRENT_DATE) GROUP BY 1 ORDER BY 2 DESC"
+)
+
+RESUMO_EXEMPLO = (
+    "Analisei os dados e aqui está o resumo: o faturamento se concentrou nos dias de maior movimento, "
+    "com destaque para o fim de semana. Recomendo reforçar o estoque dos itens mais vendidos "
+    "e avaliar uma ação promocional nos dias mais fracos."
+)
+
+class Contagem:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.valores = {"ok": 0, "429": 0, "503": 0}
+
+    def inc(self, chave: str):
+        with self.lock:
+            self.valores[chave] += 1
+
+def criar_manipulador(args, contagem: Contagem):
+    class Manipulador(BaseHTTPRequestHandler):
+        # HTTP/1.1: mantém a conexão aberta (keep-alive), como a API real
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, formato, *valores):
+            if args.verboso:
+                super().log_message(formato, *valores)
+
+        def _responder(self, status: int, corpo: dict, cabecalhos: dict = None):
+            dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(dados)))
+            for nome, valor in (cabecalhos or {}).items():
+                self.send_header(nome, valor)
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def do_POST(self):
+            tamanho = int(self.headers.get("Content-Length") or 0)
+            corpo = self.rfile.read(tamanho)
+            rota = ROTA.match(self.path.split("?", 1)[0])
+            if not rota:
+                self._responder(404, {"error": {"code": 404, "message": "Rota não encontrada.", "status": "NOT_FOUND"}})
+                return
+            try:
+                prompt = "".join(parte.get("text", "") for conteudo in json.loads(corpo)["contents"] for parte in conteudo["parts"])
+            except (ValueError, KeyError, TypeError):
+                self._responder(400, {"error": {"code": 400, "message": "Payload inválido.", "status": "INVALID_ARGUMENT"}})
+                return
+
+            sorteio = random.random()
+            if sorteio < args.taxa_429:
+                contagem.inc("429")
+                self._responder(429, {"error": {"code": 429, "message": "Resource has been exhausted.", "status": "RESOURCE_EXHAUSTED"}},
+                                {"Retry-After": str(args.retry_after)})
+                return
+            if sorteio < args.taxa_429 + args.taxa_erro:
+                contagem.inc("503")
+                self._responder(503, {"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}})
+                return
+
+            latencia = args.latencia_ms + random.uniform(-args.variacao_ms, args.variacao_ms)
+            latencia += args.ms_por_mil_caracteres * len(prompt) / 1000
+            time.sleep(max(0.0, latencia) / 1000)
+
+            if MARCADOR_SQL in prompt:
+                texto = "```sql\n" + SQL_EXEMPLO.format(id_empresa=args.id_empresa) + "\n```"
+            else:
+                texto = RESUMO_EXEMPLO
+            contagem.inc("ok")
+            if rota.group(1) == "streamGenerateContent":
+                self._transmitir(texto)
+                return
+            self._responder(200, {
+                "candidates": [{"content": {"parts": [{"text": texto}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+                "usageMetadata": {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(texto) // 4},
+            })
+
+        def _transmitir(self, texto: str):
+            # SSE em chunked encoding: um evento 'data:' por trecho de algumas palavras
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            palavras = re.findall(r"\S+\s*", texto)
+            trechos = ["".join(palavras[i:i + PALAVRAS_POR_TRECHO]) for i in range(0, len(palavras), PALAVRAS_POR_TRECHO)]
+            for numero, trecho in enumerate(trechos):
+                if numero:
+                    time.sleep(args.ms_por_trecho / 1000)
+                candidato = {"content": {"parts": [{"text": trecho}], "role": "model"}, "index": 0}
+                if numero == len(trechos) - 1:
+                    candidato["finishReason"] = "STOP"
+                evento = f"data: {json.dumps({'candidates': [candidato]}, ensure_ascii=False)}\r\n\r\n".encode("utf-8")
+                self.wfile.write(f"{len(evento):X}\r\n".encode() + evento + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Manipulador
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor simulado da API do Gemini.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8090)
+    parser.add_argument("--latencia-ms", type=float, default=1500.0)
+    parser.add_argument("--variacao-ms", type=float, default=500.0)
+    parser.add_argument("--ms-por-mil-caracteres", type=float, default=20.0)
+    parser.add_argument("--ms-por-trecho", type=float, default=60.0, help="Intervalo entre os trechos no streaming.")
+    parser.add_argument("--taxa-429", type=float, default=0.0, help="Fração das chamadas respondidas com 429.")
+    parser.add_argument("--retry-after", type=int, default=1, help="Valor do cabeçalho Retry-After nas respostas 429.")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração das chamadas respondidas com 503.")
+    parser.add_argument("--id-empresa", default="1", help="ID_EMPRESA usado no SQL devolvido (o mesmo do agente simulado).")
+    parser.add_argument("--semente", type=int, default=None)
+    parser.add_argument("--verboso", action="store_true")
+    args = parser.parse_args()
+
+    if args.semente is not None:
+        random.seed(args.semente)
+    contagem = Contagem()
+    servidor = ThreadingHTTPServer((args.host, args.porta), criar_manipulador(args, contagem))
+    servidor.daemon_threads = True
+    print(f"INFO: Gemini simulado em http://{args.host}:{args.porta} (latência {args.latencia_ms:.0f}±{args.variacao_ms:.0f} ms, "
+          f"429 {args.taxa_429:.0%}, 503 {args.taxa_erro:.0%}).")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        print(f"INFO: Respostas enviadas: {contagem.valores}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,232 @@
+# tools/teste_carga.py
+"""
+Teste de carga de ponta a ponta: simula usuários navegando no dashboard (Geral, Vendas, Estoque)
+e telas de TV atualizando em intervalo fixo, com as mesmas requisições (e em paralelo, como o
+navegador) que static/js faz. No fim mostra, por rota e no total, p50/p95/p99, vazão e erros.
+
+Para não depender do computador da loja, suba o agente simulado (tools/agente_simulado.py)
+para as empresas dos usuários de teste antes de rodar.
+
+Autenticação: tokens do Firebase prontos (--token, repetível) ou usuários de teste num arquivo
+JSON ([{"email": ..., "senha": ..., "empresa": "<cnpj, opcional>"}]) autenticados pela API REST
+do Firebase Auth com FIREBASE_WEB_API_KEY.
+
+Uso:
+    python tools/teste_carga.py --url http://localhost:8000 --usuarios-arquivo usuarios.json \\
+        --usuarios 50 --telas-tv 20 --duracao 120
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Optional
+
+import httpx
+
+FIREBASE_LOGIN_URL = "https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword"
+
+def _paginas(hoje: date) -> Dict[str, List[str]]:
+    inicio_mes = hoje.replace(day=1).isoformat()
+    periodo = f"start_date={inicio_mes}&end_date={hoje.isoformat()}"
+    return {
+        "geral": [
+            "/dashboard/kpis", "/dashboard/monthly-performance", "/dashboard/metas-progress",
+            "/alerts/proactive", "/dashboard/top-vendors-month",
+        ],
+        "vendas": [
+            f"/vendas/summary?{periodo}", "/dashboard/daily-sales?days=7", f"/vendas/sales-margin-evolution?{periodo}",
+            f"/vendas/ranking-vendedores?{periodo}", f"/vendas/annual-summary?year1={hoje.year}&year2={hoje.year - 1}",
+        ],
+        "estoque": [
+            f"/estoque/kpis?end_date={hoje.isoformat()}", "/estoque/top-products-by-value", "/estoque/abc-analysis",
+            "/estoque/low-stock-products", "/estoque/idle-products?days=90",
+        ],
+        "insight": ["/alerts/daily-insight"],
+    }
+
+# Peso de cada página na navegação dos usuários (o insight diário é aberto bem menos)
+PESOS_PAGINAS = {"geral": 5, "vendas": 3, "estoque": 2, "insight": 0.5}
+
+def _tela_tv(hoje: date) -> List[str]:
+    return [
+        "/dashboard/kpis", "/dashboard/monthly-performance", "/dashboard/top-vendors-month",
+        f"/estoque/kpis?end_date={hoje.isoformat()}", "/dashboard/metas-progress",
+    ]
+
+def _rota(url: str) -> str:
+    return url.split("?", 1)[0]
+
+def percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados))) - 1))]
+
+class Resultados:
+    def __init__(self):
+        self.latencias: Dict[str, List[float]] = defaultdict(list)
+        self.erros: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def registrar(self, nome: str, segundos: float, erro: Optional[str] = None):
+        self.latencias[nome].append(segundos)
+        if erro:
+            self.erros[nome][erro] += 1
+
+    def resumo(self, duracao: float) -> Dict[str, Dict]:
+        def linha(valores: List[float], erros: int) -> Dict:
+            return {
+                "requisicoes": len(valores),
+                "por_segundo": round(len(valores) / duracao, 2) if duracao else 0.0,
+                "erros": erros,
+                "p50_ms": round(percentil(valores, 50) * 1000, 1),
+                "p95_ms": round(percentil(valores, 95) * 1000, 1),
+                "p99_ms": round(percentil(valores, 99) * 1000, 1),
+                "max_ms": round(max(valores, default=0) * 1000, 1),
+            }
+        resumo = {nome: linha(valores, sum(self.erros[nome].values())) for nome, valores in sorted(self.latencias.items())}
+        rotas = [nome for nome in self.latencias if nome.startswith("/")]
+        resumo["TOTAL"] = linha(
+            [v for nome in rotas for v in self.latencias[nome]],
+            sum(sum(self.erros[nome].values()) for nome in rotas),
+        )
+        return resumo
+
+class Sessao:
+    """Um usuário autenticado (token renovado pela API do Firebase quando tiver e-mail e senha)."""
+
+    def __init__(self, token: Optional[str] = None, email: Optional[str] = None, senha: Optional[str] = None, empresa: Optional[str] = None):
+        self.token, self.email, self.senha, self.empresa = token, email, senha, empresa
+        self.expira_em = float("inf") if token else 0.0
+        # As requisições de uma página saem juntas: só uma delas faz o login
+        self.login = asyncio.Lock()
+
+    async def cabecalhos(self, cliente: httpx.AsyncClient, chave_api: Optional[str]) -> Dict[str, str]:
+        async with self.login:
+            if time.time() > self.expira_em:
+                resposta = await cliente.post(
+                    FIREBASE_LOGIN_URL, params={"key": chave_api},
+                    json={"email": self.email, "password": self.senha, "returnSecureToken": True},
+                )
+                resposta.raise_for_status()
+                dados = resposta.json()
+                self.token = dados["idToken"]
+                self.expira_em = time.time() + int(dados.get("expiresIn", 3600)) - 300
+        cabecalhos = {"Authorization": f"Bearer {self.token}"}
+        if self.empresa:
+            cabecalhos["X-Company-ID"] = self.empresa
+        return cabecalhos
+
+class TesteCarga:
+    def __init__(self, args: argparse.Namespace, sessoes: List[Sessao]):
+        self.args = args
+        self.sessoes = sessoes
+        self.resultados = Resultados()
+        self.fim = 0.0
+        self.cliente = httpx.AsyncClient(
+            base_url=args.url, timeout=args.timeout,
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=args.usuarios + args.telas_tv),
+        )
+
+    async def requisitar(self, sessao: Sessao, url: str, extras: Optional[Dict[str, str]] = None):
+        inicio = time.perf_counter()
+        erro = None
+        try:
+            cabecalhos = {**await sessao.cabecalhos(self.cliente, self.args.firebase_api_key), **(extras or {})}
+            resposta = await self.cliente.get(url, headers=cabecalhos)
+            await resposta.aread()
+            if resposta.status_code >= 400:
+                erro = str(resposta.status_code)
+        except httpx.HTTPError as e:
+            erro = type(e).__name__
+        self.resultados.registrar(_rota(url), time.perf_counter() - inicio, erro)
+
+    async def abrir_pagina(self, nome: str, sessao: Sessao, urls: List[str], extras: Optional[Dict[str, str]] = None):
+        # A página só fica pronta quando a última requisição termina: é o que o usuário percebe
+        inicio = time.perf_counter()
+        await asyncio.gather(*(self.requisitar(sessao, url, extras) for url in urls))
+        self.resultados.registrar(f"pagina:{nome}", time.perf_counter() - inicio)
+
+    async def usuario(self, sessao: Sessao):
+        paginas = _paginas(date.today())
+        nomes, pesos = list(PESOS_PAGINAS), list(PESOS_PAGINAS.values())
+        # Chegadas espalhadas no primeiro intervalo, para não começar com todos ao mesmo tempo
+        await asyncio.sleep(random.uniform(0, self.args.pensar))
+        while time.monotonic() < self.fim:
+            nome = random.choices(nomes, pesos)[0]
+            await self.abrir_pagina(nome, sessao, paginas[nome])
+            await asyncio.sleep(random.expovariate(1 / self.args.pensar))
+
+    async def tela_tv(self, sessao: Sessao):
+        urls = _tela_tv(date.today())
+        await asyncio.sleep(random.uniform(0, self.args.intervalo_tv))
+        while time.monotonic() < self.fim:
+            inicio = time.monotonic()
+            await self.abrir_pagina("tv", sessao, urls, {"X-Prioridade": "atualizacao"})
+            await asyncio.sleep(max(0.0, self.args.intervalo_tv - (time.monotonic() - inicio)))
+
+    async def executar(self) -> Dict[str, Dict]:
+        self.fim = time.monotonic() + self.args.duracao
+        inicio = time.monotonic()
+        tarefas = [self.usuario(self.sessoes[i % len(self.sessoes)]) for i in range(self.args.usuarios)]
+        tarefas += [self.tela_tv(self.sessoes[i % len(self.sessoes)]) for i in range(self.args.telas_tv)]
+        try:
+            await asyncio.gather(*tarefas)
+        finally:
+            await self.cliente.aclose()
+        return self.resultados.resumo(time.monotonic() - inicio)
+
+def imprimir(resumo: Dict[str, Dict]):
+    cabecalho = f"{'rota':<40} {'req':>7} {'req/s':>8} {'erros':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    print(cabecalho)
+    print("-" * len(cabecalho))
+    for nome, linha in resumo.items():
+        if nome == "TOTAL":
+            print("-" * len(cabecalho))
+        print(f"{nome:<40} {linha['requisicoes']:>7} {linha['por_segundo']:>8} {linha['erros']:>6} "
+              f"{linha['p50_ms']:>9} {linha['p95_ms']:>9} {linha['p99_ms']:>9} {linha['max_ms']:>9}")
+
+def carregar_sessoes(args: argparse.Namespace) -> List[Sessao]:
+    sessoes = [Sessao(token=token, empresa=args.empresa) for token in args.token or []]
+    if args.usuarios_arquivo:
+        if not args.firebase_api_key:
+            sys.exit("ERRO: Defina FIREBASE_WEB_API_KEY (ou --firebase-api-key) para autenticar os usuários de teste.")
+        with open(args.usuarios_arquivo, encoding="utf-8") as arquivo:
+            for usuario in json.load(arquivo):
+                sessoes.append(Sessao(email=usuario["email"], senha=usuario["senha"], empresa=usuario.get("empresa") or args.empresa))
+    if not sessoes:
+        sys.exit("ERRO: Informe ao menos um --token ou um --usuarios-arquivo.")
+    return sessoes
+
+def ler_argumentos(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Teste de carga do Dashboard (usuários e telas de TV simulados).")
+    parser.add_argument("--url", default="http://localhost:8000", help="URL base da API")
+    parser.add_argument("--token", action="append", help="ID token do Firebase (repetível)")
+    parser.add_argument("--usuarios-arquivo", help="JSON com os usuários de teste (email, senha, empresa)")
+    parser.add_argument("--firebase-api-key", default=os.environ.get("FIREBASE_WEB_API_KEY"), help="Chave de API web do projeto Firebase")
+    parser.add_argument("--empresa", help="CNPJ enviado em X-Company-ID (obrigatório para administradores de suporte)")
+    parser.add_argument("--usuarios", type=int, default=10, help="Usuários navegando no dashboard ao mesmo tempo")
+    parser.add_argument("--telas-tv", type=int, default=5, help="Telas de TV ligadas")
+    parser.add_argument("--intervalo-tv", type=float, default=60.0, help="Intervalo de atualização das telas de TV (s)")
+    parser.add_argument("--pensar", type=float, default=5.0, help="Tempo médio entre uma página e outra (s)")
+    parser.add_argument("--duracao", type=float, default=60.0, help="Duração do teste (s)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Timeout de cada requisição (s)")
+    parser.add_argument("--saida", help="Grava o resumo em JSON neste arquivo")
+    return parser.parse_args(argv)
+
+def principal():
+    args = ler_argumentos()
+    teste = TesteCarga(args, carregar_sessoes(args))
+    print(f"INFO: {args.usuarios} usuário(s) e {args.telas_tv} tela(s) de TV contra {args.url} por {args.duracao:.0f}s...")
+    resumo = asyncio.run(teste.executar())
+    imprimir(resumo)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(resumo, arquivo, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    principal()
\ No newline at end of file